@@ -1,7 +1,10 @@
+import os
 from app import create_app, db
 from app.models import User, Subject, Topic, StudySession, ExamMode
 
-app = create_app()
+# API_ONLY=1 serves just /api (slimmer, faster-starting workers)
+app = create_app(os.environ.get('FLASK_CONFIG', 'default'),
+                 api_only=os.environ.get('API_ONLY', 'false').lower() in ['true', 'on', '1'])
 
 @app.shell_context_processor
 def make_shell_context():
@@ -1,17 +1,22 @@
+import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-from flask_migrate import Migrate
 from config import config
 from sqlalchemy import event
-from sqlalchemy.engine import Engine
 from flask_cors import CORS
 
 db = SQLAlchemy()
 login_manager = LoginManager()
-migrate = Migrate()
 
-def create_app(config_name='default'):
+def create_app(config_name='default', api_only=False):
+    """Build the application.
+
+    With `api_only` only the JSON API is registered: no auth or page
+    blueprints, and none of WTForms or email-validator gets imported.
+    Flask-Migrate (and alembic with it) is only loaded when the app is
+    started by the `flask` command, which is the only place `flask db` runs.
+    """
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     CORS(app, resources={r"/api/*": {"origins": "*"}})
@@ -19,10 +24,11 @@ def create_app(config_name='default'):
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
-    migrate.init_app(app, db)
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        from flask_migrate import Migrate
+        Migrate(app, db)
     
     # Apply SQLite pragmas to reduce locking and improve concurrency
-    @event.listens_for(Engine, 'connect')
     def set_sqlite_pragma(dbapi_connection, connection_record):
         try:
             cursor = dbapi_connection.cursor()
@@ -31,21 +37,45 @@ def create_app(config_name='default'):
             cursor.execute('PRAGMA synchronous=NORMAL;')
             cursor.close()
         except Exception:
-            # Ignore if not SQLite or pragmas fail
+            # Ignore if the pragmas fail (e.g. read-only database)
             pass
     
-    # Configure login manager
-    login_manager.login_view = 'auth.login'
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', set_sqlite_pragma)
+    
+    from app.profiling import init_profiling
+    init_profiling(app)
+    
+    from app.user_cache import user_cache, register_invalidation
+    user_cache.configure(app)
+    register_invalidation()
+    
+    from app.sync import register_sync_tracking
+    register_sync_tracking()
+    
+    from app.search import register_search_indexing
+    register_search_indexing()
+    
+    # Configure login manager; without the login page unauthenticated API calls get a plain 401
+    login_manager.login_view = None if api_only else 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
     login_manager.login_message_category = 'info'
     
     # Register blueprints
-    from app.auth import bp as auth_bp
-    app.register_blueprint(auth_bp, url_prefix='/auth')
-    
-    from app.main import bp as main_bp
-    app.register_blueprint(main_bp)
+    if not api_only:
+        from app.fragments import fragment_cache
+        fragment_cache.configure(app)
+        
+        from app.auth import bp as auth_bp
+        app.register_blueprint(auth_bp, url_prefix='/auth')
+        
+        from app.main import bp as main_bp
+        app.register_blueprint(main_bp)
     from app.api import bp as api_bp
     app.register_blueprint(api_bp)
     
+    from app.commands import register_commands
+    register_commands(app)
+    
     return app
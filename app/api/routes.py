@@ -1,29 +1,118 @@
-from flask import jsonify, request
+from datetime import datetime
+from flask import Response, jsonify, request, current_app, url_for, stream_with_context
 from flask_login import login_required, current_user
 from app import db
 from app.api import bp
-from app.models import Subject, Topic
-
-
-def subject_to_dict(s: Subject):
-    return {
-        'id': s.id,
-        'name': s.name,
-        'start_hour': s.start_hour,
-        'start_minute': s.start_minute,
-        'end_hour': s.end_hour,
-        'end_minute': s.end_minute,
-        'color': s.color,
-        'is_active': s.is_active,
-        'topics': [{'id': t.id, 'name': t.name} for t in s.topics.filter_by(is_active=True).all()],
-    }
+from app.models import Subject, Topic, ExamMode
+from app.http_cache import user_etag, not_modified, with_etag
+from app.events import broker
+from app.reminders import reminder_scheduler, offset_from_browser, user_timezone
+from app.rollups import study_stats
+from app.export import EXPORTS, parse_since, export_rows, export_watermark, encode_ndjson, encode_csv, gzip_chunks
+from app.bulk_import import parse_document, validate_rows, import_rows
+from app.batch import Batch
+from app.schedule import schedule_indexes
+from app.subjects import overlap_error, hide_subject, parse_subject_times, subject_times_error
+from app.sync import snapshot, changes_since
+from app.exam_plan import exam_plans
+from app.search import search as search_index
+
+
+SUBJECT_FIELDS = ('id', 'name', 'start_hour', 'start_minute', 'end_hour', 'end_minute', 'color', 'is_active')
+
+
+def topic_to_dict(t: Topic):
+    return {'id': t.id, 'name': t.name}
+
+
+SYNC_SUBJECT_FIELDS = SUBJECT_FIELDS + ('description', 'daily_time_minutes', 'finished_at', 'updated_at')
+SYNC_TOPIC_FIELDS = ('id', 'subject_id', 'name', 'description', 'estimated_time_minutes', 'difficulty_level',
+                     'is_active', 'updated_at')
+
+
+def _sync_dict(obj, fields):
+    data = {f: getattr(obj, f) for f in fields}
+    for f in ('finished_at', 'updated_at'):
+        if data.get(f) is not None:
+            data[f] = data[f].isoformat() + 'Z'
+    return data
+
+
+def subject_to_dict(s: Subject, fields=SUBJECT_FIELDS, topics=None):
+    data = {f: getattr(s, f) for f in fields}
+    if topics is not None:
+        data['topics'] = [topic_to_dict(t) for t in topics]
+    return data
+
+
+def load_active_topics(subject_ids):
+    """Return {subject_id: [Topic, ...]} for a page of subjects in a single query."""
+    grouped = {sid: [] for sid in subject_ids}
+    if not subject_ids:
+        return grouped
+    topics = Topic.query.filter(Topic.subject_id.in_(subject_ids), Topic.is_active.is_(True))\
+        .order_by(Topic.subject_id, Topic.id).all()
+    for t in topics:
+        grouped[t.subject_id].append(t)
+    return grouped
+
+
+def parse_fields(value):
+    """Parse a `fields=` list; unknown names are ignored and `id` is always kept for the cursor."""
+    if not value:
+        return SUBJECT_FIELDS, True
+    requested = {f.strip() for f in value.split(',') if f.strip()}
+    fields = tuple(f for f in SUBJECT_FIELDS if f in requested or f == 'id')
+    return fields, 'topics' in requested
+
+
+@bp.errorhandler(401)
+def unauthorized(e):
+    # Only reached in the API-only app; the full app redirects to the login page instead
+    return jsonify({'success': False, 'error': 'unauthorized'}), 401
 
 
 @bp.route('/subjects', methods=['GET'])
 @login_required
 def get_subjects():
-    subjects = Subject.query.filter_by(user_id=current_user.id, is_active=True).all()
-    return jsonify([subject_to_dict(s) for s in subjects])
+    """List active subjects, keyset-paginated on Subject.id.
+
+    Query params: `cursor` (last id of the previous page), `limit`, `fields`
+    (comma separated, `topics` included) and `include=topics`. The next page
+    cursor is returned in the `X-Next-Cursor` header and a `Link: rel="next"`.
+    """
+    etag = user_etag(current_user, 'subjects', request.query_string.decode('utf-8'))
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
+    cursor = request.args.get('cursor', type=int)
+    per_page = current_app.config['SUBJECTS_PER_PAGE']
+    limit = request.args.get('limit', per_page, type=int)
+    limit = min(max(limit, 1), current_app.config['SUBJECTS_MAX_PER_PAGE'])
+    fields, with_topics = parse_fields(request.args.get('fields'))
+    include = request.args.get('include')
+    if include is not None:
+        with_topics = 'topics' in include.split(',')
+
+    query = Subject.query.filter_by(user_id=current_user.id, is_active=True)
+    if cursor is not None:
+        query = query.filter(Subject.id > cursor)
+    # Fetch one extra row to know whether another page exists
+    subjects = query.order_by(Subject.id).limit(limit + 1).all()
+    has_more = len(subjects) > limit
+    subjects = subjects[:limit]
+
+    topics_by_subject = load_active_topics([s.id for s in subjects]) if with_topics else {}
+    payload = [subject_to_dict(s, fields, topics_by_subject.get(s.id) if with_topics else None) for s in subjects]
+    response = jsonify(payload)
+    if has_more:
+        next_cursor = subjects[-1].id
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+        response.headers['Link'] = f'<{url_for("api.get_subjects", **args)}>; rel="next"'
+    return with_etag(response, etag)
 
 
 @bp.route('/subjects', methods=['POST'])
@@ -31,12 +120,16 @@ def get_subjects():
 def create_subject():
     data = request.get_json() or {}
     name = data.get('name')
-    start_hour = int(data.get('start_hour', 8))
-    start_minute = int(data.get('start_minute', 0))
-    end_hour = int(data.get('end_hour', 9))
-    end_minute = int(data.get('end_minute', 0))
     if not name:
         return jsonify({'error': 'name required'}), 400
+    start_hour, start_minute, end_hour, end_minute = times = parse_subject_times(data)
+    error = subject_times_error(data, times)
+    if error:
+        return jsonify({'error': error}), 400
+    if not data.get('allow_overlap'):
+        conflict = overlap_error(current_user, start_hour, start_minute, end_hour, end_minute)
+        if conflict:
+            return jsonify(conflict), 409
     s = Subject(
         name=name,
         start_hour=start_hour,
@@ -48,30 +141,43 @@ def create_subject():
         is_active=True,
     )
     db.session.add(s)
+    current_user.bump_data_version()
+    version = current_user.flushed_data_version()
     db.session.commit()
-    return jsonify(subject_to_dict(s)), 201
+    reminder_scheduler.schedule_subject(s)
+    schedule_indexes.apply(current_user.id, version, upserts=[s])
+    broker.publish(current_user.id, 'subject', {'action': 'created', 'id': s.id, 'name': s.name})
+    return jsonify(subject_to_dict(s, topics=[])), 201
 
 
 @bp.route('/subjects/<int:subject_id>/topics', methods=['POST'])
 @login_required
 def create_topic(subject_id: int):
-    subject = Subject.query.filter_by(id=subject_id, user_id=current_user.id).first_or_404()
+    subject = Subject.query.filter_by(id=subject_id, user_id=current_user.id, is_active=True).first_or_404()
     data = request.get_json() or {}
     name = data.get('name')
     if not name:
         return jsonify({'error': 'name required'}), 400
     t = Topic(name=name, subject_id=subject.id, is_active=True)
     db.session.add(t)
+    current_user.bump_data_version()
     db.session.commit()
-    return jsonify({'id': t.id, 'name': t.name}), 201
+    broker.publish(current_user.id, 'topic', {'action': 'created', 'subject_id': subject.id, 'id': t.id, 'name': t.name})
+    return jsonify(topic_to_dict(t)), 201
 
 
 @bp.route('/subjects/<int:subject_id>', methods=['DELETE'])
 @login_required
 def delete_subject(subject_id: int):
-    subject = Subject.query.filter_by(id=subject_id, user_id=current_user.id).first_or_404()
-    db.session.delete(subject)
+    """Hide the subject at once; a job removes its rows, as for the dashboard's delete."""
+    subject = Subject.query.filter_by(id=subject_id, user_id=current_user.id, is_active=True).first_or_404()
+    hide_subject(current_user.id, subject)
+    current_user.bump_data_version()
+    version = current_user.flushed_data_version()
     db.session.commit()
+    reminder_scheduler.unschedule_subject(current_user.id, subject_id)
+    schedule_indexes.apply(current_user.id, version, removals=[subject_id])
+    broker.publish(current_user.id, 'subject', {'action': 'deleted', 'id': subject_id})
     return jsonify({'success': True})
 
 
@@ -79,10 +185,284 @@ def delete_subject(subject_id: int):
 @login_required
 def delete_topic(topic_id: int):
     topic = Topic.query.filter_by(id=topic_id).first_or_404()
-    if topic.subject.user_id != current_user.id:
+    if topic.subject.user_id != current_user.id or not topic.subject.is_active:
         return jsonify({'error': 'not found'}), 404
+    subject_id = topic.subject_id
     db.session.delete(topic)
+    current_user.bump_data_version()
+    db.session.commit()
+    broker.publish(current_user.id, 'topic', {'action': 'deleted', 'subject_id': subject_id, 'id': topic_id})
+    return jsonify({'success': True})
+
+
+@bp.route('/import', methods=['POST'])
+@login_required
+def import_subjects():
+    """Create many subjects, topics and past sessions from one JSON or NDJSON (`application/x-ndjson`) document.
+
+    Rows are validated up front; valid ones are inserted in batches and
+    invalid ones are skipped and listed in `errors` with their 1-based
+    `row` (and `topic` or `session`) position. Subjects overlapping another
+    are `overlap` errors unless the row or `?allow_overlap=1` allows it.
+    Responds 201 when everything was imported.
+    """
+    if current_user.lunch_break_until and current_user.lunch_break_until > datetime.utcnow():
+        return jsonify({'success': False, 'error': 'on_break'}), 423
+    try:
+        rows = parse_document(request.get_data(cache=False), request.mimetype == 'application/x-ndjson')
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'success': False, 'error': f'invalid document: {e}'}), 400
+
+    user_id = current_user.id
+    allow_overlap = request.args.get('allow_overlap', '').lower() in ('1', 'true', 'on')
+    subjects, extra_topics, extra_sessions, errors = validate_rows(rows, current_user, allow_overlap)
+    try:
+        subject_ids = import_rows(current_user, subjects, extra_topics, extra_sessions,
+                                  current_app.config['IMPORT_BATCH_SIZE'])
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    if subject_ids and reminder_scheduler.is_tracking(user_id):
+        for start in range(0, len(subject_ids), 500):
+            for s in Subject.query.filter(Subject.id.in_(subject_ids[start:start + 500])):
+                reminder_scheduler.schedule_subject(s)
+    schedule_indexes.invalidate(user_id)
+    if subject_ids or extra_topics or extra_sessions:
+        broker.publish(user_id, 'subject', {'action': 'imported', 'count': len(subject_ids)})
+    return jsonify({
+        'success': not errors,
+        'imported': {'subjects': len(subject_ids),
+                     'topics': sum(len(ts) for _, ts, _ in subjects) + len(extra_topics),
+                     'sessions': sum(len(ss) for _, _, ss in subjects) + len(extra_sessions)},
+        'subject_ids': subject_ids,
+        'errors': errors,
+    }), 201 if not errors else 200
+
+
+@bp.route('/batch', methods=['POST'])
+@login_required
+def batch():
+    """Apply an ordered list of subject/topic operations with one commit.
+
+    Body: `{"ops": [{"op": "create_subject", "name": "Math", "ref": "m"},
+    {"op": "create_topic", "subject_id": "@m", "name": "Algebra"}, ...],
+    "atomic": true}`. Supported ops: create/rename/delete_subject,
+    complete_subject and create/rename/delete_topic. Returns one result per
+    op; an atomic batch with a failing op is rolled back and answered 422.
+    """
+    data = request.get_json(silent=True) or {}
+    ops = data.get('ops')
+    if not isinstance(ops, list) or not ops:
+        return jsonify({'success': False, 'error': 'ops required'}), 400
+    if len(ops) > current_app.config['BATCH_MAX_OPS']:
+        return jsonify({'success': False, 'error': f'at most {current_app.config["BATCH_MAX_OPS"]} ops per batch'}), 413
+    try:
+        results, committed = Batch(current_user).run(ops, atomic=data.get('atomic', True) is not False)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    schedule_indexes.invalidate(current_user.id)
+    success = committed and all(r['success'] for r in results)
+    return jsonify({'success': success, 'committed': committed, 'results': results}), 200 if committed else 422
+
+
+@bp.route('/sync', methods=['GET'])
+@login_required
+def sync():
+    """Subjects and topics changed since the client's last sync.
+
+    Pass the previous response's `token` as `since=`; without one (or with a
+    token this server never issued) the response is a full snapshot with
+    `full: true`. Changed rows come back whole, deleted ones as ids under
+    `deleted`. When `has_more` is set, call again with the new token.
+    """
+    since = request.args.get('since', type=int)
+    limit = min(max(request.args.get('limit', current_app.config['SYNC_MAX_CHANGES'], type=int), 1),
+                current_app.config['SYNC_MAX_CHANGES'])
+    user_id = current_user.id
+    full = since is None or since < 0 or since > (current_user.data_version or 0)
+    if full:
+        subjects, topics, token = snapshot(user_id)
+        deleted, has_more = {'subjects': [], 'topics': []}, False
+    else:
+        subjects, topics, deleted, token, has_more = changes_since(user_id, since, limit)
+    return jsonify({
+        'token': str(token),
+        'full': full,
+        'has_more': has_more,
+        'subjects': [_sync_dict(s, SYNC_SUBJECT_FIELDS) for s in subjects],
+        'topics': [_sync_dict(t, SYNC_TOPIC_FIELDS) for t in topics],
+        'deleted': deleted,
+    })
+
+
+@bp.route('/exam_plan', methods=['GET'])
+@login_required
+def exam_plan():
+    """Day-by-day study plan for the user's active exams.
+
+    `days` caps how far ahead days are planned (default and maximum
+    EXAM_PLAN_MAX_DAYS). Each exam reports the minutes still to study, how
+    many of them fit before the exam and the shortfall.
+    """
+    max_days = current_app.config['EXAM_PLAN_MAX_DAYS']
+    days = min(max(request.args.get('days', max_days, type=int), 1), max_days)
+    today = datetime.utcnow().date()
+    etag = user_etag(current_user, 'exam_plan', days, today)
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    return with_etag(jsonify(exam_plans.plan(current_user, days)), etag)
+
+
+@bp.route('/exams', methods=['POST'])
+@login_required
+def create_exam():
+    data = request.get_json(silent=True) or {}
+    subject = Subject.query.filter_by(id=data.get('subject_id'), user_id=current_user.id, is_active=True).first()
+    if subject is None:
+        return jsonify({'error': 'subject not found'}), 404
+    try:
+        exam_date = datetime.fromisoformat(str(data.get('exam_date')))
+    except ValueError:
+        return jsonify({'error': 'exam_date must be an ISO 8601 date'}), 400
+    exam = ExamMode(user_id=current_user.id, subject_id=subject.id, exam_date=exam_date, is_active=True)
+    db.session.add(exam)
+    current_user.bump_data_version()
+    db.session.commit()
+    return jsonify({'id': exam.id, 'subject_id': subject.id, 'exam_date': exam.exam_date.isoformat()}), 201
+
+
+@bp.route('/exams/<int:exam_id>', methods=['DELETE'])
+@login_required
+def delete_exam(exam_id: int):
+    exam = ExamMode.query.filter_by(id=exam_id, user_id=current_user.id).first_or_404()
+    db.session.delete(exam)
+    current_user.bump_data_version()
     db.session.commit()
     return jsonify({'success': True})
 
 
+@bp.route('/search', methods=['GET'])
+@login_required
+def search():
+    """The user's subjects, topics and session notes matching `q`, best first.
+
+    Every word of `q` must start a word of the result, so partial words
+    match as the user types. `limit` defaults to and is capped at
+    SEARCH_MAX_RESULTS.
+    """
+    q = request.args.get('q', '').strip()
+    max_results = current_app.config['SEARCH_MAX_RESULTS']
+    limit = min(max(request.args.get('limit', max_results, type=int), 1), max_results)
+    if not q:
+        return jsonify({'error': 'q is required'}), 400
+    etag = user_etag(current_user, 'search', q, limit)
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    return with_etag(jsonify({'query': q, 'results': search_index(current_user.id, q, limit)}), etag)
+
+
+@bp.route('/stats', methods=['GET'])
+@login_required
+def get_stats():
+    """Study totals per day and per subject, plus the completion streak, from the daily rollups."""
+    days = min(max(request.args.get('days', 30, type=int), 1), 366)
+    today = datetime.utcnow().date()
+    etag = user_etag(current_user, 'stats', days, today)
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    return with_etag(jsonify(study_stats(current_user.id, days, today)), etag)
+
+
+@bp.route('/export/<resource>', methods=['GET'])
+@login_required
+def export(resource: str):
+    """Stream all of the user's `subjects`, `topics`, `sessions` or `archived_sessions`.
+
+    `format=ndjson` (default) or `csv`; `since=` (ISO 8601 or Unix seconds,
+    UTC) limits the export to rows created or updated, for sessions created
+    or closed, or for archived sessions archived, since then. Pass the
+    previous response's `X-Export-Watermark` (the latest of those times in
+    the export) as `since` for incremental exports; rows at the boundary
+    repeat, so dedupe by id.
+    The body is gzipped when the client accepts it.
+    """
+    if resource not in EXPORTS:
+        return jsonify({'error': 'unknown export'}), 404
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    try:
+        since = parse_since(request.args.get('since'))
+    except (ValueError, OverflowError, OSError):
+        return jsonify({'error': 'invalid since'}), 400
+
+    watermark = export_watermark(resource, current_user.id, since)
+    columns = EXPORTS[resource][1]
+    rows = export_rows(resource, current_user.id, since, current_app.config['EXPORT_BATCH_SIZE'])
+    body = encode_csv(columns, rows) if fmt == 'csv' else encode_ndjson(columns, rows)
+    headers = {
+        'Content-Disposition': f'attachment; filename={resource}.{fmt}',
+        'X-Export-Watermark': watermark.isoformat() + 'Z',
+        'Cache-Control': 'no-store',
+        'Vary': 'Accept-Encoding',
+    }
+    if 'gzip' in request.accept_encodings:
+        body = gzip_chunks(body)
+        headers['Content-Encoding'] = 'gzip'
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
+
+
+def _minute_of_day():
+    """`at=HH:MM` from the query string, else the current minute on the user's clock; None if malformed.
+
+    The clock is the browser's `tz_offset` (as for /events), else the offset
+    the reminder scheduler has for the user, else the server's local time.
+    """
+    at = request.args.get('at')
+    if at is None:
+        utc_offset = offset_from_browser(request.args.get('tz_offset', type=int))
+        if utc_offset is None:
+            utc_offset = reminder_scheduler.utc_offset(current_user.id)
+        now = datetime.now(user_timezone(utc_offset))
+        return now.hour * 60 + now.minute
+    try:
+        hour, minute = (int(part) for part in at.split(':'))
+    except ValueError:
+        return None
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        return None
+    return hour * 60 + minute
+
+
+@bp.route('/schedule/now', methods=['GET'])
+@login_required
+def schedule_now():
+    """Subjects whose daily window covers now (or `at=HH:MM`); see _minute_of_day for `tz_offset`."""
+    minute = _minute_of_day()
+    if minute is None:
+        return jsonify({'error': 'at must be HH:MM'}), 400
+    index = schedule_indexes.get(current_user)
+    return jsonify({'at': f'{minute // 60:02d}:{minute % 60:02d}',
+                    'subjects': [index.describe(i) for i in index.active_at(minute)]})
+
+
+@bp.route('/schedule/next', methods=['GET'])
+@login_required
+def schedule_next():
+    """The next subject to start after now (or `at=HH:MM`), wrapping to tomorrow."""
+    minute = _minute_of_day()
+    if minute is None:
+        return jsonify({'error': 'at must be HH:MM'}), 400
+    index = schedule_indexes.get(current_user)
+    found = index.next_after(minute)
+    if found is None:
+        return jsonify({'at': f'{minute // 60:02d}:{minute % 60:02d}', 'subject': None})
+    subject_id, start, days_ahead = found
+    return jsonify({'at': f'{minute // 60:02d}:{minute % 60:02d}', 'subject': index.describe(subject_id),
+                    'starts_in_minutes': start + days_ahead * 24 * 60 - minute})
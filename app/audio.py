@@ -0,0 +1,161 @@
+import os
+import tempfile
+import wave
+import zlib
+
+
+# Bitrates in kbps indexed by [version_is_mpeg1][layer][bitrate_index]
+_BITRATES = {
+    True: {
+        1: [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+        2: [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+        3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    },
+    False: {
+        1: [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+        2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+        3: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    },
+}
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def clip_filename(filename, seconds):
+    """Name of the trimmed clip stored next to an uploaded song."""
+    stem, ext = os.path.splitext(filename)
+    return f'{stem}.clip{seconds}s{ext}'
+
+
+def _mp3_frame(header):
+    """Return (frame_length, samples) for a 4-byte MPEG audio header, or None."""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version = (header[1] >> 3) & 0x03
+    layer = 4 - ((header[1] >> 1) & 0x03)
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = _BITRATES[mpeg1][layer][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384
+    samples = 1152 if (layer == 2 or mpeg1) else 576
+    return samples // 8 * bitrate // sample_rate + padding, samples
+
+
+def _skip_id3v2(data):
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        return 10 + size
+    return 0
+
+
+def _write_atomically(dst, write):
+    """Call `write(file)` on a temp file next to `dst`, then move it into place.
+
+    Readers never see a half-written clip; a crash leaves only a `.part`
+    file, which the song sweeper removes.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dst), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            write(out)
+        os.replace(tmp_path, dst)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def trim_mp3(src, dst, seconds):
+    """Copy whole MPEG audio frames from `src` until `seconds` of audio are written.
+
+    Tags and a leading Xing/Info frame are dropped so players report the
+    clip's real duration. Returns False if no frames could be parsed.
+    """
+    with open(src, 'rb') as f:
+        data = f.read()
+    pos = _skip_id3v2(data)
+    played = 0.0
+    out = []
+    first = True
+    while pos + 4 <= len(data) and played < seconds:
+        frame = _mp3_frame(data[pos:pos + 4])
+        if frame is None:
+            # Resync on the next frame header
+            pos += 1
+            continue
+        length, samples = frame
+        chunk = data[pos:pos + length]
+        pos += length
+        if first:
+            first = False
+            if b'Xing' in chunk[:64] or b'Info' in chunk[:64]:
+                continue
+        sample_rate = _SAMPLE_RATES[(chunk[1] >> 3) & 0x03][(chunk[2] >> 2) & 0x03]
+        played += samples / sample_rate
+        out.append(chunk)
+    if not out:
+        return False
+    _write_atomically(dst, lambda f: f.write(b''.join(out)))
+    return True
+
+
+def trim_wav(src, dst, seconds):
+    with wave.open(src, 'rb') as reader:
+        params = reader.getparams()
+        frames = reader.readframes(min(reader.getnframes(), int(seconds * reader.getframerate())))
+
+    def write(f):
+        with wave.open(f, 'wb') as writer:
+            writer.setparams(params)
+            writer.writeframes(frames)
+    _write_atomically(dst, write)
+    return True
+
+
+def make_clip(folder, filename, seconds):
+    """Write the `seconds`-long clip of a stored song unless it already exists.
+
+    Clips are shared by every user of the same song; stale ones are removed
+    by the song sweeper. Returns the clip filename, or None when the format
+    cannot be trimmed (the original is then served instead).
+    """
+    ext = os.path.splitext(filename)[1]
+    trimmers = {'.mp3': trim_mp3, '.wav': trim_wav}
+    trim = trimmers.get(ext.lower())
+    if trim is None:
+        return None
+    clip = clip_filename(filename, seconds)
+    if os.path.exists(os.path.join(folder, clip)):
+        return clip
+    try:
+        if trim(os.path.join(folder, filename), os.path.join(folder, clip), seconds):
+            return clip
+    except (OSError, EOFError, wave.Error):
+        pass
+    return None
+
+
+def reminder_song_file(folder, user):
+    """Filename to serve for a user's reminder song: the trimmed clip if there is one."""
+    if not user.reminder_song_filename:
+        return None
+    clip = clip_filename(user.reminder_song_filename, user.reminder_song_seconds or 10)
+    if os.path.exists(os.path.join(folder, clip)):
+        return clip
+    return user.reminder_song_filename
+
+
+def reminder_song_version(folder, user):
+    """Short token that changes whenever the served song file changes, for cache-busting URLs."""
+    filename = reminder_song_file(folder, user)
+    if not filename:
+        return None
+    try:
+        st = os.stat(os.path.join(folder, filename))
+    except OSError:
+        return None
+    return format(zlib.crc32(f'{filename}:{st.st_mtime_ns}:{st.st_size}'.encode('utf-8')), 'x')
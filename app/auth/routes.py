@@ -4,6 +4,16 @@ from app import db
 from app.auth import bp
 from app.auth.forms import LoginForm, RegistrationForm
 from app.models import User
+from app.passwords import HashingBusy
+
+@bp.errorhandler(HashingBusy)
+def hashing_busy(e):
+    flash('Too many sign-ins right now, please try again in a few seconds.', 'error')
+    if request.endpoint == 'auth.register':
+        body = render_template('auth/register.html', title='Register', form=RegistrationForm())
+    else:
+        body = render_template('auth/login.html', title='Sign In', form=LoginForm())
+    return body, 503, {'Retry-After': str(e.retry_after)}
 
 @bp.route('/login', methods=['GET', 'POST'])
 def login():
@@ -16,6 +26,9 @@ def login():
         if user is None or not user.check_password(form.password.data):
             flash('Invalid username or password', 'error')
             return redirect(url_for('auth.login'))
+        if user.password_needs_rehash():
+            user.set_password(form.password.data)
+            db.session.commit()
         
         login_user(user, remember=form.remember_me.data)
         next_page = request.args.get('next')
@@ -0,0 +1,187 @@
+"""Ordered batches of subject/topic mutations applied with a single commit.
+
+Each operation is a dict with an `op` name and its arguments. Operations
+that create rows may carry a `ref`; later operations can then pass
+`"@<ref>"` wherever an id is expected. Event publishing and reminder
+scheduling are deferred until the batch has committed. A created subject
+whose window overlaps one of the user's subjects, including those created
+earlier in the batch, fails with `overlap` unless the op sets
+`allow_overlap`.
+
+With `atomic` (the default) the first failing operation rolls the whole
+batch back; otherwise each operation runs in its own savepoint and only the
+failing ones are undone.
+"""
+from datetime import datetime
+from app import db
+from app.models import Subject, Topic
+from app.subjects import parse_subject_times, finish_subject, delete_subject_rows, overlap_error
+from app.schedule import schedule_indexes
+from app.events import broker
+from app.reminders import reminder_scheduler
+
+
+class OpError(Exception):
+    def __init__(self, message, **details):
+        super().__init__(message)
+        self.details = details
+
+
+class Batch:
+    def __init__(self, user):
+        self.user = user
+        self.user_id = user.id
+        self.refs = {}
+        self._after_commit = []
+        self._index = None
+
+    def _id(self, value, what):
+        if isinstance(value, str) and value.startswith('@'):
+            if value[1:] not in self.refs:
+                raise OpError(f'unknown ref {value}')
+            return self.refs[value[1:]]
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise OpError(f'{what} required')
+
+    def _subject(self, op):
+        subject_id = self._id(op.get('id', op.get('subject_id')), 'subject id')
+        subject = Subject.query.filter_by(id=subject_id, user_id=self.user_id, is_active=True).first()
+        if subject is None:
+            raise OpError('Subject not found')
+        return subject
+
+    def _topic(self, op):
+        topic = Topic.query.filter_by(id=self._id(op.get('id'), 'topic id')).first()
+        if topic is None or topic.subject.user_id != self.user_id or not topic.subject.is_active:
+            raise OpError('Topic not found')
+        return topic
+
+    @staticmethod
+    def _name(op):
+        name = (op.get('name') or '').strip()
+        if not name:
+            raise OpError('Missing name')
+        return name
+
+    def _schedule(self):
+        # The user's subjects as this batch has left them so far
+        if self._index is None:
+            self._index = schedule_indexes.get(self.user).copy()
+        return self._index
+
+    def _publish(self, kind, payload):
+        self._after_commit.append(lambda: broker.publish(self.user_id, kind, payload))
+
+    def create_subject(self, op):
+        start_hour, start_minute, end_hour, end_minute = parse_subject_times(op)
+        name = self._name(op)
+        if not op.get('allow_overlap'):
+            conflict = overlap_error(self.user, start_hour, start_minute, end_hour, end_minute, self._schedule())
+            if conflict:
+                raise OpError('overlap', conflicts=conflict['conflicts'])
+        subject = Subject(name=name, start_hour=start_hour, start_minute=start_minute,
+                          end_hour=end_hour, end_minute=end_minute, color=op.get('color') or '#007bff',
+                          user_id=self.user_id, is_active=True)
+        db.session.add(subject)
+        db.session.flush()
+        self._schedule().upsert(subject.id, subject.name, start_hour, start_minute, end_hour, end_minute)
+        self._after_commit.append(lambda: reminder_scheduler.schedule_subject(subject))
+        self._publish('subject', {'action': 'created', 'id': subject.id, 'name': subject.name})
+        return {'id': subject.id}
+
+    def rename_subject(self, op):
+        subject = self._subject(op)
+        subject.name = self._name(op)
+        if self._index is not None:
+            self._index.upsert(subject.id, subject.name, subject.start_hour, subject.start_minute,
+                               subject.end_hour, subject.end_minute)
+        self._after_commit.append(lambda: reminder_scheduler.schedule_subject(subject))
+        self._publish('subject', {'action': 'updated', 'id': subject.id, 'name': subject.name})
+        return {'id': subject.id}
+
+    def delete_subject(self, op):
+        subject = self._subject(op)
+        subject_id = subject.id
+        delete_subject_rows(self.user_id, subject)
+        db.session.flush()
+        if self._index is not None:
+            self._index.remove(subject_id)
+        self._after_commit.append(lambda: reminder_scheduler.unschedule_subject(self.user_id, subject_id))
+        self._publish('subject', {'action': 'deleted', 'id': subject_id})
+        return {'id': subject_id}
+
+    def complete_subject(self, op):
+        subject = self._subject(op)
+        now = datetime.utcnow()
+        session, closed = finish_subject(self.user_id, subject, now)
+        db.session.flush()
+        self._after_commit.append(lambda: reminder_scheduler.mark_finished(self.user_id, subject.id))
+        self._publish('subject', {'action': 'finished', 'id': subject.id, 'finished_at': now.isoformat() + 'Z'})
+        key = 'closed_session' if closed else 'session_id'
+        return {'id': subject.id, 'completed_at': now.isoformat() + 'Z', key: session.id}
+
+    def create_topic(self, op):
+        subject = self._subject({'id': op.get('subject_id')})
+        topic = Topic(name=self._name(op), subject_id=subject.id, is_active=True)
+        db.session.add(topic)
+        db.session.flush()
+        self._publish('topic', {'action': 'created', 'subject_id': subject.id, 'id': topic.id, 'name': topic.name})
+        return {'id': topic.id}
+
+    def rename_topic(self, op):
+        topic = self._topic(op)
+        topic.name = self._name(op)
+        self._publish('topic', {'action': 'updated', 'subject_id': topic.subject_id, 'id': topic.id, 'name': topic.name})
+        return {'id': topic.id}
+
+    def delete_topic(self, op):
+        topic = self._topic(op)
+        topic_id, subject_id = topic.id, topic.subject_id
+        db.session.delete(topic)
+        db.session.flush()
+        self._publish('topic', {'action': 'deleted', 'subject_id': subject_id, 'id': topic_id})
+        return {'id': topic_id}
+
+    OPS = ('create_subject', 'rename_subject', 'delete_subject', 'complete_subject',
+           'create_topic', 'rename_topic', 'delete_topic')
+
+    def apply(self, op):
+        if not isinstance(op, dict) or op.get('op') not in self.OPS:
+            raise OpError('unknown op')
+        result = getattr(self, op['op'])(op)
+        if op.get('ref') is not None:
+            self.refs[str(op['ref'])] = result['id']
+        return result
+
+    def run(self, ops, atomic=True):
+        """Apply `ops` in order and commit once. Returns (results, committed)."""
+        results = []
+        failed = False
+        for i, op in enumerate(ops):
+            name = op.get('op') if isinstance(op, dict) else None
+            if failed:
+                results.append({'index': i, 'op': name, 'success': False, 'error': 'skipped'})
+                continue
+            pending = len(self._after_commit)
+            try:
+                if atomic:
+                    result = self.apply(op)
+                else:
+                    with db.session.begin_nested():
+                        result = self.apply(op)
+                results.append(dict(result, index=i, op=name, success=True))
+            except OpError as e:
+                del self._after_commit[pending:]
+                results.append({'index': i, 'op': name, 'success': False, 'error': str(e), **e.details})
+                failed = atomic
+        if failed:
+            db.session.rollback()
+            return results, False
+        if any(r['success'] for r in results):
+            self.user.bump_data_version()
+        db.session.commit()
+        for callback in self._after_commit:
+            callback()
+        return results, True
@@ -0,0 +1,275 @@
+"""Bulk import of subjects, topics and study sessions for /api/import.
+
+The whole document is validated first, then the valid rows are written
+with executemany INSERTs, one transaction per IMPORT_BATCH_SIZE subjects,
+instead of one request and commit per row. Invalid rows are skipped and
+reported back with their position in the document. Imported sessions are
+closed ones, added to the daily rollups in the transaction that inserts
+them.
+"""
+import json
+import re
+from datetime import timedelta
+from sqlalchemy import insert
+from app import db
+from app.models import Subject, Topic, StudySession
+from app.export import parse_since
+from app.rollups import FINISH_STAMP, record_session
+from app.schedule import schedule_indexes
+from app.subjects import parse_subject_times, subject_times_error
+from app.sync import record_changes
+from app.search import reindex
+
+_COLOR = re.compile(r'^#[0-9a-fA-F]{6}$')
+
+
+def parse_document(body, ndjson=False):
+    """Return the list of rows in a JSON or NDJSON document. Raises ValueError.
+
+    JSON may be a list of rows or an object with `subjects` (and optionally
+    `topics` and `sessions`) lists. Each subject row may carry its own
+    `topics` and `sessions`; top-level topic and session rows add to an
+    existing subject through `subject_id`. A session row is told apart from
+    a topic row by its `start_time`.
+    """
+    text = body.decode('utf-8')
+    if ndjson:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    doc = json.loads(text)
+    if isinstance(doc, dict):
+        return list(doc.get('subjects') or []) + list(doc.get('topics') or []) + list(doc.get('sessions') or [])
+    if isinstance(doc, list):
+        return doc
+    raise ValueError('expected a list of rows or an object with "subjects"')
+
+
+def _int_in(value, default, low, high):
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if low <= value <= high else None
+
+
+def _topic_values(data):
+    if not isinstance(data, dict):
+        return None, 'topic must be an object'
+    name = data.get('name')
+    if not isinstance(name, str) or not name.strip() or len(name) > 100:
+        return None, 'topic name required (at most 100 characters)'
+    minutes = _int_in(data.get('estimated_time_minutes'), 30, 1, 24 * 60)
+    difficulty = _int_in(data.get('difficulty_level'), 1, 1, 5)
+    if minutes is None:
+        return None, 'estimated_time_minutes must be 1-1440'
+    if difficulty is None:
+        return None, 'difficulty_level must be 1-5'
+    return {'name': name.strip(), 'description': data.get('description'), 'estimated_time_minutes': minutes,
+            'difficulty_level': difficulty, 'is_active': True}, None
+
+
+def _timestamp(value):
+    try:
+        return parse_since(value)
+    except (TypeError, ValueError, AttributeError, OverflowError, OSError):
+        return None
+
+
+def _session_values(data, user_id):
+    if not isinstance(data, dict):
+        return None, 'session must be an object'
+    start_time, end_time = _timestamp(data.get('start_time')), _timestamp(data.get('end_time'))
+    if start_time is None:
+        return None, 'start_time must be an ISO 8601 timestamp'
+    if end_time is None:
+        return None, 'end_time must be an ISO 8601 timestamp'
+    if not start_time <= end_time <= start_time + timedelta(days=1):
+        return None, 'end_time must be within 24 hours after start_time'
+    minutes = _int_in(data.get('actual_duration_minutes'), int((end_time - start_time).total_seconds() // 60),
+                      0, 24 * 60)
+    rating = _int_in(data.get('rating'), None, 1, 5)
+    if minutes is None:
+        return None, 'actual_duration_minutes must be 0-1440'
+    if data.get('rating') is not None and rating is None:
+        return None, 'rating must be 1-5'
+    notes = data.get('notes')
+    if notes is not None and not isinstance(notes, str):
+        return None, 'notes must be a string'
+    completed = data.get('completed', False)
+    if not isinstance(completed, bool):
+        return None, 'completed must be true or false'
+    return {'user_id': user_id, 'topic_id': None, 'start_time': start_time, 'end_time': end_time,
+            'actual_duration_minutes': minutes, 'notes': notes, 'rating': rating, 'completed': completed}, None
+
+
+def _subject_values(data, user_id):
+    name = data.get('name')
+    if not isinstance(name, str) or not name.strip() or len(name) > 100:
+        return None, 'name required (at most 100 characters)'
+    start_hour, start_minute, end_hour, end_minute = times = parse_subject_times(data)
+    error = subject_times_error(data, times)
+    if error:
+        return None, error
+    color = data.get('color') or '#007bff'
+    if not isinstance(color, str) or not _COLOR.match(color):
+        return None, 'color must look like #rrggbb'
+    daily = _int_in(data.get('daily_time_minutes'), 60, 0, 24 * 60)
+    if daily is None:
+        return None, 'daily_time_minutes must be 0-1440'
+    return {'name': name.strip(), 'description': data.get('description'), 'color': color,
+            'daily_time_minutes': daily, 'start_hour': start_hour, 'start_minute': start_minute,
+            'end_hour': end_hour, 'end_minute': end_minute, 'user_id': user_id, 'is_active': True}, None
+
+
+def _nested(row, i, key, parse, errors):
+    """Parse a subject row's nested `topics` or `sessions`; None if any of them is invalid."""
+    raw_items = row.get(key) or []
+    if not isinstance(raw_items, list):
+        errors.append({'row': i, 'error': f'{key} must be a list'})
+        return None
+    items, bad = [], False
+    for j, raw in enumerate(raw_items, 1):
+        values, error = parse(raw)
+        if error:
+            errors.append({'row': i, key[:-1]: j, 'error': error})
+            bad = True
+        else:
+            items.append(values)
+    return None if bad else items
+
+
+def _overlap(index, i, values):
+    """Error for a subject row whose window overlaps an existing subject or an earlier row, or None.
+
+    Earlier rows sit in the working `index` under their negated row number.
+    """
+    found = index.overlapping(values['start_hour'], values['start_minute'], values['end_hour'], values['end_minute'])
+    if not found:
+        return None
+    error = {'row': i, 'error': 'overlap', 'conflicts': [index.describe(c) for c in found if c > 0]}
+    if any(c < 0 for c in found):
+        error['conflicting_rows'] = sorted(-c for c in found if c < 0)
+    return error
+
+
+def validate_rows(rows, user, allow_overlap=False):
+    """One pass over the document.
+
+    Returns (subjects, extra_topics, extra_sessions, errors): `subjects` is
+    a list of (values, [topic values], [session values]) triples,
+    `extra_topics` and `extra_sessions` values for existing subjects and
+    `errors` dicts with the 1-based `row` (and `topic` or `session`) index.
+    A subject overlapping one of the user's subjects or an earlier row is an
+    `overlap` error unless `allow_overlap` is set for the document or row.
+    """
+    user_id = user.id
+    subjects, extra_topics, extra_sessions, errors = [], [], [], []
+    referenced, topic_refs = {}, {}
+    index = None
+    for i, row in enumerate(rows, 1):
+        if not isinstance(row, dict):
+            errors.append({'row': i, 'error': 'row must be an object'})
+            continue
+        if 'subject_id' in row:
+            session = 'start_time' in row
+            values, error = _session_values(row, user_id) if session else _topic_values(row)
+            if error:
+                errors.append({'row': i, 'error': error})
+                continue
+            try:
+                values['subject_id'] = int(row['subject_id'])
+                if session and row.get('topic_id') is not None:
+                    values['topic_id'] = int(row['topic_id'])
+            except (TypeError, ValueError):
+                errors.append({'row': i, 'error': 'subject_id and topic_id must be integers'})
+                continue
+            referenced.setdefault(values['subject_id'], []).append(i)
+            if values.get('topic_id') is not None:
+                topic_refs.setdefault((values['subject_id'], values['topic_id']), []).append(i)
+            (extra_sessions if session else extra_topics).append((i, values))
+            continue
+        values, error = _subject_values(row, user_id)
+        if error:
+            errors.append({'row': i, 'error': error})
+            continue
+        topics = _nested(row, i, 'topics', _topic_values, errors)
+        sessions = _nested(row, i, 'sessions', lambda raw: _session_values(raw, user_id), errors)
+        if topics is None or sessions is None:
+            continue
+        if index is None:
+            index = schedule_indexes.get(user).copy()
+        error = None if allow_overlap or row.get('allow_overlap') else _overlap(index, i, values)
+        if error:
+            errors.append(error)
+            continue
+        index.upsert(-i, values['name'], values['start_hour'], values['start_minute'],
+                     values['end_hour'], values['end_minute'])
+        subjects.append((values, topics, sessions))
+
+    missing = set()
+    if referenced:
+        owned = {sid for (sid,) in db.session.query(Subject.id).filter(
+            Subject.id.in_(list(referenced)), Subject.user_id == user_id, Subject.is_active == True)}
+        missing = {i for sid, positions in referenced.items() if sid not in owned for i in positions}
+        errors.extend({'row': i, 'error': 'subject not found'} for i in sorted(missing))
+    if topic_refs:
+        found = set(db.session.query(Topic.subject_id, Topic.id).filter(
+            Topic.id.in_([tid for _, tid in topic_refs])).all())
+        unknown = {i for key, positions in topic_refs.items() if key not in found
+                   for i in positions if i not in missing}
+        errors.extend({'row': i, 'error': 'topic not found'} for i in sorted(unknown))
+        missing |= unknown
+    extra_topics = [values for i, values in extra_topics if i not in missing]
+    extra_sessions = [values for i, values in extra_sessions if i not in missing]
+    errors.sort(key=lambda e: (e['row'], e.get('topic', 0), e.get('session', 0)))
+    return subjects, extra_topics, extra_sessions, errors
+
+
+def _insert_sessions(user_id, sessions):
+    """Insert closed sessions and add them to their days' rollups, as complete_subject does."""
+    session_ids = db.session.execute(insert(StudySession).returning(StudySession.id), sessions).scalars().all()
+    reindex('session', session_ids)
+    totals = {}
+    for s in sessions:
+        key = (s['subject_id'], s['end_time'].date())
+        minutes, count, completions = totals.get(key, (0, 0, 0))
+        stamp = s['completed'] and s['notes'] == FINISH_STAMP
+        totals[key] = (minutes + (s['actual_duration_minutes'] or 0), count + (not stamp),
+                       completions + s['completed'])
+    for (subject_id, day), (minutes, count, completions) in totals.items():
+        record_session(user_id, subject_id, day, minutes=minutes, sessions=count, completions=completions)
+
+
+def import_rows(user, subjects, extra_topics, extra_sessions, batch_size):
+    """Insert validated rows in batches; each batch is one transaction. Returns the new subject ids."""
+    subject_ids = []
+    stmt = insert(Subject).returning(Subject.id, sort_by_parameter_order=True)
+    topic_stmt = insert(Topic).returning(Topic.id)
+    for start in range(0, len(subjects), batch_size):
+        batch = subjects[start:start + batch_size]
+        ids = db.session.execute(stmt, [values for values, _, _ in batch]).scalars().all()
+        record_changes(db.session, user.id, 'subject', ids)
+        reindex('subject', ids)
+        topics = [dict(t, subject_id=sid) for sid, (_, ts, _) in zip(ids, batch) for t in ts]
+        if topics:
+            topic_ids = db.session.execute(topic_stmt, topics).scalars().all()
+            record_changes(db.session, user.id, 'topic', topic_ids)
+            reindex('topic', topic_ids)
+        sessions = [dict(s, subject_id=sid) for sid, (_, _, ss) in zip(ids, batch) for s in ss]
+        if sessions:
+            _insert_sessions(user.id, sessions)
+        user.bump_data_version()
+        db.session.commit()
+        subject_ids.extend(ids)
+    for start in range(0, len(extra_topics), batch_size):
+        topic_ids = db.session.execute(topic_stmt, extra_topics[start:start + batch_size]).scalars().all()
+        record_changes(db.session, user.id, 'topic', topic_ids)
+        reindex('topic', topic_ids)
+        user.bump_data_version()
+        db.session.commit()
+    for start in range(0, len(extra_sessions), batch_size):
+        _insert_sessions(user.id, extra_sessions[start:start + batch_size])
+        user.bump_data_version()
+        db.session.commit()
+    return subject_ids
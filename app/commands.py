@@ -0,0 +1,114 @@
+import os
+import sys
+import tempfile
+import click
+from flask import current_app
+
+
+def register_commands(app):
+    @app.cli.command('sweep-songs')
+    @click.option('--grace', type=int, default=None, help='Seconds an unreferenced file must be idle before removal.')
+    def sweep_songs_command(grace):
+        """Delete reminder songs and clips no user references any more."""
+        from app.songs import song_folder, sweep_songs
+        if grace is None:
+            grace = current_app.config['SONG_SWEEP_GRACE_SECONDS']
+        removed = sweep_songs(song_folder(), grace)
+        click.echo(f'Removed {removed} file(s)')
+
+    @app.cli.command('prune-user-stamps')
+    def prune_user_stamps_command():
+        """Delete user cache stamps older than USER_CACHE_TTL_SECONDS."""
+        from app.user_cache import user_cache
+        removed = user_cache.prune_stamps()
+        click.echo(f'Removed {removed} stamp(s)')
+
+    @app.cli.command('check-query-plans')
+    @click.option('--users', type=int, default=200, help='Number of synthetic users to seed.')
+    def check_query_plans_command(users):
+        """Fail if a hot query's plan falls back to a full scan on a seeded SQLite database."""
+        from app.query_plans import check_query_plans
+        with tempfile.TemporaryDirectory() as tmp:
+            plans, failures = check_query_plans(os.path.join(tmp, 'plans.db'), users=users)
+        for name, plan in plans.items():
+            status = 'FULL SCAN' if name in failures else 'ok'
+            click.echo(f'{name}: {status}')
+            for step in plan:
+                click.echo(f'    {step}')
+        if failures:
+            sys.exit(1)
+
+    @app.cli.command('rebuild-rollups')
+    @click.option('--user-id', type=int, default=None, help='Only rebuild this user\'s rollups.')
+    def rebuild_rollups_command(user_id):
+        """Recompute daily study rollups from the raw study sessions."""
+        from app.rollups import rebuild_rollups
+        written = rebuild_rollups(user_id)
+        click.echo(f'Wrote {written} rollup row(s)')
+
+    @app.cli.command('archive-sessions')
+    @click.option('--days', type=int, default=None, help='Archive sessions that ended more than this many days ago.')
+    @click.option('--batch-size', type=int, default=None, help='Sessions moved per transaction.')
+    @click.option('--max-batches', type=int, default=None, help='Stop after this many batches.')
+    def archive_sessions_command(days, batch_size, max_batches):
+        """Move old closed study sessions to the archive table."""
+        from app.retention import archive_sessions
+        if days is None:
+            days = current_app.config['SESSION_RETENTION_DAYS']
+        if batch_size is None:
+            batch_size = current_app.config['SESSION_ARCHIVE_BATCH_SIZE']
+        moved = archive_sessions(days, batch_size, max_batches)
+        click.echo(f'Archived {moved} session(s)')
+
+    @app.cli.command('run-jobs')
+    @click.option('--workers', type=int, default=None, help='Worker threads (default JOB_WORKERS).')
+    @click.option('--poll-interval', type=float, default=1.0, help='Seconds to wait when no job is due.')
+    @click.option('--burst', is_flag=True, help='Exit once no job is due instead of waiting for more.')
+    def run_jobs_command(workers, poll_interval, burst):
+        """Run queued background jobs until interrupted."""
+        import threading
+        from app.jobs import run_workers, stop_on_signals
+        if workers is None:
+            workers = current_app.config['JOB_WORKERS']
+        stop = threading.Event()
+        stop_on_signals(stop)
+        counts = run_workers(current_app._get_current_object(), workers, poll_interval, burst, stop)
+        click.echo(', '.join(f'{n} {status}' for status, n in sorted(counts.items())) or 'No jobs run')
+
+    @app.cli.command('job-stats')
+    @click.option('--hours', type=int, default=None, help='Only jobs created in the last this many hours.')
+    def job_stats_command(hours):
+        """Print job counts, attempts and durations per task and status."""
+        from datetime import datetime, timedelta
+        from app.jobs import job_stats
+        since = datetime.utcnow() - timedelta(hours=hours) if hours else None
+        for row in job_stats(since):
+            mean = '-' if row['mean_ms'] is None else f'{row["mean_ms"]:.1f}'
+            click.echo(f'{row["task"]:<20} {row["status"]:<8} {row["jobs"]:>6} jobs {row["attempts"]:>6} attempts '
+                       f'mean {mean} ms max {row["max_ms"] if row["max_ms"] is not None else "-"} ms')
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Rebuild the /api/search index from subjects, topics and session notes."""
+        from app.search import rebuild_search_index
+        indexed = rebuild_search_index()
+        click.echo(f'Indexed {indexed} row(s)')
+
+    @app.cli.command('check-startup')
+    @click.option('--api-only', is_flag=True, help='Measure the slim API-only app instead of the full one.')
+    @click.option('--budget-ms', type=int, default=None, help='Fail above this many milliseconds for create_app.')
+    @click.option('--runs', type=int, default=3, help='Cold starts to measure; the fastest counts.')
+    def check_startup_command(api_only, budget_ms, runs):
+        """Fail if a cold create_app() exceeds its time budget or eagerly imports lazy modules."""
+        from app.startup import measure_startup
+        if budget_ms is None:
+            budget_ms = current_app.config['STARTUP_BUDGET_MS']
+        root = os.path.dirname(current_app.root_path)
+        result = measure_startup(root, os.environ.get('FLASK_CONFIG', 'default'), api_only=api_only, runs=runs)
+        click.echo(f'create_app: {result["ms"]:.0f} ms (budget {budget_ms} ms)')
+        for name, ms in result['imports']:
+            click.echo(f'    {ms:8.1f} ms  {name}')
+        for name in result['eager']:
+            click.echo(f'eagerly imported: {name}')
+        if result['ms'] > budget_ms or result['eager']:
+            sys.exit(1)
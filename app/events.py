@@ -0,0 +1,54 @@
+import json
+import queue
+import threading
+from collections import defaultdict
+
+
+class EventBroker:
+    """In-process pub/sub: one queue per open event stream, grouped by user."""
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        q = queue.Queue(maxsize=self.max_queue_size)
+        with self._lock:
+            self._subscribers[user_id].add(q)
+        return q
+
+    def unsubscribe(self, user_id, q):
+        """Drop a stream; returns True when it was the user's last one."""
+        with self._lock:
+            subs = self._subscribers.get(user_id)
+            if subs is None:
+                return True
+            subs.discard(q)
+            if not subs:
+                del self._subscribers[user_id]
+                return True
+            return False
+
+    def has_subscribers(self, user_id):
+        with self._lock:
+            return bool(self._subscribers.get(user_id))
+
+    def publish(self, user_id, event, data=None):
+        message = format_sse(event, data)
+        with self._lock:
+            subs = list(self._subscribers.get(user_id, ()))
+        for q in subs:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # A stalled client must not block publishers; it resyncs on reconnect
+                pass
+
+
+def format_sse(event, data=None):
+    payload = json.dumps(data if data is not None else {}, separators=(',', ':'))
+    return f'event: {event}\ndata: {payload}\n\n'
+
+
+broker = EventBroker()
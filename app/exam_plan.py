@@ -0,0 +1,293 @@
+"""Exam-mode study planner.
+
+For every subject with an active, upcoming ExamMode the planner spreads the
+remaining work on its active topics (`estimated_time_minutes` less what has
+been studied since the exam was set) over the days up to the exam. A
+subject can be studied for at most the length of its daily time window;
+subjects whose windows overlap share the time those windows cover, and are
+planned together in one group.
+
+Within a group each day is filled from a priority queue of subjects keyed
+by exam date (earliest deadline first). Each subject works through its
+topics hardest first (`difficulty_level`, then id). That is a single pass
+over days and topics, so hundreds of topics plan in milliseconds. Work that
+does not fit before the exam is reported as a shortfall.
+
+Days are UTC days, like the study rollups. Planners are cached per process
+and tagged with the `User.data_version` they reflect, like the schedule
+indexes. Completing a session in this process folds the minutes into the
+cached planner, if it reflects the version just before that commit, and
+re-plans only the group of the subject studied. Any other change rebuilds
+the planner from three queries.
+"""
+import heapq
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import and_, case, func
+from app import db
+from app.models import ExamMode, Subject, Topic, StudySession
+from app.schedule import window_minutes
+
+
+def _merge(pieces):
+    """Total minutes covered by possibly overlapping [start, end) pieces."""
+    total, current_start, current_end = 0, None, None
+    for start, end in sorted(pieces):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+def _groups(windows):
+    """Partition subject ids into groups whose daily windows overlap (transitively)."""
+    pieces = sorted((start, end, subject_id) for subject_id, ps in windows.items() for start, end in ps)
+    parent = {subject_id: subject_id for subject_id in windows}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    reach, owner = None, None
+    for start, end, subject_id in pieces:
+        if reach is not None and start < reach:
+            parent[find(subject_id)] = find(owner)
+        if reach is None or end > reach:
+            reach, owner = end, subject_id
+    groups = {}
+    for subject_id in windows:
+        groups.setdefault(find(subject_id), []).append(subject_id)
+    return [sorted(g) for g in groups.values()]
+
+
+def allocate(today, exams, capacity, shared_capacity, topics, used_today, max_days):
+    """Plan one group of subjects.
+
+    `exams` maps subject id to exam date, `capacity` to daily minutes,
+    `topics` to [topic_id, remaining minutes] pairs in study order and
+    `used_today` to minutes already studied today; `shared_capacity` is the
+    daily time the group's windows cover together. Returns (days, planned):
+    {date: [(subject_id, topic_id, minutes), ...]} and minutes planned per
+    subject.
+    """
+    heap = [(exam_date, subject_id) for subject_id, exam_date in exams.items()
+            if exam_date > today and any(r > 0 for _, r in topics[subject_id])]
+    heapq.heapify(heap)
+    remaining = {subject_id: [r for _, r in topics[subject_id]] for _, subject_id in heap}
+    position = dict.fromkeys(remaining, 0)
+    planned = dict.fromkeys(exams, 0)
+    days = {}
+    day, last = today, today + timedelta(days=max_days - 1)
+    while heap and day <= last:
+        left = shared_capacity - (sum(used_today.values()) if day == today else 0)
+        waiting = []
+        while heap and left > 0:
+            exam_date, subject_id = heapq.heappop(heap)
+            if exam_date <= day:
+                continue  # exam day reached, whatever is left is a shortfall
+            take = min(left, capacity[subject_id] - (used_today.get(subject_id, 0) if day == today else 0))
+            rem, ids, i = remaining[subject_id], topics[subject_id], position[subject_id]
+            while take > 0 and i < len(rem):
+                minutes = min(rem[i], take)
+                if minutes:
+                    days.setdefault(day, []).append((subject_id, ids[i][0], minutes))
+                    rem[i] -= minutes
+                    take -= minutes
+                    left -= minutes
+                    planned[subject_id] += minutes
+                if rem[i] == 0:
+                    i += 1
+            position[subject_id] = i
+            if i < len(rem):
+                waiting.append((exam_date, subject_id))
+        for item in waiting:
+            heapq.heappush(heap, item)
+        day += timedelta(days=1)
+    return days, planned
+
+
+class ExamPlanner:
+    def __init__(self, today, exams, subjects, topics, max_days, version=None):
+        """`exams`: subject_id -> (exam id, exam date); `subjects`: subject_id -> (name, window pieces);
+        `topics`: subject_id -> [[topic_id, name, remaining], ...] in study order."""
+        self.today = today
+        self.version = version
+        self.max_days = max_days
+        self.exams = exams
+        self.names = {subject_id: name for subject_id, (name, _) in subjects.items()}
+        self.windows = {subject_id: pieces for subject_id, (_, pieces) in subjects.items()}
+        self.capacity = {subject_id: sum(end - start for start, end in pieces)
+                         for subject_id, pieces in self.windows.items()}
+        self.topics = topics
+        self.used_today = {}
+        self._group_of = {}
+        self._plans = []
+        for group in _groups(self.windows):
+            for subject_id in group:
+                self._group_of[subject_id] = len(self._plans)
+            self._plans.append((group, None))
+
+    def studied(self, subject_id, topic_id, minutes, today=False):
+        """Count `minutes` of study against a topic, or the subject's topics in study order."""
+        if subject_id not in self.topics:
+            return
+        if today:
+            self.used_today[subject_id] = self.used_today.get(subject_id, 0) + minutes
+        for topic in self.topics[subject_id]:
+            if minutes <= 0:
+                break
+            if topic_id is not None and topic[0] != topic_id:
+                continue
+            spent = min(topic[2], minutes)
+            topic[2] -= spent
+            minutes -= spent
+            if topic_id is not None:
+                break
+        group, _ = self._plans[self._group_of[subject_id]]
+        self._plans[self._group_of[subject_id]] = (group, None)
+
+    def _plan(self, index):
+        group, plan = self._plans[index]
+        if plan is None:
+            plan = allocate(
+                self.today,
+                {s: self.exams[s][1] for s in group},
+                {s: self.capacity[s] for s in group},
+                _merge(p for s in group for p in self.windows[s]),
+                {s: [(t[0], t[2]) for t in self.topics[s]] for s in group},
+                {s: self.used_today[s] for s in group if s in self.used_today},
+                self.max_days,
+            )
+            self._plans[index] = (group, plan)
+        return plan
+
+    def plan(self):
+        """{'exams': [...], 'days': [...]} for the API."""
+        names = {t[0]: t[1] for ts in self.topics.values() for t in ts}
+        exams, days = [], {}
+        for index in range(len(self._plans)):
+            group_days, planned = self._plan(index)
+            for day, items in group_days.items():
+                days.setdefault(day, []).extend(items)
+            for subject_id in self._plans[index][0]:
+                exam_id, exam_date = self.exams[subject_id]
+                remaining = sum(t[2] for t in self.topics[subject_id])
+                exams.append({
+                    'id': exam_id,
+                    'subject_id': subject_id,
+                    'subject': self.names[subject_id],
+                    'exam_date': exam_date.isoformat(),
+                    'days_left': (exam_date - self.today).days,
+                    'daily_minutes': self.capacity[subject_id],
+                    'remaining_minutes': remaining,
+                    'planned_minutes': planned[subject_id],
+                    'shortfall_minutes': remaining - planned[subject_id],
+                })
+        exams.sort(key=lambda e: (e['exam_date'], e['subject_id']))
+        return {
+            'today': self.today.isoformat(),
+            'exams': exams,
+            'days': [{'date': day.isoformat(),
+                      'minutes': sum(m for _, _, m in items),
+                      'items': [{'subject_id': s, 'topic_id': t, 'topic': names[t], 'minutes': m}
+                                for s, t, m in sorted(items, key=lambda i: (self.exams[i[0]][1], i[0]))]}
+                     for day, items in sorted(days.items())],
+        }
+
+
+def load_planner(user, today, max_days):
+    """Build a user's planner from the database."""
+    start = datetime.combine(today, datetime.min.time())
+    exams = {}
+    rows = db.session.query(ExamMode.id, ExamMode.subject_id, ExamMode.exam_date, ExamMode.created_at,
+                            Subject.name, Subject.start_hour, Subject.start_minute, Subject.end_hour,
+                            Subject.end_minute)\
+        .join(Subject, ExamMode.subject_id == Subject.id)\
+        .filter(ExamMode.user_id == user.id, ExamMode.is_active == True, Subject.is_active == True,
+                ExamMode.exam_date > start)\
+        .order_by(ExamMode.exam_date, ExamMode.id).all()
+    subjects, since = {}, {}
+    for exam_id, subject_id, exam_date, created_at, name, sh, sm, eh, em in rows:
+        if subject_id in exams:
+            continue  # the earliest exam of a subject is the one to prepare for
+        exams[subject_id] = (exam_id, exam_date.date())
+        subjects[subject_id] = (name, window_minutes(sh, sm, eh, em))
+        since[subject_id] = created_at or start
+
+    topics = {subject_id: [] for subject_id in exams}
+    if exams:
+        for topic_id, subject_id, name, minutes in db.session.query(
+                Topic.id, Topic.subject_id, Topic.name, Topic.estimated_time_minutes)\
+                .filter(Topic.subject_id.in_(list(exams)), Topic.is_active == True)\
+                .order_by(Topic.subject_id, Topic.difficulty_level.desc(), Topic.id):
+            topics[subject_id].append([topic_id, name, max(minutes or 0, 0)])
+    planner = ExamPlanner(today, exams, subjects, topics, max_days, version=user.data_version)
+
+    if exams:
+        # Study since each exam was set, split into today and earlier, per subject and topic
+        studied = db.session.query(
+            StudySession.subject_id, StudySession.topic_id,
+            func.sum(case((StudySession.end_time >= start, StudySession.actual_duration_minutes), else_=0)),
+            func.sum(StudySession.actual_duration_minutes),
+        ).join(ExamMode, and_(ExamMode.subject_id == StudySession.subject_id,
+                              ExamMode.id.in_([exam_id for exam_id, _ in exams.values()])))\
+            .filter(StudySession.user_id == user.id, StudySession.end_time.isnot(None),
+                    StudySession.end_time >= ExamMode.created_at)\
+            .group_by(StudySession.subject_id, StudySession.topic_id).all()
+        for subject_id, topic_id, today_minutes, minutes in studied:
+            planner.studied(subject_id, topic_id, (minutes or 0) - (today_minutes or 0))
+            planner.studied(subject_id, topic_id, today_minutes or 0, today=True)
+    return planner
+
+
+class ExamPlanRegistry:
+    """LRU of per-user planners, validated against User.data_version and the day."""
+
+    def __init__(self, size=256):
+        self.size = size
+        self._lock = threading.Lock()
+        self._planners = OrderedDict()
+
+    def plan(self, user, max_days):
+        """The user's plan from today, rebuilding the planner if it is missing or stale."""
+        today = datetime.utcnow().date()
+        key = (user.data_version, today, max_days)
+        with self._lock:
+            planner = self._planners.get(user.id)
+            if planner is not None and (planner.version, planner.today, planner.max_days) == key:
+                self._planners.move_to_end(user.id)
+                return planner.plan()
+        planner = load_planner(user, today, max_days)
+        with self._lock:
+            self._planners[user.id] = planner
+            self._planners.move_to_end(user.id)
+            while len(self._planners) > self.size:
+                self._planners.popitem(last=False)
+            # Planners are only read and updated under the lock
+            return planner.plan()
+
+    def session_completed(self, user_id, version, subject_id, topic_id, minutes, ended_at):
+        """Fold one committed session close, which bumped data_version to `version`, into a cached planner."""
+        with self._lock:
+            planner = self._planners.get(user_id)
+            if planner is None:
+                return
+            if planner.version is None or planner.version != version - 1:
+                # Built before an earlier write or after this one; the next plan() rebuilds it
+                del self._planners[user_id]
+                return
+            if minutes:
+                today = ended_at.date() == planner.today
+                planner.studied(subject_id, topic_id, minutes, today=today)
+            planner.version = version
+
+
+exam_plans = ExamPlanRegistry()
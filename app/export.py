@@ -0,0 +1,144 @@
+"""Streaming exports of a user's subjects, topics and study sessions (hot and archived).
+
+Rows are read with `yield_per`, so the database driver hands them over in
+batches and memory stays flat however long the history is. The encoders
+below turn them into NDJSON or CSV chunks of roughly CHUNK_BYTES, which the
+view can optionally gzip on the fly.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime, timezone
+from sqlalchemy import func, or_, select
+from app import db
+from app.models import Subject, Topic, StudySession, ArchivedStudySession
+
+CHUNK_BYTES = 64 * 1024
+
+EXPORTS = {
+    'subjects': (Subject, ('id', 'name', 'description', 'color', 'daily_time_minutes', 'start_hour',
+                           'start_minute', 'end_hour', 'end_minute', 'is_active', 'created_at', 'updated_at',
+                           'finished_at')),
+    'topics': (Topic, ('id', 'subject_id', 'name', 'description', 'estimated_time_minutes',
+                       'difficulty_level', 'is_active', 'created_at', 'updated_at')),
+    'sessions': (StudySession, ('id', 'subject_id', 'topic_id', 'start_time', 'end_time',
+                                'actual_duration_minutes', 'notes', 'rating', 'completed', 'created_at')),
+    'archived_sessions': (ArchivedStudySession, ('id', 'subject_id', 'topic_id', 'start_time', 'end_time',
+                                                 'actual_duration_minutes', 'notes', 'rating', 'completed',
+                                                 'created_at', 'archived_at')),
+}
+
+
+def parse_since(value):
+    """Parse `since=` as an ISO 8601 timestamp or Unix seconds (UTC). Raises ValueError."""
+    if value is None or value == '':
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        pass
+    else:
+        return datetime.utcfromtimestamp(seconds)
+    since = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return since
+
+
+def changed_columns(model):
+    """The timestamps that move when a row of `model` is added or changed, for `since=`."""
+    if model is StudySession:
+        # Sessions also change when they are closed
+        return StudySession.created_at, StudySession.end_time
+    if model is ArchivedStudySession:
+        # New to this export once archived
+        return (ArchivedStudySession.archived_at,)
+    return model.created_at, model.updated_at
+
+
+def _owned(stmt, model, user_id):
+    if model is Topic:
+        return stmt.join(Subject, Topic.subject_id == Subject.id).where(Subject.user_id == user_id)
+    return stmt.where(model.user_id == user_id)
+
+
+def _changed_since(stmt, model, since):
+    if since is None:
+        return stmt
+    return stmt.where(or_(*[column >= since for column in changed_columns(model)]))
+
+
+def export_query(resource, user_id, since=None):
+    model, columns = EXPORTS[resource]
+    stmt = _owned(select(*[getattr(model, c) for c in columns]), model, user_id)
+    return _changed_since(stmt, model, since).order_by(model.id)
+
+
+def export_watermark(resource, user_id, since=None):
+    """The latest change time among the rows export_query(since) returns; `since` (or now) if none."""
+    model, _ = EXPORTS[resource]
+    stmt = _owned(select(*[func.max(column) for column in changed_columns(model)]), model, user_id)
+    latest = [value for value in db.session.execute(_changed_since(stmt, model, since)).one() if value is not None]
+    if latest:
+        return max(latest)
+    return since or datetime.utcnow()
+
+
+def export_rows(resource, user_id, since=None, batch_size=1000):
+    """Yield the export's rows as tuples in EXPORTS column order."""
+    result = db.session.execute(export_query(resource, user_id, since).execution_options(yield_per=batch_size))
+    for row in result:
+        yield tuple(row)
+
+
+def _value(v):
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    return v
+
+
+def _chunked(pieces):
+    buf, size = [], 0
+    for piece in pieces:
+        buf.append(piece)
+        size += len(piece)
+        if size >= CHUNK_BYTES:
+            yield ''.join(buf)
+            buf, size = [], 0
+    if buf:
+        yield ''.join(buf)
+
+
+def encode_ndjson(columns, rows):
+    return _chunked(json.dumps(dict(zip(columns, map(_value, row))), ensure_ascii=False) + '\n' for row in rows)
+
+
+def encode_csv(columns, rows):
+    out = io.StringIO()
+    writer = csv.writer(out)
+
+    def lines():
+        writer.writerow(columns)
+        yield _take(out)
+        for row in rows:
+            writer.writerow([_value(v) for v in row])
+            yield _take(out)
+
+    return _chunked(lines())
+
+
+def _take(out):
+    text = out.getvalue()
+    out.seek(0)
+    out.truncate()
+    return text
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,112 @@
+"""Keyed cache for rendered page fragments.
+
+A fragment is whatever a builder returns for one user, typically rendered
+HTML plus the few facts the page derives from the same rows. Entries are
+keyed by user id and fragment name and tagged with the `User.data_version`
+they were built from and a checksum of the template source, so any write to
+the user's data (or a deploy that changes the template) makes the next
+request rebuild it; nothing has to be invalidated explicitly.
+
+Entries live in a per-process LRU bounded by FRAGMENT_CACHE_SIZE. With
+FRAGMENT_CACHE_DIR set, built fragments are also written there as JSON, one
+atomically replaced file per user and fragment, so worker processes share
+what any of them rendered; pointing it at a tmpfs such as /dev/shm keeps
+that in memory.
+"""
+import json
+import os
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from flask import current_app
+
+
+class FragmentCache:
+    def __init__(self):
+        self.size = 0
+        self.directory = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (user_id, name) -> (version, checksum, value)
+        self._checksums = {}
+
+    def configure(self, app):
+        self.size = app.config['FRAGMENT_CACHE_SIZE']
+        self.directory = app.config['FRAGMENT_CACHE_DIR']
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._checksums.clear()
+
+    def _checksum(self, template):
+        checksum = self._checksums.get(template)
+        if checksum is None:
+            env = current_app.jinja_env
+            source = env.loader.get_source(env, template)[0]
+            checksum = self._checksums[template] = zlib.crc32(source.encode('utf-8'))
+        return checksum
+
+    def _path(self, user_id, template):
+        return os.path.join(self.directory, f'{user_id}.{template.replace("/", "_")}.json')
+
+    def _read(self, user_id, template):
+        try:
+            with open(self._path(user_id, template), encoding='utf-8') as f:
+                entry = json.load(f)
+            return entry['version'], entry['checksum'], entry['value']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write(self, user_id, template, entry):
+        version, checksum, value = entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.fragment')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'version': version, 'checksum': checksum, 'value': value}, f)
+            os.replace(tmp, self._path(user_id, template))
+        except OSError:
+            # The shared copy is an optimisation; the local one still serves this process
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def get(self, user, template, build):
+        """The fragment for `template` at the user's current data version.
+
+        `build()` is called on a miss; its result must be JSON serialisable
+        when FRAGMENT_CACHE_DIR is set.
+        """
+        if self.size <= 0:
+            return build()
+        key = (user.id, template)
+        tag = (user.data_version, self._checksum(template))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[:2] == tag:
+                self._entries.move_to_end(key)
+                return entry[2]
+        if self.directory:
+            entry = self._read(user.id, template)
+            if entry is not None and entry[:2] == tag:
+                self._store(key, entry)
+                return entry[2]
+        entry = tag + (build(),)
+        if self.directory:
+            self._write(user.id, template, entry)
+        self._store(key, entry)
+        return entry[2]
+
+
+fragment_cache = FragmentCache()
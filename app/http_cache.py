@@ -0,0 +1,27 @@
+from hashlib import sha1
+from flask import request, make_response
+
+
+def user_etag(user, *parts):
+    """Weak ETag for a user's data: changes whenever `User.data_version` is bumped.
+
+    Extra `parts` (query string, date, ...) let a view vary the tag on inputs
+    that affect the body but are not stored as user data.
+    """
+    key = '-'.join(str(p) for p in (user.id, user.data_version) + parts)
+    return sha1(key.encode('utf-8')).hexdigest()[:20]
+
+
+def not_modified(etag):
+    """Return a 304 response if the client already holds `etag`, else None."""
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+        return with_etag(response, etag)
+    return None
+
+
+def with_etag(response, etag):
+    response.set_etag(etag, weak=True)
+    # Browsers must revalidate, and shared caches must not store per-user pages
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
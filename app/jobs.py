@@ -0,0 +1,207 @@
+"""Durable background jobs without an external broker.
+
+Request handlers call `enqueue` to add a Job row to their own transaction,
+so the job exists exactly when the request's changes are committed. The
+handler can then return without waiting for the work. `flask run-jobs`
+starts a pool of worker threads. Each worker claims the oldest due job
+with a single conditional UPDATE, so two workers never run the same job,
+and runs the task in its own app context.
+
+A task that raises is retried after JOB_RETRY_BASE_SECONDS, doubling per
+attempt up to JOB_RETRY_MAX_SECONDS, until the job's `max_attempts` are
+used up; then it stays `failed` with its last error. A job left `running`
+for longer than JOB_LEASE_SECONDS (its worker died) is put back in the
+queue. Every attempt records its start, end and duration, which
+`job_stats` summarises per task.
+
+Tasks are plain functions taking the job's payload as keyword arguments,
+registered with `@task` in app.tasks. They must be safe to run more than
+once.
+"""
+import json
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, delete, func, select, update
+from app import db
+from app.models import Job
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+TASKS = {}
+
+
+def task(name, max_attempts=5):
+    """Register a function as the task run for jobs called `name`."""
+    def register(fn):
+        TASKS[name] = (fn, max_attempts)
+        return fn
+    return register
+
+
+def _tasks():
+    # Tasks register themselves on import; only enqueuing and running need them
+    import app.tasks  # noqa: F401
+    return TASKS
+
+
+def enqueue(name, delay=0, **payload):
+    """Add a job to the current transaction; it runs once the caller commits."""
+    _, max_attempts = _tasks()[name]
+    job = Job(name=name, payload=json.dumps(payload), max_attempts=max_attempts,
+              run_at=datetime.utcnow() + timedelta(seconds=delay))
+    db.session.add(job)
+    return job
+
+
+def backoff(attempts, base, cap):
+    """Seconds to wait before retrying after the `attempts`-th failed attempt."""
+    return min(base * 2 ** (attempts - 1), cap)
+
+
+def claim(worker_id, now=None):
+    """Mark the oldest due queued job as running for `worker_id` and return it, or None."""
+    now = now or datetime.utcnow()
+    while True:
+        candidate = db.session.execute(
+            select(Job.id).where(Job.status == QUEUED, Job.run_at <= now).order_by(Job.run_at, Job.id).limit(1)
+        ).scalar()
+        if candidate is None:
+            db.session.commit()
+            return None
+        # Conditional on the status, so a job another worker took first is skipped
+        claimed = db.session.execute(
+            update(Job).where(Job.id == candidate, Job.status == QUEUED)
+            .values(status=RUNNING, locked_by=worker_id, locked_at=now, started_at=now,
+                    attempts=Job.attempts + 1)
+            .returning(Job.id, Job.name, Job.payload, Job.attempts, Job.max_attempts)
+            .execution_options(synchronize_session=False)
+        ).first()
+        db.session.commit()
+        if claimed is not None:
+            return claimed
+
+
+def _finish(job_id, values):
+    db.session.execute(update(Job).where(Job.id == job_id).values(**values)
+                       .execution_options(synchronize_session=False))
+    db.session.commit()
+
+
+def run_one(worker_id):
+    """Claim and run one due job. Returns the job's new status, or None if nothing was due."""
+    job = claim(worker_id)
+    if job is None:
+        return None
+    config = current_app.config
+    start = time.perf_counter()
+    try:
+        fn, _ = _tasks()[job.name]
+        fn(**json.loads(job.payload))
+    except Exception as e:
+        db.session.rollback()
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        retry = job.attempts < job.max_attempts
+        delay = backoff(job.attempts, config['JOB_RETRY_BASE_SECONDS'], config['JOB_RETRY_MAX_SECONDS'])
+        status = QUEUED if retry else FAILED
+        current_app.logger.warning('Job %s (%s) attempt %s failed after %d ms: %r', job.id, job.name,
+                                   job.attempts, duration_ms, e)
+        values = {'status': status, 'locked_by': None, 'locked_at': None, 'duration_ms': duration_ms,
+                  'last_error': f'{type(e).__name__}: {e}'[:2000]}
+        if retry:
+            values['run_at'] = datetime.utcnow() + timedelta(seconds=delay)
+        else:
+            values['finished_at'] = datetime.utcnow()
+        _finish(job.id, values)
+        return status
+    duration_ms = int((time.perf_counter() - start) * 1000)
+    _finish(job.id, {'status': DONE, 'locked_by': None, 'locked_at': None, 'duration_ms': duration_ms,
+                     'finished_at': datetime.utcnow()})
+    current_app.logger.info('Job %s (%s) done in %d ms', job.id, job.name, duration_ms)
+    return DONE
+
+
+def housekeeping(lease_seconds, keep_seconds, now=None):
+    """Requeue jobs whose worker vanished and purge old finished ones. Returns (requeued, purged)."""
+    now = now or datetime.utcnow()
+    expired = and_(Job.status == RUNNING, Job.locked_at < now - timedelta(seconds=lease_seconds))
+    # A job that keeps killing its worker runs out of attempts like one that raises
+    db.session.execute(
+        update(Job).where(expired, Job.attempts >= Job.max_attempts)
+        .values(status=FAILED, locked_by=None, locked_at=None, finished_at=now, last_error='lease expired')
+        .execution_options(synchronize_session=False))
+    requeued = db.session.execute(
+        update(Job).where(expired)
+        .values(status=QUEUED, locked_by=None, locked_at=None, run_at=now)
+        .execution_options(synchronize_session=False)).rowcount
+    purged = db.session.execute(
+        delete(Job).where(Job.status == DONE, Job.finished_at < now - timedelta(seconds=keep_seconds))
+        .execution_options(synchronize_session=False)).rowcount
+    db.session.commit()
+    return requeued, purged
+
+
+def run_workers(app, workers=2, poll_interval=1.0, burst=False, stop=None):
+    """Run jobs in `workers` threads until `stop` is set (or, with `burst`, until none are due).
+
+    Returns the number of jobs run, by final status of their attempt.
+    """
+    stop = stop or threading.Event()
+    prefix = f'{socket.gethostname()}:{os.getpid()}'
+    counts, lock = {}, threading.Lock()
+
+    def work(n):
+        worker_id = f'{prefix}:{n}'
+        while not stop.is_set():
+            with app.app_context():
+                try:
+                    status = run_one(worker_id)
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('Job worker %s failed to claim a job', worker_id)
+                    status = None
+            if status is None:
+                if burst:
+                    return
+                stop.wait(poll_interval)
+            else:
+                with lock:
+                    counts[status] = counts.get(status, 0) + 1
+
+    with app.app_context():
+        housekeeping(app.config['JOB_LEASE_SECONDS'], app.config['JOB_KEEP_SECONDS'])
+    threads = [threading.Thread(target=work, args=(n,), name=f'job-worker-{n}', daemon=True)
+               for n in range(max(workers, 1))]
+    for thread in threads:
+        thread.start()
+    next_housekeeping = time.monotonic() + app.config['JOB_LEASE_SECONDS']
+    while any(thread.is_alive() for thread in threads):
+        for thread in threads:
+            thread.join(timeout=poll_interval)
+        if time.monotonic() >= next_housekeeping:
+            with app.app_context():
+                housekeeping(app.config['JOB_LEASE_SECONDS'], app.config['JOB_KEEP_SECONDS'])
+            next_housekeeping = time.monotonic() + app.config['JOB_LEASE_SECONDS']
+    return counts
+
+
+def stop_on_signals(stop):
+    """Set `stop` on SIGTERM and SIGINT, so workers finish their current job and exit."""
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+
+
+def job_stats(since=None):
+    """Per task and status: job count, attempts and latest-attempt duration (mean and max ms)."""
+    query = select(Job.name, Job.status, func.count(), func.sum(Job.attempts),
+                   func.avg(Job.duration_ms), func.max(Job.duration_ms))
+    if since is not None:
+        query = query.where(Job.created_at >= since)
+    rows = db.session.execute(query.group_by(Job.name, Job.status).order_by(Job.name, Job.status)).all()
+    return [{'task': name, 'status': status, 'jobs': count, 'attempts': attempts or 0,
+             'mean_ms': round(mean, 1) if mean is not None else None, 'max_ms': longest}
+            for name, status, count, attempts, mean, longest in rows]
@@ -0,0 +1,63 @@
+from datetime import date, datetime
+from flask import render_template
+from markupsafe import Markup
+from sqlalchemy.orm import selectinload
+from app.models import Subject, StudySession
+from app.rollups import minutes_studied_on
+from app.fragments import fragment_cache
+
+
+def minutes_between(start_h: int, start_m: int, end_h: int, end_m: int) -> int:
+    return max((end_h * 60 + end_m) - (start_h * 60 + start_m), 0)
+
+
+def _subject_list(user):
+    subjects = Subject.query\
+        .options(selectinload(Subject.active_topics))\
+        .filter_by(user_id=user.id, is_active=True)\
+        .order_by(Subject.id)\
+        .all()
+    return {
+        'html': render_template('main/_subject_list.html', subjects=subjects),
+        'times': [{'id': s.id, 'end_hour': s.end_hour, 'end_minute': s.end_minute,
+                   'finished_at': s.finished_at.isoformat() + 'Z' if s.finished_at else None}
+                  for s in subjects],
+        # Scheduled subject duration, shown next to the time actually studied
+        'total_scheduled_minutes': sum(
+            minutes_between(s.start_hour or 0, s.start_minute or 0, s.end_hour or 0, s.end_minute or 0)
+            for s in subjects
+        ),
+    }
+
+
+def load_dashboard(user):
+    """Fetch everything the dashboard renders in a fixed number of queries.
+
+    The subject cards only change with the user's data, so they come from
+    the fragment cache; on a miss they cost one query for subjects and one
+    batched SELECT ... IN for their active topics. Recent sessions and
+    today's study rollup are one query each, and the finished-today state is
+    worked out per request from the cached finish times.
+    """
+    fragment = fragment_cache.get(user, 'main/_subject_list.html', lambda: _subject_list(user))
+    recent_sessions = StudySession.query.filter_by(user_id=user.id)\
+        .order_by(StudySession.start_time.desc()).limit(5).all()
+    today = datetime.today().date()
+
+    # Subjects finished today (used to suppress end-time ringtone)
+    finished_subject_ids = [t['id'] for t in fragment['times']
+                            if t['finished_at'] and date.fromisoformat(t['finished_at'][:10]) == today]
+    active_subjects_count = len(fragment['times'])
+    completed_subjects_count = len(finished_subject_ids)
+
+    return {
+        'subject_list_html': Markup(fragment['html']),
+        'subject_times': fragment['times'],
+        'recent_sessions': recent_sessions,
+        'finished_subject_ids': finished_subject_ids,
+        'active_subjects_count': active_subjects_count,
+        'completed_subjects_count': completed_subjects_count,
+        'pending_subjects_count': max(active_subjects_count - completed_subjects_count, 0),
+        'total_scheduled_minutes': fragment['total_scheduled_minutes'],
+        'studied_minutes_today': minutes_studied_on(user.id, datetime.utcnow().date()),
+    }
@@ -1,9 +1,20 @@
-from flask import render_template, redirect, url_for, request, jsonify, send_from_directory, current_app
+from flask import render_template, redirect, url_for, request, jsonify, send_from_directory, current_app, make_response, Response
 from flask_login import current_user, login_required
 from app import db
 from app.main import bp
-from app.models import User, Subject, StudySession, Topic, ExamMode
+from app.models import User, Subject, Topic
+from app.main.loaders import load_dashboard
+from app.http_cache import user_etag, not_modified, with_etag
+from app.events import broker
+from app.reminders import reminder_scheduler, offset_from_browser
+from app.audio import clip_filename, reminder_song_file, reminder_song_version
+from app.songs import ALLOWED_EXTENSIONS, song_folder, store_song, release_song, start_song_sweeper
+from app.subjects import parse_subject_times, overlap_error, finish_subject, hide_subject
+from app.schedule import schedule_indexes
+from app.exam_plan import exam_plans
+from app.jobs import enqueue
 import os
+import queue
 from datetime import datetime, timedelta
 
 @bp.route('/')
@@ -19,48 +30,31 @@ def dashboard():
     # Clear expired break lazily
     if current_user.lunch_break_until and current_user.lunch_break_until <= datetime.utcnow():
         current_user.lunch_break_until = None
+        current_user.bump_data_version()
         db.session.commit()
 
-    subjects = Subject.query.filter_by(user_id=current_user.id, is_active=True).all()
-    recent_sessions = StudySession.query.filter_by(user_id=current_user.id)\
-        .order_by(StudySession.start_time.desc()).limit(5).all()
-    today = datetime.today().date()
-
-    # Stats
-    active_subjects_count = len(subjects)
-    finished_subject_ids = [s.id for s in subjects if (s.finished_at and s.finished_at.date() == today)]
-    completed_subjects_count = len(finished_subject_ids)
-    pending_subjects_count = max(active_subjects_count - completed_subjects_count, 0)
-    # Today's Total Study Time (as total scheduled subject duration)
-    def minutes_between(start_h:int, start_m:int, end_h:int, end_m:int) -> int:
-        return max((end_h * 60 + end_m) - (start_h * 60 + start_m), 0)
-    total_scheduled_minutes = sum(
-        minutes_between(s.start_hour or 0, s.start_minute or 0, s.end_hour or 0, s.end_minute or 0)
-        for s in subjects
-    )
+    # Finished-today state and today's (UTC) study rollup roll over at midnight, so both dates are part of the tag
+    etag = user_etag(current_user, 'dashboard', datetime.today().date(), datetime.utcnow().date())
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
+    data = load_dashboard(current_user)
 
     now = datetime.now()
     current_hour = now.hour
     current_minute = now.minute
 
-    # Subjects finished today (used to suppress end-time ringtone)
-    # Use Subject.finished_at rather than sessions now
-    # finished_subject_ids already computed above
-
-    return render_template('main/dashboard.html', 
+    html = render_template('main/dashboard.html', 
                          title='Dashboard',
-                         subjects=subjects,
-                         recent_sessions=recent_sessions,
-                         total_scheduled_minutes=total_scheduled_minutes,
-                         active_subjects_count=active_subjects_count,
-                         completed_subjects_count=completed_subjects_count,
-                         pending_subjects_count=pending_subjects_count,
                          current_hour=current_hour,
                          current_minute=current_minute,
-                         finished_subject_ids=finished_subject_ids,
                          is_on_break=bool(current_user.lunch_break_until and current_user.lunch_break_until > datetime.utcnow()),
                          break_remaining_seconds=max(int((current_user.lunch_break_until - datetime.utcnow()).total_seconds()), 0) if current_user.lunch_break_until else 0,
-                         break_duration_minutes=current_user.break_duration_minutes or 30)
+                         break_duration_minutes=current_user.break_duration_minutes or 30,
+                         reminder_song_version=reminder_song_version(song_folder(), current_user),
+                         **data)
+    return with_etag(make_response(html), etag)
 
 @bp.route('/profile')
 @login_required
@@ -84,46 +78,14 @@ def add_subject():
     if current_user.lunch_break_until and current_user.lunch_break_until > datetime.utcnow():
         return jsonify({'success': False, 'error': 'on_break'}), 423
 
-    def parse_24_from_12(h12_val, ampm_val):
-        try:
-            h12 = int(h12_val)
-        except (TypeError, ValueError):
-            return None
-        ampm = (ampm_val or '').strip().upper()
-        if ampm not in ('AM', 'PM'):
-            return None
-        if ampm == 'AM':
-            return h12 % 12
-        return (h12 % 12) + 12
-
-    # Prefer explicit 12-hour inputs if provided; fallback to 24-hour fields
-    start_hour_12 = data.get('start_hour_12')
-    start_ampm = data.get('start_ampm')
-    end_hour_12 = data.get('end_hour_12')
-    end_ampm = data.get('end_ampm')
-
-    sh24_from_12 = parse_24_from_12(start_hour_12, start_ampm)
-    eh24_from_12 = parse_24_from_12(end_hour_12, end_ampm)
-
-    try:
-        start_hour = int(data.get('start_hour')) if sh24_from_12 is None else int(sh24_from_12)
-    except (TypeError, ValueError):
-        start_hour = 8
-    try:
-        start_minute = int(data.get('start_minute', 0))
-    except (TypeError, ValueError):
-        start_minute = 0
-    try:
-        end_hour = int(data.get('end_hour')) if eh24_from_12 is None else int(eh24_from_12)
-    except (TypeError, ValueError):
-        end_hour = 9
-    try:
-        end_minute = int(data.get('end_minute', 0))
-    except (TypeError, ValueError):
-        end_minute = 0
+    start_hour, start_minute, end_hour, end_minute = parse_subject_times(data)
 
     if not sub_name:
         return jsonify({'success': False, 'error': 'Missing fields'}), 400
+    if not data.get('allow_overlap'):
+        conflict = overlap_error(current_user, start_hour, start_minute, end_hour, end_minute)
+        if conflict:
+            return jsonify(conflict), 409
 
     new_subject = Subject(
         name=sub_name,
@@ -136,7 +98,12 @@ def add_subject():
     )
     try:
         db.session.add(new_subject)
+        current_user.bump_data_version()
+        version = current_user.flushed_data_version()
         db.session.commit()
+        reminder_scheduler.schedule_subject(new_subject)
+        schedule_indexes.apply(current_user.id, version, upserts=[new_subject])
+        broker.publish(current_user.id, 'subject', {'action': 'created', 'id': new_subject.id, 'name': new_subject.name})
         return jsonify({'success': True, 'subject': {'id': new_subject.id}})
     except Exception as e:
         db.session.rollback()
@@ -145,14 +112,14 @@ def add_subject():
 @bp.route('/subject/<int:subject_id>')
 @login_required
 def subject_detail(subject_id):
-    subject = Subject.query.filter_by(id=subject_id, user_id=current_user.id).first_or_404()
+    subject = Subject.query.filter_by(id=subject_id, user_id=current_user.id, is_active=True).first_or_404()
     topics = Topic.query.filter_by(subject_id=subject.id, is_active=True).all()
     return render_template('main/subject_detail.html', subject=subject, topics=topics)
 
 @bp.route('/subject/<int:subject_id>/add_topic', methods=['POST'])
 @login_required
 def add_topic(subject_id):
-    subject = Subject.query.filter_by(id=subject_id, user_id=current_user.id).first_or_404()
+    subject = Subject.query.filter_by(id=subject_id, user_id=current_user.id, is_active=True).first_or_404()
     data = request.get_json(silent=True) or {}
     name = data.get('name')
     if not name:
@@ -160,7 +127,9 @@ def add_topic(subject_id):
     topic = Topic(name=name, subject_id=subject.id, is_active=True)
     try:
         db.session.add(topic)
+        current_user.bump_data_version()
         db.session.commit()
+        broker.publish(current_user.id, 'topic', {'action': 'created', 'subject_id': subject.id, 'id': topic.id, 'name': topic.name})
         return jsonify({'success': True, 'topic': {'id': topic.id, 'name': topic.name}})
     except Exception as e:
         db.session.rollback()
@@ -170,23 +139,30 @@ def add_topic(subject_id):
 @login_required
 def edit_topic(topic_id):
     topic = Topic.query.filter_by(id=topic_id).first()
-    if not topic or topic.subject.user_id != current_user.id:
+    if not topic or topic.subject.user_id != current_user.id or not topic.subject.is_active:
         return jsonify({'success': False, 'error': 'Topic not found'}), 404
     data = request.get_json() or {}
     new_name = (data.get('name') or '').strip()
     if not new_name:
         return jsonify({'success': False, 'error': 'Missing topic name'}), 400
     topic.name = new_name
+    current_user.bump_data_version()
     db.session.commit()
+    broker.publish(current_user.id, 'topic', {'action': 'updated', 'subject_id': topic.subject_id, 'id': topic.id, 'name': topic.name})
     return jsonify({'success': True, 'topic': {'id': topic.id, 'name': topic.name}})
 
 @bp.route('/subject/<int:subject_id>/edit', methods=['POST'])
 @login_required
 def edit_subject(subject_id):
-    subject = Subject.query.filter_by(id=subject_id, user_id=current_user.id).first_or_404()
+    subject = Subject.query.filter_by(id=subject_id, user_id=current_user.id, is_active=True).first_or_404()
     data = request.get_json()
     subject.name = data.get('name', subject.name)
+    current_user.bump_data_version()
+    version = current_user.flushed_data_version()
     db.session.commit()
+    reminder_scheduler.schedule_subject(subject)
+    schedule_indexes.apply(current_user.id, version, upserts=[subject])
+    broker.publish(current_user.id, 'subject', {'action': 'updated', 'id': subject.id, 'name': subject.name})
     return jsonify({'success': True})
 
 @bp.route('/settings/upload_reminder_song', methods=['POST'])
@@ -196,29 +172,80 @@ def upload_reminder_song():
     if play_seconds is None or play_seconds < 1 or play_seconds > 60:
         play_seconds = 10  # default
 
+    upload_folder = song_folder()
     if 'reminder_song' in request.files and request.files['reminder_song'].filename != '':
         file = request.files['reminder_song']
-        if not file.filename.lower().endswith(('.mp3', '.wav', '.ogg', '.aac')):
+        ext = os.path.splitext(file.filename)[1].lower()
+        if ext not in ALLOWED_EXTENSIONS:
             return jsonify({'success': False, 'error': 'Invalid file type'}), 400
 
-        upload_folder = os.path.join(current_app.root_path, 'static', 'reminder_songs')
         os.makedirs(upload_folder, exist_ok=True)
-        filename = f"user_{current_user.id}_{file.filename}"
-        filepath = os.path.join(upload_folder, filename)
-        file.save(filepath)
+        filename = store_song(file.stream, ext, upload_folder)
+        release_song(current_user.reminder_song_filename)
         current_user.reminder_song_filename = filename
+        start_song_sweeper(current_app._get_current_object())
+
+    # Only the first `play_seconds` are ever played; a job trims a clip to serve instead
+    filename = current_user.reminder_song_filename
+    if filename and not os.path.exists(os.path.join(upload_folder, clip_filename(filename, play_seconds))):
+        enqueue('make_clip', filename=filename, seconds=play_seconds)
 
     current_user.reminder_song_seconds = play_seconds
+    current_user.bump_data_version()
     db.session.commit()
     return jsonify({'success': True})
 
+@bp.route('/events')
+@login_required
+def events():
+    """Server-Sent Events stream for the logged-in user.
+
+    Carries `subject` and `topic` mutations, `break` start/end and due
+    `reminder`s so every open tab stays in sync without polling. Streams
+    are idle almost all the time; run under a gevent worker so they cost a
+    greenlet each rather than a thread (see README).
+
+    `tz_offset` is the browser's `Date.getTimezoneOffset()` (minutes behind
+    UTC), so reminders fire at the subject's end time on the user's clock.
+    """
+    user_id = current_user.id
+    utc_offset = offset_from_browser(request.args.get('tz_offset', type=int))
+    subjects = Subject.query.filter_by(user_id=user_id, is_active=True).all()
+    reminder_scheduler.load_user(user_id, subjects, current_user.lunch_break_until, utc_offset)
+    q = broker.subscribe(user_id)
+    keepalive = current_app.config['EVENTS_KEEPALIVE_SECONDS']
+
+    def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    yield q.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+        finally:
+            if broker.unsubscribe(user_id, q):
+                reminder_scheduler.unload_user(user_id)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @bp.route('/settings/reminder_song')
 @login_required
 def get_reminder_song():
-    if not current_user.reminder_song_filename:
+    upload_folder = song_folder()
+    filename = reminder_song_file(upload_folder, current_user)
+    if not filename:
         return '', 404
-    upload_folder = os.path.join(current_app.root_path, 'static', 'reminder_songs')
-    return send_from_directory(upload_folder, current_user.reminder_song_filename)
+    # Versioned URLs never change content, so browsers need not revalidate them
+    versioned = bool(request.args.get('v'))
+    # send_from_directory answers Range requests with 206 and sets a strong ETag
+    response = send_from_directory(upload_folder, filename, conditional=True, etag=True,
+                                   max_age=31536000 if versioned else None)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = versioned
+    return response
 
 @bp.route('/settings/break', methods=['POST'])
 @login_required
@@ -232,6 +259,7 @@ def set_break_duration():
     if minutes is None or minutes not in (15, 20, 25, 30, 45, 60, 90):
         return jsonify({'success': False, 'error': 'invalid_minutes'}), 400
     current_user.break_duration_minutes = minutes
+    current_user.bump_data_version()
     db.session.commit()
     return jsonify({'success': True, 'break_duration_minutes': minutes})
 
@@ -246,29 +274,32 @@ def toggle_break():
         current_user.lunch_break_until = now + timedelta(minutes=minutes)
     else:
         current_user.lunch_break_until = None
+    current_user.bump_data_version()
     db.session.commit()
-    return jsonify({
-        'success': True,
+    state = {
         'is_on_break': bool(current_user.lunch_break_until and current_user.lunch_break_until > datetime.utcnow()),
         'until': current_user.lunch_break_until.isoformat() + 'Z' if current_user.lunch_break_until else None
-    })
+    }
+    reminder_scheduler.schedule_break_end(current_user.id, current_user.lunch_break_until)
+    broker.publish(current_user.id, 'break', state)
+    return jsonify({'success': True, **state})
 
 
 @bp.route('/delete_subject/<int:subject_id>', methods=['POST'])
 @login_required
 def delete_subject(subject_id):
-    subject = Subject.query.filter_by(id=subject_id, user_id=current_user.id).first()
+    subject = Subject.query.filter_by(id=subject_id, user_id=current_user.id, is_active=True).first()
     if not subject:
         return jsonify({'success': False, 'error': 'Subject not found'}), 404
-    # Proactively delete dependents to avoid FK issues (e.g., ExamMode)
     try:
-        # Delete dependents
-        StudySession.query.filter_by(user_id=current_user.id, subject_id=subject.id).delete(synchronize_session=False)
-        ExamMode.query.filter_by(user_id=current_user.id, subject_id=subject.id).delete(synchronize_session=False)
-        # Topics will be deleted by cascade too; explicit bulk delete is optional, but keep safe:
-        Topic.query.filter_by(subject_id=subject.id).delete(synchronize_session=False)
-        db.session.delete(subject)
+        # Hide it now; a job worker deletes its rows across the other tables
+        hide_subject(current_user.id, subject)
+        current_user.bump_data_version()
+        version = current_user.flushed_data_version()
         db.session.commit()
+        reminder_scheduler.unschedule_subject(current_user.id, subject_id)
+        schedule_indexes.apply(current_user.id, version, removals=[subject_id])
+        broker.publish(current_user.id, 'subject', {'action': 'deleted', 'id': subject_id})
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
@@ -278,11 +309,14 @@ def delete_subject(subject_id):
 @login_required
 def delete_topic(topic_id):
     topic = Topic.query.filter_by(id=topic_id).first()
-    if not topic or topic.subject.user_id != current_user.id:
+    if not topic or topic.subject.user_id != current_user.id or not topic.subject.is_active:
         return jsonify({'success': False, 'error': 'Topic not found'}), 404
+    subject_id = topic.subject_id
     try:
         db.session.delete(topic)
+        current_user.bump_data_version()
         db.session.commit()
+        broker.publish(current_user.id, 'topic', {'action': 'deleted', 'subject_id': subject_id, 'id': topic_id})
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
@@ -303,40 +337,22 @@ def clear_extra_time(subject_id):
 @bp.route('/subject/<int:subject_id>/complete', methods=['POST'])
 @login_required
 def complete_subject(subject_id):
-    subject = Subject.query.filter_by(id=subject_id, user_id=current_user.id).first()
+    subject = Subject.query.filter_by(id=subject_id, user_id=current_user.id, is_active=True).first()
     if not subject:
         return jsonify({'success': False, 'error': 'Subject not found'}), 404
     now = datetime.utcnow()
-    # Persist finish timestamp on Subject
-    subject.finished_at = now
-    # If there's an open session for this subject today without end_time, close it; else log completion stamp
-    open_session = StudySession.query.filter(
-        StudySession.user_id == current_user.id,
-        StudySession.subject_id == subject.id,
-        StudySession.end_time.is_(None)
-    ).order_by(StudySession.start_time.desc()).first()
     try:
-        if open_session:
-            open_session.end_time = now
-            if open_session.start_time:
-                elapsed = int((now - open_session.start_time).total_seconds() // 60)
-                open_session.actual_duration_minutes = max(elapsed, 0)
-            open_session.notes = (open_session.notes or '') + ' finished'
-            db.session.commit()
-            return jsonify({'success': True, 'completed_at': now.isoformat() + 'Z', 'closed_session': open_session.id})
-        else:
-            # Create a completion stamp session
-            session = StudySession(
-                user_id=current_user.id,
-                subject_id=subject.id,
-                start_time=now,
-                end_time=now,
-                actual_duration_minutes=0,
-                notes='subject_finished'
-            )
-            db.session.add(session)
-            db.session.commit()
-            return jsonify({'success': True, 'completed_at': now.isoformat() + 'Z', 'session_id': session.id})
+        session, closed = finish_subject(current_user.id, subject, now)
+        current_user.bump_data_version()
+        version = current_user.flushed_data_version()
+        db.session.commit()
+        # Only once it is committed: a failed finish must not silence today's reminder
+        reminder_scheduler.mark_finished(current_user.id, subject.id)
+        exam_plans.session_completed(current_user.id, version, subject.id, session.topic_id,
+                                     session.actual_duration_minutes or 0, now)
+        broker.publish(current_user.id, 'subject', {'action': 'finished', 'id': subject.id, 'finished_at': now.isoformat() + 'Z'})
+        key = 'closed_session' if closed else 'session_id'
+        return jsonify({'success': True, 'completed_at': now.isoformat() + 'Z', key: session.id})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
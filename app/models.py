@@ -1,14 +1,13 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 from app import db, login_manager
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), index=True, unique=True, nullable=False)
     email = db.Column(db.String(120), index=True, unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(256))
     first_name = db.Column(db.String(64), nullable=False)
     last_name = db.Column(db.String(64), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -18,23 +17,50 @@ class User(UserMixin, db.Model):
     # Lunch break settings
     break_duration_minutes = db.Column(db.Integer, default=30)
     lunch_break_until = db.Column(db.DateTime)
+    # Bumped on every write to the user's data; read endpoints derive their ETag from it
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
     subjects = db.relationship('Subject', backref='user', lazy='dynamic', cascade='all, delete-orphan')
     study_sessions = db.relationship('StudySession', backref='user', lazy='dynamic', cascade='all, delete-orphan')
     
     def set_password(self, password):
-        """Hash and set the user's password."""
-        self.password_hash = generate_password_hash(password)
+        """Hash and set the user's password (may raise HashingBusy)."""
+        from app.passwords import hash_password
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        """Check if the provided password matches the user's password."""
-        return check_password_hash(self.password_hash, password)
+        """Check if the provided password matches the user's password (may raise HashingBusy)."""
+        from app.passwords import verify_password
+        return verify_password(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        """True when the stored hash predates the configured PASSWORD_HASH_METHOD."""
+        from app.passwords import needs_rehash
+        return needs_rehash(self.password_hash)
+    
+    def bump_data_version(self):
+        """Mark the user's data as changed. Evaluated in SQL so concurrent writers never collide."""
+        self.data_version = User.data_version + 1
+
+    def flushed_data_version(self):
+        """Flush and return the data_version this transaction commits (after `bump_data_version`).
+
+        Read it before committing: once committed, another writer may already
+        have bumped it again.
+        """
+        db.session.flush()
+        return self.data_version
     
     def __repr__(self):
         return f'<User {self.username}>'
 
 class Subject(db.Model):
+    __table_args__ = (
+        # Every listing filters a user's active subjects
+        db.Index('ix_subject_user_id_is_active', 'user_id', 'is_active'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
@@ -42,6 +68,7 @@ class Subject(db.Model):
     daily_time_minutes = db.Column(db.Integer, default=60)  # Default 1 hour per day
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
     start_hour = db.Column(db.Integer, default=8)
     start_minute = db.Column(db.Integer, default=0)
@@ -55,6 +82,14 @@ class Subject(db.Model):
     # Relationships
     topics = db.relationship('Topic', backref='subject', lazy='dynamic', cascade='all, delete-orphan')
     study_sessions = db.relationship('StudySession', backref='subject', lazy='dynamic', cascade='all, delete-orphan')
+    daily_rollups = db.relationship('DailyStudyRollup', backref='subject', lazy='dynamic', cascade='all, delete-orphan')
+    # Read-only view of active topics; unlike the dynamic `topics` query this can be eager-loaded
+    active_topics = db.relationship(
+        'Topic',
+        primaryjoin='and_(Subject.id == Topic.subject_id, Topic.is_active == True)',
+        order_by='Topic.id',
+        viewonly=True,
+    )
     
     def __repr__(self):
         return f'<Subject {self.name}>'
@@ -82,6 +117,11 @@ class Subject(db.Model):
         return self._format_ampm(self.end_hour or 0, self.end_minute or 0)
 
 class Topic(db.Model):
+    __table_args__ = (
+        # Batched active-topic loads for a page of subjects
+        db.Index('ix_topic_subject_id_is_active', 'subject_id', 'is_active'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
@@ -89,6 +129,7 @@ class Topic(db.Model):
     difficulty_level = db.Column(db.Integer, default=1)  # 1-5 scale
     subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
     
     # Relationships
@@ -97,7 +138,59 @@ class Topic(db.Model):
     def __repr__(self):
         return f'<Topic {self.name}>'
 
+class SyncChange(db.Model):
+    """Latest change to one of a user's subjects or topics, for /api/sync.
+
+    `seq` is the user's data_version of the commit that made the change, so
+    it grows monotonically per user. Deleted rows keep their entry as a
+    tombstone (`deleted`); a deleted subject takes its topics with it.
+    """
+    __table_args__ = (
+        # Sync reads a user's changes after a sequence number
+        db.Index('ix_sync_change_user_id_seq', 'user_id', 'seq'),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    kind = db.Column(db.String(16), primary_key=True)  # 'subject' or 'topic'
+    object_id = db.Column(db.Integer, primary_key=True)
+    seq = db.Column(db.Integer, nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SyncChange {self.user_id}/{self.kind}/{self.object_id}@{self.seq}>'
+
+class SearchTerm(db.Model):
+    """One distinct word of a subject, topic or session note, for search on databases without FTS5.
+
+    SQLite searches its FTS5 table instead (see app.search) and leaves this one empty.
+    """
+    __table_args__ = (
+        # Prefix lookups of a user's words
+        db.Index('ix_search_term_user_id_term', 'user_id', 'term'),
+        # Reindexing one row
+        db.Index('ix_search_term_kind_object_id', 'kind', 'object_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(16), nullable=False)  # 'subject', 'topic' or 'session'
+    object_id = db.Column(db.Integer, nullable=False)
+    subject_id = db.Column(db.Integer, index=True)
+    term = db.Column(db.String(64), nullable=False)
+    weight = db.Column(db.Integer, nullable=False, default=1)  # 2 for names, 1 for descriptions and notes
+    
+    def __repr__(self):
+        return f'<SearchTerm {self.kind}/{self.object_id} {self.term}>'
+
 class StudySession(db.Model):
+    __table_args__ = (
+        # Open session lookup in complete_subject: user, subject, end_time IS NULL, newest first
+        db.Index('ix_study_session_user_id_subject_id_end_time', 'user_id', 'subject_id', 'end_time', 'start_time'),
+        # Recent sessions on the dashboard
+        db.Index('ix_study_session_user_id_start_time', 'user_id', 'start_time'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=False)
@@ -107,11 +200,57 @@ class StudySession(db.Model):
     actual_duration_minutes = db.Column(db.Integer)
     notes = db.Column(db.Text)
     rating = db.Column(db.Integer)  # 1-5 scale for difficulty/understanding
+    completed = db.Column(db.Boolean, nullable=False, default=False, server_default='0')  # by complete_subject
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
         return f'<StudySession {self.id}>'
 
+class ArchivedStudySession(db.Model):
+    """A closed StudySession moved out of the hot table by `flask archive-sessions`.
+
+    Keeps the original id and columns. Ids are plain integers, so a topic
+    deleted later leaves its archived sessions behind; deleting the subject
+    removes them.
+    """
+    __table_args__ = (
+        # Rebuilding a user's rollups and exporting their history
+        db.Index('ix_archived_study_session_user_id_end_time', 'user_id', 'end_time'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    subject_id = db.Column(db.Integer, nullable=False, index=True)
+    topic_id = db.Column(db.Integer)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    actual_duration_minutes = db.Column(db.Integer)
+    notes = db.Column(db.Text)
+    rating = db.Column(db.Integer)
+    completed = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ArchivedStudySession {self.id}>'
+
+class DailyStudyRollup(db.Model):
+    """Per-user, per-subject daily totals of closed StudySessions (UTC days)."""
+    __table_args__ = (
+        # Stats read a user's date range across all subjects
+        db.Index('ix_daily_study_rollup_user_id_day', 'user_id', 'day'),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    minutes = db.Column(db.Integer, nullable=False, default=0)
+    sessions = db.Column(db.Integer, nullable=False, default=0)  # closed study sessions, excluding finish stamps
+    completions = db.Column(db.Integer, nullable=False, default=0)  # times the subject was marked finished
+    
+    def __repr__(self):
+        return f'<DailyStudyRollup {self.user_id}/{self.subject_id} {self.day}>'
+
 class ExamMode(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -123,6 +262,51 @@ class ExamMode(db.Model):
     def __repr__(self):
         return f'<ExamMode {self.id}>'
 
+class Job(db.Model):
+    """A unit of deferred work for `flask run-jobs` (see app.jobs).
+
+    Runs once `run_at` has passed. Failed attempts are retried with
+    exponential backoff until `max_attempts`; finished rows keep their
+    timings for `flask job-stats` until they are purged.
+    """
+    __table_args__ = (
+        # Workers claim the oldest due queued job
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON keyword arguments for the task
+    status = db.Column(db.String(16), nullable=False, default='queued')  # queued, running, done or failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(64))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)  # start of the latest attempt
+    finished_at = db.Column(db.DateTime)
+    duration_ms = db.Column(db.Integer)  # of the latest attempt
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} {self.status}>'
+
+class SongBlob(db.Model):
+    """An uploaded reminder song stored once by content hash and shared by every user who uploads it."""
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), index=True, nullable=False)
+    filename = db.Column(db.String(80), unique=True, nullable=False)  # <sha256><ext>
+    size_bytes = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # When ref_count last dropped to zero; the sweeper waits a grace period after this
+    released_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<SongBlob {self.filename}>'
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    from app.user_cache import user_cache
+    return user_cache.load(int(user_id))
@@ -0,0 +1,98 @@
+"""Password hashing off the request threads.
+
+Hashes are computed in a process pool so a burst of logins uses every core
+instead of pinning the worker threads that also serve the dashboard. The
+number of hashes queued or running is bounded by PASSWORD_HASH_QUEUE; past
+that, `HashingBusy` is raised and the auth views answer 503 with
+Retry-After rather than letting requests pile up.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from flask import current_app
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool already has PASSWORD_HASH_QUEUE hashes in flight."""
+
+    def __init__(self, retry_after):
+        super().__init__('Password hashing is saturated')
+        self.retry_after = retry_after
+
+
+_lock = threading.Lock()
+_pool = None
+_slots = None
+
+
+def _executor(config):
+    global _pool, _slots
+    with _lock:
+        workers = config['PASSWORD_HASH_WORKERS'] or os.cpu_count() or 1
+        if _pool is None:
+            # spawn: forking a multi-threaded server process is unsafe
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(config['PASSWORD_HASH_QUEUE'] or workers * 2)
+        return _pool, _slots
+
+
+def _discard(pool):
+    """Drop a broken pool so the next call starts a fresh one."""
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(fn, *args):
+    config = current_app.config
+    if config['PASSWORD_HASH_WORKERS'] == 0:
+        # Inline hashing (tests, single-user setups)
+        return fn(*args)
+    pool, slots = _executor(config)
+    if not slots.acquire(timeout=config['PASSWORD_HASH_WAIT_SECONDS']):
+        raise HashingBusy(config['PASSWORD_HASH_RETRY_AFTER'])
+    try:
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool:
+            # A worker died (OOM kill, crash); retry once on a fresh pool
+            _discard(pool)
+            pool, _ = _executor(config)
+            return pool.submit(fn, *args).result()
+    finally:
+        slots.release()
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, current_app.config['PASSWORD_HASH_METHOD'])
+
+
+def verify_password(pwhash, password):
+    if not pwhash:
+        return False
+    return _run(check_password_hash, pwhash, password)
+
+
+@lru_cache(maxsize=8)
+def full_method(method):
+    """`method` with Werkzeug's defaults filled in, as it is written into a hash ('scrypt' -> 'scrypt:32768:8:1')."""
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        return 'scrypt:' + ':'.join(args or ('32768', '8', '1'))
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = args[1] if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    return method
+
+
+def needs_rehash(pwhash):
+    """True when `pwhash` was made with a method or cost other than PASSWORD_HASH_METHOD."""
+    return bool(pwhash) and pwhash.split('$', 1)[0] != full_method(current_app.config['PASSWORD_HASH_METHOD'])
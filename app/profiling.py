@@ -0,0 +1,250 @@
+"""Opt-in per-request instrumentation (enabled with PROFILING_ENABLED).
+
+For every request this records wall time, the number of SQL statements and
+the time spent in them, rows returned by ORM queries or changed by writes
+and, with PROFILE_MEMORY, the peak of Python allocations. The numbers are
+sent back in a Server-Timing header, aggregated per endpoint for the
+Prometheus-format /metrics endpoint and, when PROFILE_DUMP_DIR is set,
+requests slower than PROFILE_THRESHOLD_MS leave a cProfile dump behind.
+"""
+import cProfile
+import contextvars
+import hmac
+import os
+import re
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from collections import deque
+from flask import Response, abort, current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Mapper
+
+# Upper bounds in seconds for the request duration histogram
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+WINDOW_QUANTILES = (0.5, 0.95, 0.99)
+
+# The profile of the request running in this thread (or greenlet)
+_current = contextvars.ContextVar('request_profile', default=None)
+
+
+class RequestProfile:
+    __slots__ = ('started', 'statements', 'sql_seconds', 'rows', 'peak_memory', 'profiler')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.peak_memory = None
+        self.profiler = None
+
+
+class EndpointStats:
+    """Cumulative histogram and counters plus a rolling window of recent durations."""
+
+    def __init__(self, window):
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.count = 0
+        self.duration_sum = 0.0
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.peak_memory = 0
+        self.recent = deque(maxlen=window)
+
+    def add(self, duration, profile):
+        i = bisect_left(DURATION_BUCKETS, duration)
+        if i < len(self.buckets):
+            self.buckets[i] += 1
+        self.count += 1
+        self.duration_sum += duration
+        self.statements += profile.statements
+        self.sql_seconds += profile.sql_seconds
+        self.rows += profile.rows
+        if profile.peak_memory is not None:
+            self.peak_memory = max(self.peak_memory, profile.peak_memory)
+        self.recent.append(duration)
+
+
+class MetricsRegistry:
+    def __init__(self, window=1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def observe(self, endpoint, method, duration, profile):
+        with self._lock:
+            stats = self._stats.get((endpoint, method))
+            if stats is None:
+                stats = self._stats[(endpoint, method)] = EndpointStats(self.window)
+            stats.add(duration, profile)
+
+    def render(self):
+        """Prometheus text exposition of everything observed so far."""
+        with self._lock:
+            items = sorted(self._stats.items())
+            snapshot = [(key, s, list(s.buckets), sorted(s.recent)) for key, s in items]
+        lines = [
+            '# HELP study_request_duration_seconds Request wall time.',
+            '# TYPE study_request_duration_seconds histogram',
+        ]
+        for (endpoint, method), s, buckets, _ in snapshot:
+            labels = f'endpoint="{endpoint}",method="{method}"'
+            cumulative = 0
+            for bound, n in zip(DURATION_BUCKETS, buckets):
+                cumulative += n
+                lines.append(f'study_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'study_request_duration_seconds_bucket{{{labels},le="+Inf"}} {s.count}')
+            lines.append(f'study_request_duration_seconds_sum{{{labels}}} {s.duration_sum:.6f}')
+            lines.append(f'study_request_duration_seconds_count{{{labels}}} {s.count}')
+        lines += [
+            f'# HELP study_request_recent_duration_seconds Request wall time over the last {self.window} requests.',
+            '# TYPE study_request_recent_duration_seconds summary',
+        ]
+        for (endpoint, method), s, _, recent in snapshot:
+            labels = f'endpoint="{endpoint}",method="{method}"'
+            for q in WINDOW_QUANTILES:
+                value = recent[min(int(q * len(recent)), len(recent) - 1)]
+                lines.append(f'study_request_recent_duration_seconds{{{labels},quantile="{q}"}} {value:.6f}')
+            lines.append(f'study_request_recent_duration_seconds_sum{{{labels}}} {sum(recent):.6f}')
+            lines.append(f'study_request_recent_duration_seconds_count{{{labels}}} {len(recent)}')
+        counters = (
+            ('study_request_sql_statements_total', 'counter', 'SQL statements executed.', 'statements', '{}'),
+            ('study_request_sql_seconds_total', 'counter', 'Time spent executing SQL.', 'sql_seconds', '{:.6f}'),
+            ('study_request_rows_total', 'counter', 'ORM rows loaded plus rows changed by writes.', 'rows', '{}'),
+            ('study_request_peak_memory_bytes', 'gauge', 'Largest per-request allocation peak (PROFILE_MEMORY).',
+             'peak_memory', '{}'),
+        )
+        for name, kind, help_text, attr, fmt in counters:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            for (endpoint, method), s, _, _ in snapshot:
+                value = fmt.format(getattr(s, attr))
+                lines.append(f'{name}{{endpoint="{endpoint}",method="{method}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    if profile is None or not conn.info.get('profile_started'):
+        return
+    profile.sql_seconds += time.perf_counter() - conn.info['profile_started'].pop()
+    profile.statements += 1
+    if statement.lstrip()[:6].upper() != 'SELECT' and cursor.rowcount > 0:
+        profile.rows += cursor.rowcount
+
+
+def _on_load(target, context):
+    profile = _current.get()
+    if profile is not None:
+        profile.rows += 1
+
+
+def _listen(target, name, fn, **kw):
+    # create_app may run more than once per process (tests, CLI)
+    if not event.contains(target, name, fn):
+        event.listen(target, name, fn, **kw)
+
+
+def _dump_name(endpoint, duration):
+    safe = re.sub(r'[^A-Za-z0-9_.-]', '_', endpoint)
+    return f'{time.strftime("%Y%m%d-%H%M%S")}-{time.time_ns() % 10 ** 9:09d}-{safe}-{int(duration * 1000)}ms.prof'
+
+
+def init_profiling(app):
+    """Hook request and SQLAlchemy Engine events when PROFILING_ENABLED is set."""
+    if not app.config.get('PROFILING_ENABLED'):
+        return
+    metrics.window = app.config['PROFILING_WINDOW']
+    _listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    _listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    _listen(Mapper, 'load', _on_load)
+    track_memory = app.config['PROFILE_MEMORY']
+    dump_dir = app.config['PROFILE_DUMP_DIR']
+    threshold = app.config['PROFILE_THRESHOLD_MS'] / 1000.0
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if dump_dir:
+        os.makedirs(dump_dir, exist_ok=True)
+
+    @app.before_request
+    def start_request_profile():
+        profile = RequestProfile()
+        _current.set(profile)
+        g.request_profile = profile
+        if track_memory:
+            # Process-wide: concurrent requests inflate each other's peak
+            profile.peak_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        if dump_dir:
+            profile.profiler = cProfile.Profile()
+            try:
+                profile.profiler.enable()
+            except ValueError:
+                # Another profiler is already active in this thread
+                profile.profiler = None
+
+    @app.after_request
+    def finish_request_profile(response):
+        profile = g.pop('request_profile', None)
+        if profile is None:
+            return response
+        duration = time.perf_counter() - profile.started
+        if profile.profiler is not None:
+            profile.profiler.disable()
+        if track_memory:
+            profile.peak_memory = max(tracemalloc.get_traced_memory()[1] - profile.peak_memory, 0)
+        endpoint = request.url_rule.endpoint if request.url_rule else 'unmatched'
+        metrics.observe(endpoint, request.method, duration, profile)
+
+        timing = [
+            f'app;dur={duration * 1000:.1f}',
+            f'sql;dur={profile.sql_seconds * 1000:.1f};desc="{profile.statements} statements"',
+            f'rows;desc="{profile.rows}"',
+        ]
+        if profile.peak_memory is not None:
+            timing.append(f'mem;desc="{profile.peak_memory // 1024} KiB peak"')
+        response.headers.add('Server-Timing', ', '.join(timing))
+
+        if profile.profiler is not None and duration >= threshold:
+            path = os.path.join(dump_dir, _dump_name(endpoint, duration))
+            profile.profiler.dump_stats(path)
+            current_app.logger.info('Slow request %s %s (%.0f ms) profiled to %s',
+                                    request.method, request.path, duration * 1000, path)
+        return response
+
+    @app.teardown_request
+    def reset_request_profile(exc=None):
+        # Only still set when after_request did not run
+        profile = g.pop('request_profile', None)
+        if profile is not None and profile.profiler is not None:
+            profile.profiler.disable()
+        _current.set(None)
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+
+def metrics_view():
+    """Prometheus scrape endpoint: bearer METRICS_TOKEN; closed without one unless METRICS_ALLOW_LOOPBACK.
+
+    Behind a local reverse proxy every request comes from loopback, so that
+    fallback has to be asked for explicitly.
+    """
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not hmac.compare_digest(supplied.encode('utf-8'), token.encode('utf-8')):
+            abort(403)
+    elif not (current_app.config.get('METRICS_ALLOW_LOOPBACK') and request.remote_addr in ('127.0.0.1', '::1')):
+        abort(403)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,88 @@
+"""EXPLAIN QUERY PLAN checks for the hot queries, run against a seeded SQLite database.
+
+Each entry in HOT_QUERIES mirrors a query issued by the routes; keep them in
+step when a route's filtering or ordering changes.
+"""
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert, select, text
+from app import db
+from app.models import User, Subject, Topic, StudySession
+
+
+HOT_QUERIES = {
+    # main.complete_subject: newest open session for a subject
+    'open_session': lambda: select(StudySession).where(
+        StudySession.user_id == 1,
+        StudySession.subject_id == 1,
+        StudySession.end_time.is_(None),
+    ).order_by(StudySession.start_time.desc()).limit(1),
+    # main.dashboard: recent sessions
+    'recent_sessions': lambda: select(StudySession).where(StudySession.user_id == 1)
+    .order_by(StudySession.start_time.desc()).limit(5),
+    # main.dashboard / api.get_subjects: a user's active subjects, keyset-paginated
+    'active_subjects': lambda: select(Subject).where(
+        Subject.user_id == 1, Subject.is_active == True, Subject.id > 0,
+    ).order_by(Subject.id).limit(51),
+    # api.load_active_topics / Subject.active_topics: topics for a page of subjects
+    'active_topics': lambda: select(Topic).where(
+        Topic.subject_id.in_([1, 2, 3]), Topic.is_active == True,
+    ).order_by(Topic.subject_id, Topic.id),
+}
+
+
+def seed(engine, users=200, subjects_per_user=20, topics_per_subject=5, sessions_per_subject=25):
+    """Create the schema and fill it with `users` worth of synthetic rows, then ANALYZE."""
+    db.metadata.create_all(engine)
+    rng = random.Random(0)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {'id': u, 'username': f'user{u}', 'email': f'user{u}@example.com',
+             'first_name': 'Seed', 'last_name': str(u), 'password_hash': ''}
+            for u in range(1, users + 1)
+        ])
+        subjects, topics, sessions = [], [], []
+        for u in range(1, users + 1):
+            for _ in range(subjects_per_user):
+                sid = len(subjects) + 1
+                subjects.append({'id': sid, 'name': f'Subject {sid}', 'user_id': u,
+                                 'is_active': rng.random() > 0.1})
+                topics.extend({'name': f'Topic {sid}.{t}', 'subject_id': sid, 'is_active': True}
+                              for t in range(topics_per_subject))
+                for _ in range(sessions_per_subject):
+                    start = now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+                    # Roughly one open session in fifty
+                    end = None if rng.random() < 0.02 else start + timedelta(minutes=45)
+                    sessions.append({'user_id': u, 'subject_id': sid, 'start_time': start, 'end_time': end})
+        conn.execute(insert(Subject), subjects)
+        conn.execute(insert(Topic), topics)
+        conn.execute(insert(StudySession), sessions)
+        conn.execute(text('ANALYZE'))
+
+
+def explain(engine, stmt):
+    sql = str(stmt.compile(engine, compile_kwargs={'literal_binds': True}))
+    with engine.connect() as conn:
+        return [row[-1] for row in conn.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+
+
+def full_scans(engine):
+    """Return {query_name: plan} for every hot query whose plan scans a table or index end to end."""
+    failures = {}
+    for name, build in HOT_QUERIES.items():
+        plan = explain(engine, build())
+        if any(step.startswith('SCAN ') for step in plan):
+            failures[name] = plan
+    return failures
+
+
+def check_query_plans(path, **seed_kwargs):
+    """Seed a fresh SQLite file at `path` and return (plans, failures)."""
+    engine = create_engine(f'sqlite:///{path}')
+    try:
+        seed(engine, **seed_kwargs)
+        plans = {name: explain(engine, build()) for name, build in HOT_QUERIES.items()}
+        return plans, full_scans(engine)
+    finally:
+        engine.dispose()
@@ -0,0 +1,215 @@
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from app.events import broker
+
+
+END = 'end'
+EXTRA = 'extra'
+BREAK = 'break'
+
+
+def user_timezone(utc_offset):
+    """Fixed-offset tzinfo for `utc_offset` minutes east of UTC; None means the server's local time."""
+    return None if utc_offset is None else timezone(timedelta(minutes=utc_offset))
+
+
+def offset_from_browser(tz_offset):
+    """Minutes east of UTC from a browser's `Date.getTimezoneOffset()` value; None if missing or out of range."""
+    if tz_offset is None or abs(tz_offset) > 14 * 60:
+        return None
+    return -tz_offset
+
+
+def next_end_timestamp(end_hour, end_minute, now=None, utc_offset=None):
+    """Epoch time of the next end_hour:end_minute in the user's time, still counting the current minute."""
+    now = now or datetime.now(user_timezone(utc_offset))
+    due = now.replace(hour=end_hour or 0, minute=end_minute or 0, second=0, microsecond=0)
+    if due + timedelta(minutes=1) <= now:
+        due += timedelta(days=1)
+    return due.timestamp()
+
+
+def utc_to_timestamp(dt):
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+def local_date(ts, utc_offset=None):
+    return datetime.fromtimestamp(ts, user_timezone(utc_offset)).date()
+
+
+class ReminderScheduler:
+    """Server-side reminder clock for users with an open event stream.
+
+    Upcoming subject end times and `extra_reminder_at` values live in a single
+    min-heap ordered by due time. Updates are incremental: re-scheduling a
+    subject pushes a new entry and invalidates the old one lazily, so no
+    heap rebuild is needed. Deliveries are de-duplicated per user, subject,
+    reminder kind and day, and finishing a subject suppresses the rest of
+    that day's end-time reminder. End times and days are in the user's own
+    time, from the UTC offset their browser reported when the event stream
+    opened (the server's local time if it did not). The end of a lunch break
+    rides on the same heap so open dashboards learn about it without polling.
+    """
+
+    def __init__(self, publish=None):
+        self.publish = publish
+        self._heap = []
+        self._seq = itertools.count()
+        # (user_id, subject_id, kind) -> seq of the only live heap entry for that key
+        self._live = {}
+        self._names = {}
+        self._loaded_users = set()
+        # user_id -> minutes east of UTC, absent for the server's local time
+        self._offsets = {}
+        # (user_id, subject_id, kind) -> day it was last delivered (or the subject finished)
+        self._delivered = {}
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='reminder-scheduler', daemon=True)
+            self._thread.start()
+
+    def _push(self, due_ts, user_id, subject_id, kind):
+        seq = next(self._seq)
+        self._live[(user_id, subject_id, kind)] = seq
+        heapq.heappush(self._heap, (due_ts, seq, user_id, subject_id, kind))
+
+    def _schedule_locked(self, subject):
+        key = (subject.user_id, subject.id)
+        self._names[key] = subject.name
+        self._live.pop(key + (END,), None)
+        self._live.pop(key + (EXTRA,), None)
+        if not subject.is_active:
+            return
+        utc_offset = self._offsets.get(subject.user_id)
+        self._push(next_end_timestamp(subject.end_hour, subject.end_minute, utc_offset=utc_offset),
+                   subject.user_id, subject.id, END)
+        if subject.extra_reminder_at and subject.extra_reminder_at > datetime.utcnow():
+            self._push(utc_to_timestamp(subject.extra_reminder_at), subject.user_id, subject.id, EXTRA)
+        today = local_date(time.time(), utc_offset)
+        if subject.finished_at and local_date(utc_to_timestamp(subject.finished_at), utc_offset) == today:
+            self._delivered[key + (END,)] = today
+
+    def load_user(self, user_id, subjects, break_until=None, utc_offset=None):
+        """Start tracking a user's subjects at `utc_offset` minutes east of UTC.
+
+        A no-op if they are already tracked at that offset; a new offset
+        (another tab after a DST change, say) reschedules their end times.
+        """
+        with self._cond:
+            if user_id in self._loaded_users and self._offsets.get(user_id) == utc_offset:
+                return
+            self._loaded_users.add(user_id)
+            if utc_offset is None:
+                self._offsets.pop(user_id, None)
+            else:
+                self._offsets[user_id] = utc_offset
+            for subject in subjects:
+                self._schedule_locked(subject)
+            if break_until and break_until > datetime.utcnow():
+                self._push(utc_to_timestamp(break_until), user_id, None, BREAK)
+            self._ensure_thread()
+            self._cond.notify()
+
+    def utc_offset(self, user_id):
+        """The UTC offset a tracked user's browser reported, or None."""
+        with self._cond:
+            return self._offsets.get(user_id)
+
+    def is_tracking(self, user_id):
+        with self._cond:
+            return user_id in self._loaded_users
+
+    def unload_user(self, user_id):
+        with self._cond:
+            self._loaded_users.discard(user_id)
+            self._offsets.pop(user_id, None)
+            for key in [k for k in self._live if k[0] == user_id]:
+                del self._live[key]
+            for key in [k for k in self._delivered if k[0] == user_id]:
+                del self._delivered[key]
+            for key in [k for k in self._names if k[0] == user_id]:
+                del self._names[key]
+            self._compact_locked()
+
+    def schedule_subject(self, subject):
+        """(Re)schedule a subject after it was added or edited."""
+        with self._cond:
+            if subject.user_id not in self._loaded_users:
+                return
+            self._schedule_locked(subject)
+            self._cond.notify()
+
+    def unschedule_subject(self, user_id, subject_id):
+        with self._cond:
+            self._live.pop((user_id, subject_id, END), None)
+            self._live.pop((user_id, subject_id, EXTRA), None)
+            self._names.pop((user_id, subject_id), None)
+
+    def schedule_break_end(self, user_id, break_until):
+        """Track when a user's break ends; `None` cancels a running break."""
+        with self._cond:
+            self._live.pop((user_id, None, BREAK), None)
+            if user_id not in self._loaded_users or break_until is None:
+                return
+            self._push(utc_to_timestamp(break_until), user_id, None, BREAK)
+            self._cond.notify()
+
+    def mark_finished(self, user_id, subject_id):
+        with self._cond:
+            self._delivered[(user_id, subject_id, END)] = local_date(time.time(), self._offsets.get(user_id))
+
+    def _compact_locked(self):
+        # Stale entries are normally discarded as they surface; rebuild only when they dominate
+        if len(self._heap) > 2 * len(self._live) + 64:
+            self._heap = [e for e in self._heap if self._live.get((e[2], e[3], e[4])) == e[1]]
+            heapq.heapify(self._heap)
+
+    def _pop_due_locked(self):
+        """Pop the next due, still-live entry, waiting until one is due."""
+        while True:
+            now = time.time()
+            while self._heap and self._live.get(self._heap[0][2:]) != self._heap[0][1]:
+                heapq.heappop(self._heap)
+            if self._heap and self._heap[0][0] <= now:
+                return heapq.heappop(self._heap)
+            self._cond.wait(self._heap[0][0] - now if self._heap else None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                due_ts, seq, user_id, subject_id, kind = self._pop_due_locked()
+                key = (user_id, subject_id, kind)
+                del self._live[key]
+                if kind == BREAK:
+                    event, payload = 'break', {'is_on_break': False, 'until': None}
+                else:
+                    event, payload = 'reminder', self._due_reminder_locked(due_ts, user_id, subject_id, kind)
+                    if payload is None:
+                        continue
+            if self.publish is not None:
+                self.publish(user_id, event, payload)
+
+    def _due_reminder_locked(self, due_ts, user_id, subject_id, kind):
+        key = (user_id, subject_id, kind)
+        if kind == END:
+            # End times recur daily
+            self._push(due_ts + 86400, user_id, subject_id, END)
+        day = local_date(due_ts, self._offsets.get(user_id))
+        if self._delivered.get(key) == day:
+            return None
+        self._delivered[key] = day
+        return {
+            'subject_id': subject_id,
+            'name': self._names.get((user_id, subject_id)),
+            'kind': kind,
+            'due_at': datetime.fromtimestamp(due_ts, timezone.utc).isoformat().replace('+00:00', 'Z'),
+        }
+
+
+reminder_scheduler = ReminderScheduler(publish=broker.publish)
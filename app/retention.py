@@ -0,0 +1,56 @@
+"""Retention for study sessions.
+
+Closed sessions are only read in bulk through the daily rollups, which are
+updated as each session closes. Once a session is older than the retention
+horizon, `archive_sessions` moves it to ArchivedStudySession and the hot
+study_session table keeps only recent and open sessions. That includes the
+zero-length finish stamps that complete_subject writes every day.
+`rebuild_rollups` reads both tables, so archiving never changes a rollup.
+
+Archiving works in batches of ascending ids, one transaction per batch, so
+it can run while the app is serving requests. Sessions still counted by an
+upcoming exam's plan stay hot until the exam has passed.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import and_, delete, exists, insert, literal, select
+from app import db
+from app.models import ArchivedStudySession, ExamMode, StudySession
+from app.search import reindex
+
+COLUMNS = ('id', 'user_id', 'subject_id', 'topic_id', 'start_time', 'end_time', 'actual_duration_minutes',
+           'notes', 'rating', 'completed', 'created_at')
+
+
+def archivable(before, now):
+    """Ids of closed sessions that ended before `before` and no upcoming exam depends on."""
+    exam_pending = exists().where(and_(
+        ExamMode.subject_id == StudySession.subject_id,
+        ExamMode.is_active == True,
+        ExamMode.exam_date > now,
+        ExamMode.created_at <= StudySession.end_time,
+    ))
+    return select(StudySession.id).where(
+        StudySession.end_time.isnot(None), StudySession.end_time < before, ~exam_pending)
+
+
+def archive_sessions(days, batch_size=1000, max_batches=None, now=None):
+    """Move sessions that ended more than `days` days ago to the archive. Returns the number moved."""
+    now = now or datetime.utcnow()
+    eligible = archivable(now - timedelta(days=days), now)
+    moved, batches, last_id = 0, 0, 0
+    while max_batches is None or batches < max_batches:
+        ids = db.session.execute(eligible.where(StudySession.id > last_id)
+                                 .order_by(StudySession.id).limit(batch_size)).scalars().all()
+        if not ids:
+            break
+        db.session.execute(insert(ArchivedStudySession).from_select(
+            COLUMNS + ('archived_at',),
+            select(*[getattr(StudySession, c) for c in COLUMNS], literal(now)).where(StudySession.id.in_(ids))))
+        db.session.execute(delete(StudySession).where(StudySession.id.in_(ids))
+                           .execution_options(synchronize_session=False))
+        reindex('session', ids)
+        db.session.commit()
+        moved += len(ids)
+        batches += 1
+        last_id = ids[-1]
+    return moved
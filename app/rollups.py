@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+from sqlalchemy import and_, case, func, insert, select, union_all
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import ArchivedStudySession, DailyStudyRollup, StudySession
+
+# complete_subject stamps zero-length sessions with this note when nothing was open. Completed
+# sessions are marked by StudySession.completed; a stamp is a completed session with this note.
+FINISH_STAMP = 'subject_finished'
+
+
+def record_session(user_id, subject_id, day, minutes=0, sessions=0, completions=0):
+    """Add a closed session's totals to its day's rollup row; the caller commits."""
+    values = {
+        DailyStudyRollup.minutes: DailyStudyRollup.minutes + minutes,
+        DailyStudyRollup.sessions: DailyStudyRollup.sessions + sessions,
+        DailyStudyRollup.completions: DailyStudyRollup.completions + completions,
+    }
+    key = dict(user_id=user_id, subject_id=subject_id, day=day)
+    if DailyStudyRollup.query.filter_by(**key).update(values, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(DailyStudyRollup(minutes=minutes, sessions=sessions, completions=completions, **key))
+    except IntegrityError:
+        # Another request created today's row first
+        DailyStudyRollup.query.filter_by(**key).update(values, synchronize_session=False)
+
+
+def rebuild_rollups(user_id=None):
+    """Recompute rollups from raw sessions, hot and archived (backfill / repair). Returns rows written."""
+    delete = DailyStudyRollup.query
+    parts = []
+    for model in (StudySession, ArchivedStudySession):
+        part = select(model.user_id, model.subject_id, model.end_time, model.actual_duration_minutes, model.notes,
+                      model.completed).where(model.end_time.isnot(None))
+        if user_id is not None:
+            part = part.where(model.user_id == user_id)
+        parts.append(part)
+    raw = union_all(*parts).subquery()
+    day = func.date(raw.c.end_time)
+    sessions = select(
+        raw.c.user_id,
+        raw.c.subject_id,
+        day.label('day'),
+        func.coalesce(func.sum(raw.c.actual_duration_minutes), 0),
+        func.sum(case((and_(raw.c.completed, raw.c.notes == FINISH_STAMP), 0), else_=1)),
+        func.sum(case((raw.c.completed, 1), else_=0)),
+    ).group_by(raw.c.user_id, raw.c.subject_id, day)
+    if user_id is not None:
+        delete = delete.filter_by(user_id=user_id)
+    delete.delete(synchronize_session=False)
+    result = db.session.execute(insert(DailyStudyRollup).from_select(
+        ['user_id', 'subject_id', 'day', 'minutes', 'sessions', 'completions'], sessions))
+    db.session.commit()
+    return result.rowcount
+
+
+def study_stats(user_id, days, today=None):
+    """Daily totals, per-subject totals and the completion streak over the last `days` days.
+
+    Reads one rollup row per subject and day, never raw sessions.
+    """
+    today = today or datetime.utcnow().date()
+    start = today - timedelta(days=days - 1)
+    rows = db.session.query(
+        DailyStudyRollup.day,
+        DailyStudyRollup.subject_id,
+        DailyStudyRollup.minutes,
+        DailyStudyRollup.sessions,
+        DailyStudyRollup.completions,
+    ).filter(DailyStudyRollup.user_id == user_id, DailyStudyRollup.day >= start).all()
+
+    by_day = {}
+    by_subject = {}
+    for day, subject_id, minutes, sessions, completions in rows:
+        d = by_day.setdefault(day, {'date': day.isoformat(), 'minutes': 0, 'sessions': 0, 'completions': 0})
+        s = by_subject.setdefault(subject_id, {'subject_id': subject_id, 'minutes': 0, 'sessions': 0, 'completions': 0})
+        for target in (d, s):
+            target['minutes'] += minutes
+            target['sessions'] += sessions
+            target['completions'] += completions
+
+    # Consecutive days with at least one completion, ending today (or yesterday if today has none yet)
+    streak = 0
+    cursor = today if by_day.get(today, {}).get('completions') else today - timedelta(days=1)
+    while cursor >= start and by_day.get(cursor, {}).get('completions'):
+        streak += 1
+        cursor -= timedelta(days=1)
+
+    return {
+        'days': [by_day[d] for d in sorted(by_day)],
+        'subjects': sorted(by_subject.values(), key=lambda s: s['subject_id']),
+        'today_minutes': by_day.get(today, {}).get('minutes', 0),
+        'completion_streak': streak,
+    }
+
+
+def minutes_studied_on(user_id, day):
+    return db.session.query(func.coalesce(func.sum(DailyStudyRollup.minutes), 0))\
+        .filter(DailyStudyRollup.user_id == user_id, DailyStudyRollup.day == day).scalar()
@@ -0,0 +1,191 @@
+"""Per-user interval index over subjects' daily time windows.
+
+Each active subject occupies [start, end) in minutes of the user's day; a
+window whose end is before its start runs past midnight and is split in
+two. The index keeps the windows sorted by start plus the sorted
+elementary segments between all boundaries, each with the subjects covering
+it, so "what is on at t", "what starts next" and "what overlaps [s, e)" are
+a bisect away regardless of how many subjects a user has.
+
+Indexes are cached per process and tagged with the `User.data_version`
+they reflect. A cached index is never changed once readers can see it. A
+write in this process passes the version it committed; an index tagged
+with the version just before it is copied, updated and swapped in, any
+other is dropped (it missed a write, or a rebuild already includes this one).
+Changes from other workers or unrelated writes show up as a version
+mismatch and the index is rebuilt from one query.
+"""
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from app.models import Subject
+
+DAY_MINUTES = 24 * 60
+
+
+def window_minutes(start_hour, start_minute, end_hour, end_minute):
+    """[start, end) pieces of a daily window in minutes; empty for zero-length windows."""
+    start = (start_hour or 0) * 60 + (start_minute or 0)
+    end = (end_hour or 0) * 60 + (end_minute or 0)
+    if start == end:
+        return []
+    if end < start:
+        return [(start, DAY_MINUTES), (0, end)]
+    return [(start, end)]
+
+
+class ScheduleIndex:
+    def __init__(self, subjects=(), version=None):
+        self.version = version
+        self._subjects = {}   # subject_id -> (name, start_hour, start_minute, end_hour, end_minute)
+        self._starts = []     # sorted (start, end, subject_id) pieces
+        self._firsts = []     # sorted (start, subject_id) of each window's first piece, its real start
+        self._segs = None     # (segment boundaries, covering subject ids), rebuilt lazily after writes
+        for s in subjects:
+            self.upsert(s.id, s.name, s.start_hour, s.start_minute, s.end_hour, s.end_minute)
+
+    def copy(self):
+        """An independent index with the same windows, for copy-on-write updates."""
+        index = ScheduleIndex(version=self.version)
+        index._subjects = dict(self._subjects)
+        index._starts = list(self._starts)
+        index._firsts = list(self._firsts)
+        index._segs = self._segs
+        return index
+
+    def __len__(self):
+        return len(self._subjects)
+
+    def upsert(self, subject_id, name, start_hour, start_minute, end_hour, end_minute):
+        self.remove(subject_id)
+        self._subjects[subject_id] = (name, start_hour, start_minute, end_hour, end_minute)
+        pieces = window_minutes(start_hour, start_minute, end_hour, end_minute)
+        for start, end in pieces:
+            insort(self._starts, (start, end, subject_id))
+        if pieces:
+            insort(self._firsts, (pieces[0][0], subject_id))
+        self._segs = None
+
+    def remove(self, subject_id):
+        if self._subjects.pop(subject_id, None) is None:
+            return
+        self._starts = [piece for piece in self._starts if piece[2] != subject_id]
+        self._firsts = [first for first in self._firsts if first[1] != subject_id]
+        self._segs = None
+
+    def _segments(self):
+        # Concurrent readers may both build it; each publishes a complete pair in one assignment
+        segs = self._segs
+        if segs is None:
+            points = sorted({p for start, end, _ in self._starts for p in (start, end)})
+            cover = [set() for _ in points]
+            for start, end, subject_id in self._starts:
+                for i in range(bisect_left(points, start), bisect_left(points, end)):
+                    cover[i].add(subject_id)
+            segs = self._segs = (points, [frozenset(c) for c in cover])
+        return segs
+
+    def describe(self, subject_id):
+        name, sh, sm, eh, em = self._subjects[subject_id]
+        return {'id': subject_id, 'name': name, 'start_hour': sh, 'start_minute': sm,
+                'end_hour': eh, 'end_minute': em}
+
+    def active_at(self, minute):
+        """Ids of the subjects whose window covers `minute`."""
+        points, cover = self._segments()
+        i = bisect_right(points, minute) - 1
+        if i < 0:
+            return []
+        return sorted(cover[i])
+
+    def next_after(self, minute):
+        """(subject_id, start_minute, days_ahead) of the next window starting after `minute`, or None.
+
+        The after-midnight piece of a window that runs past midnight is not a start.
+        """
+        firsts = self._firsts
+        i = bisect_right(firsts, (minute, float('inf')))
+        if i < len(firsts):
+            start, subject_id = firsts[i]
+            return subject_id, start, 0
+        if firsts:
+            start, subject_id = firsts[0]
+            return subject_id, start, 1
+        return None
+
+    def overlapping(self, start_hour, start_minute, end_hour, end_minute, exclude=None):
+        """Ids of the subjects whose window overlaps the given one."""
+        found = set()
+        windows = window_minutes(start_hour, start_minute, end_hour, end_minute)
+        if self._segs is None:
+            # Right after a write (imports check row after row): one pass beats rebuilding the segments
+            for start, end in windows:
+                for piece_start, piece_end, subject_id in self._starts:
+                    if piece_start >= end:
+                        break
+                    if piece_end > start:
+                        found.add(subject_id)
+        else:
+            points, cover = self._segs
+            for start, end in windows:
+                i = max(bisect_right(points, start) - 1, 0)
+                while i < len(points) and points[i] < end:
+                    found |= cover[i]
+                    i += 1
+        found.discard(exclude)
+        return sorted(found)
+
+
+class ScheduleRegistry:
+    """LRU of per-user ScheduleIndex objects, validated against User.data_version."""
+
+    def __init__(self, size=1024):
+        self.size = size
+        self._lock = threading.Lock()
+        self._indexes = OrderedDict()
+
+    def get(self, user):
+        """The user's index, rebuilt from the database if it is missing or stale."""
+        version = user.data_version
+        with self._lock:
+            index = self._indexes.get(user.id)
+            if index is not None and index.version == version:
+                self._indexes.move_to_end(user.id)
+                return index
+        subjects = Subject.query.filter_by(user_id=user.id, is_active=True).all()
+        index = ScheduleIndex(subjects, version)
+        with self._lock:
+            self._indexes[user.id] = index
+            self._indexes.move_to_end(user.id)
+            while len(self._indexes) > self.size:
+                self._indexes.popitem(last=False)
+        return index
+
+    def apply(self, user_id, version, upserts=(), removals=()):
+        """Fold one committed write, which bumped data_version to `version`, into a cached index."""
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                return
+            if index.version is None or index.version != version - 1:
+                # Built before an earlier write or after this one; the next get() rebuilds it
+                del self._indexes[user_id]
+                return
+            # Requests may be reading the cached index outside the lock; update a copy and swap it in
+            index = index.copy()
+            for s in upserts:
+                if s.is_active:
+                    index.upsert(s.id, s.name, s.start_hour, s.start_minute, s.end_hour, s.end_minute)
+                else:
+                    index.remove(s.id)
+            for subject_id in removals:
+                index.remove(subject_id)
+            index.version = version
+            self._indexes[user_id] = index
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._indexes.pop(user_id, None)
+
+
+schedule_indexes = ScheduleRegistry()
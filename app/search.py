@@ -0,0 +1,340 @@
+"""Full-text search over a user's subjects, topics and study session notes.
+
+On SQLite the index is an FTS5 table, `search_index`, maintained by
+triggers on subject, topic and study_session. Bulk inserts and deletes
+stay in sync with no help from the application. Each row carries an
+`owner` token (`u<user id>`), so a search only walks the postings of that
+user. Results are ranked with bm25, with names weighted above descriptions
+and notes.
+
+Other databases use an inverted index in the `search_term` table: one row
+per distinct word of a row's name (weight 2) or description and notes
+(weight 1). It is maintained from ORM flushes. Rows inserted with bulk
+statements are reindexed explicitly (`reindex`); rows bulk-deleted along
+with their subject go when the subject does. Results are ranked by the
+summed weight of the matched words.
+
+Both support prefix matching: every word of the query must start a word of
+the row.
+"""
+import re
+import unicodedata
+from sqlalchemy import case, delete, event, func, insert, or_, select, text
+from sqlalchemy.orm import Session
+from app import db
+from app.models import Subject, Topic, StudySession, SearchTerm
+# Finish stamps are notes in name only and stay out of the index
+from app.rollups import FINISH_STAMP
+
+KINDS = ('subject', 'topic', 'session')
+_WORD = re.compile(r'\w+', re.UNICODE)
+MAX_TERM = 64  # SearchTerm.term length
+MAX_TOKENS = 8  # query words used
+# Shorter query words only match whole words: a one-letter prefix matches most of the index
+MIN_PREFIX = 2
+
+FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "owner, title, body, kind UNINDEXED, object_id UNINDEXED, subject_id UNINDEXED, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    # rowid = id * 4 + kind code, so triggers find a row's entry without a lookup
+    """CREATE TRIGGER IF NOT EXISTS search_subject_ai AFTER INSERT ON subject WHEN NEW.is_active BEGIN
+        INSERT INTO search_index(rowid, owner, title, body, kind, object_id, subject_id)
+        VALUES (NEW.id * 4 + 1, 'u' || NEW.user_id, NEW.name, coalesce(NEW.description, ''), 'subject', NEW.id, NEW.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_subject_au AFTER UPDATE OF name, description, is_active ON subject BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 4 + 1;
+        INSERT INTO search_index(rowid, owner, title, body, kind, object_id, subject_id)
+        SELECT NEW.id * 4 + 1, 'u' || NEW.user_id, NEW.name, coalesce(NEW.description, ''), 'subject', NEW.id, NEW.id
+        WHERE NEW.is_active;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_subject_ad AFTER DELETE ON subject BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 4 + 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_topic_ai AFTER INSERT ON topic WHEN NEW.is_active BEGIN
+        INSERT INTO search_index(rowid, owner, title, body, kind, object_id, subject_id)
+        SELECT NEW.id * 4 + 2, 'u' || user_id, NEW.name, coalesce(NEW.description, ''), 'topic', NEW.id, NEW.subject_id
+        FROM subject WHERE id = NEW.subject_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_topic_au AFTER UPDATE OF name, description, is_active, subject_id ON topic BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 4 + 2;
+        INSERT INTO search_index(rowid, owner, title, body, kind, object_id, subject_id)
+        SELECT NEW.id * 4 + 2, 'u' || user_id, NEW.name, coalesce(NEW.description, ''), 'topic', NEW.id, NEW.subject_id
+        FROM subject WHERE id = NEW.subject_id AND NEW.is_active;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_topic_ad AFTER DELETE ON topic BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 4 + 2;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS search_session_ai AFTER INSERT ON study_session
+        WHEN NEW.notes IS NOT NULL AND NEW.notes != '{FINISH_STAMP}' BEGIN
+        INSERT INTO search_index(rowid, owner, title, body, kind, object_id, subject_id)
+        VALUES (NEW.id * 4 + 3, 'u' || NEW.user_id, '', NEW.notes, 'session', NEW.id, NEW.subject_id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS search_session_au AFTER UPDATE OF notes ON study_session BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 4 + 3;
+        INSERT INTO search_index(rowid, owner, title, body, kind, object_id, subject_id)
+        SELECT NEW.id * 4 + 3, 'u' || NEW.user_id, '', NEW.notes, 'session', NEW.id, NEW.subject_id
+        WHERE NEW.notes IS NOT NULL AND NEW.notes != '{FINISH_STAMP}';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_session_ad AFTER DELETE ON study_session BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 4 + 3;
+    END""",
+]
+
+FTS_FILL = [
+    "DELETE FROM search_index",
+    """INSERT INTO search_index(rowid, owner, title, body, kind, object_id, subject_id)
+       SELECT id * 4 + 1, 'u' || user_id, name, coalesce(description, ''), 'subject', id, id FROM subject WHERE is_active""",
+    """INSERT INTO search_index(rowid, owner, title, body, kind, object_id, subject_id)
+       SELECT t.id * 4 + 2, 'u' || s.user_id, t.name, coalesce(t.description, ''), 'topic', t.id, t.subject_id
+       FROM topic t JOIN subject s ON s.id = t.subject_id WHERE t.is_active""",
+    f"""INSERT INTO search_index(rowid, owner, title, body, kind, object_id, subject_id)
+       SELECT id * 4 + 3, 'u' || user_id, '', notes, 'session', id, subject_id FROM study_session
+       WHERE notes IS NOT NULL AND notes != '{FINISH_STAMP}'""",
+]
+
+
+def uses_fts(bind):
+    return bind.dialect.name == 'sqlite'
+
+
+def fold(word):
+    """Lowercase without diacritics, like FTS5's unicode61 tokenizer with remove_diacritics."""
+    word = unicodedata.normalize('NFKD', word.lower())
+    return ''.join(c for c in word if not unicodedata.combining(c))
+
+
+def words(value):
+    return [fold(w)[:MAX_TERM] for w in _WORD.findall(value or '')]
+
+
+def _create_fts(target, connection, **kw):
+    if uses_fts(connection):
+        for statement in FTS_DDL:
+            connection.exec_driver_sql(statement)
+
+
+event.listen(db.metadata, 'after_create', _create_fts)
+
+
+# Inverted index (non-SQLite)
+
+def _terms(kind, object_id, user_id, subject_id, title, body):
+    weights = {}
+    for weight, value in ((2, title), (1, body)):
+        for word in words(value):
+            weights[word] = max(weights.get(word, 0), weight)
+    return [{'user_id': user_id, 'kind': kind, 'object_id': object_id, 'subject_id': subject_id,
+             'term': term, 'weight': weight} for term, weight in weights.items()]
+
+
+def _entry(obj):
+    """(kind, id, user_id, subject_id, title, body) to index for `obj`, or (kind, id) to drop."""
+    if isinstance(obj, Subject):
+        if obj.is_active:
+            return 'subject', obj.id, obj.user_id, obj.id, obj.name, obj.description
+        return 'subject', obj.id
+    if isinstance(obj, Topic):
+        if obj.is_active:
+            # The owner is looked up from the subject when written
+            return 'topic', obj.id, None, obj.subject_id, obj.name, obj.description
+        return 'topic', obj.id
+    if isinstance(obj, StudySession):
+        if obj.notes and obj.notes != FINISH_STAMP:
+            return 'session', obj.id, obj.user_id, obj.subject_id, '', obj.notes
+        return 'session', obj.id
+    return None
+
+
+def _rows(connection, entries):
+    """search_term rows for index entries, looking up the owners of topics in one query."""
+    missing = {e[3] for e in entries if e[2] is None}
+    owners = {}
+    if missing:
+        owners = dict(connection.execute(select(Subject.id, Subject.user_id).where(Subject.id.in_(missing))).all())
+    rows = []
+    for kind, object_id, user_id, subject_id, title, body in entries:
+        user_id = user_id if user_id is not None else owners.get(subject_id)
+        if user_id is not None:
+            rows.extend(_terms(kind, object_id, user_id, subject_id, title, body))
+    return rows
+
+
+def _write(connection, entries, deleted_subjects=()):
+    for kind in KINDS:
+        ids = [e[1] for e in entries if e[0] == kind]
+        if ids:
+            connection.execute(delete(SearchTerm).where(SearchTerm.kind == kind, SearchTerm.object_id.in_(ids)))
+    if deleted_subjects:
+        # Topics and sessions removed with bulk deletes before their subject went
+        connection.execute(delete(SearchTerm).where(SearchTerm.subject_id.in_(deleted_subjects)))
+    rows = _rows(connection, [e for e in entries if len(e) > 2])
+    if rows:
+        connection.execute(insert(SearchTerm), rows)
+
+
+def _after_flush(session, flush_context):
+    if uses_fts(session.get_bind()):
+        return
+    entries = [_entry(obj) for obj in session.new | session.dirty]
+    entries = [e for e in entries if e is not None]
+    for obj in session.deleted:
+        entry = _entry(obj)
+        if entry is not None:
+            entries.append(entry[:2])
+    deleted_subjects = [obj.id for obj in session.deleted if isinstance(obj, Subject)]
+    if entries:
+        _write(session.connection(), entries, deleted_subjects)
+
+
+def register_search_indexing():
+    if not event.contains(Session, 'after_flush', _after_flush):
+        event.listen(Session, 'after_flush', _after_flush)
+
+
+def reindex(kind, ids):
+    """Refresh the inverted index for rows written with bulk statements (no-op on SQLite)."""
+    if uses_fts(db.session.get_bind()) or not ids:
+        return
+    model = {'subject': Subject, 'topic': Topic, 'session': StudySession}[kind]
+    objects = {o.id: o for o in model.query.filter(model.id.in_(list(ids)))}
+    _write(db.session.connection(), [_entry(objects[i]) if i in objects else (kind, i) for i in ids])
+
+
+def rebuild_search_index(batch_size=1000):
+    """Rebuild the whole index from the tables. Returns the number of rows indexed."""
+    connection = db.session.connection()
+    if uses_fts(connection):
+        for statement in FTS_DDL + FTS_FILL:
+            connection.exec_driver_sql(statement)
+        count = connection.exec_driver_sql('SELECT count(*) FROM search_index').scalar()
+        db.session.commit()
+        return count
+    connection.execute(delete(SearchTerm))
+    count = 0
+    for model in (Subject, Topic, StudySession):
+        entries = []
+        for obj in model.query.order_by(model.id).yield_per(batch_size):
+            entry = _entry(obj)
+            if len(entry) > 2:
+                entries.append(entry)
+            if len(entries) == batch_size:
+                count += _insert_rows(connection, entries)
+                entries = []
+        count += _insert_rows(connection, entries)
+    db.session.commit()
+    return count
+
+
+def _insert_rows(connection, entries):
+    rows = _rows(connection, entries)
+    if rows:
+        connection.execute(insert(SearchTerm), rows)
+    return len(entries)
+
+
+# Queries
+
+def _match(token):
+    """FTS5 query term for a token; single characters match whole words only."""
+    return f'"{token}"' if len(token) < MIN_PREFIX else f'"{token}"*'
+
+
+def _snippet(value, tokens, width=12):
+    """About `width` words of `value` around the first word a token starts, matches in [brackets]."""
+    found = list(_WORD.finditer(value or ''))
+    if not found:
+        return ''
+
+    def hit(word):
+        word = fold(word)
+        return any(word == t if len(t) < MIN_PREFIX else word.startswith(t) for t in tokens)
+
+    first = next((i for i, m in enumerate(found) if hit(m.group())), 0)
+    start = max(first - width // 4, 0)
+    window = found[start:start + width]
+    parts = ['…'] if start else []
+    for m in window:
+        parts.append(f'[{m.group()}]' if hit(m.group()) else m.group())
+    if start + width < len(found):
+        parts.append('…')
+    return ' '.join(parts)
+
+
+def _active_subjects(user_id):
+    return select(Subject.id).where(Subject.user_id == user_id, Subject.is_active == True)
+
+
+def _search_fts(user_id, tokens, limit):
+    # Snippets are built from the top rows only; snippet() would run for every match
+    rows = db.session.execute(text(
+        "SELECT rowid, kind, object_id, subject_id, title, bm25(search_index, 0, 10, 1) AS score "
+        "FROM search_index WHERE search_index MATCH :query "
+        "AND subject_id IN (SELECT id FROM subject WHERE user_id = :user_id AND is_active) "
+        "ORDER BY score LIMIT :limit"
+    ), {'query': f'owner:u{user_id} AND {{title body}}: ({" AND ".join(_match(t) for t in tokens)})',
+        'user_id': user_id, 'limit': limit}).all()
+    bodies = {}
+    if rows:
+        bodies = dict(db.session.execute(text(
+            f"SELECT rowid, body FROM search_index WHERE rowid IN ({', '.join(str(r.rowid) for r in rows)})"
+        )).all())
+    return [{'kind': kind, 'id': object_id, 'subject_id': subject_id, 'title': title,
+             'snippet': _snippet(bodies.get(rowid), tokens), 'score': round(-score, 4)}
+            for rowid, kind, object_id, subject_id, title, score in rows]
+
+
+def _term_match(token):
+    if len(token) < MIN_PREFIX:
+        return SearchTerm.term == token
+    # A range rather than LIKE so the (user_id, term) index is used on any collation
+    return (SearchTerm.term >= token) & (SearchTerm.term < token + '\uffff')
+
+
+def _search_terms(user_id, tokens, limit):
+    # A row matches when each token starts at least one of its words
+    matched = [func.max(case((_term_match(t), 1), else_=0)) for t in tokens]
+    score = func.sum(SearchTerm.weight)
+    stmt = select(SearchTerm.kind, SearchTerm.object_id, SearchTerm.subject_id, score.label('score'))\
+        .where(SearchTerm.user_id == user_id, or_(*[_term_match(t) for t in tokens]),
+               SearchTerm.subject_id.in_(_active_subjects(user_id)))\
+        .group_by(SearchTerm.kind, SearchTerm.object_id, SearchTerm.subject_id)\
+        .having(sum(matched) == len(matched))\
+        .order_by(score.desc(), SearchTerm.kind, SearchTerm.object_id).limit(limit)
+    rows = db.session.execute(stmt).all()
+    texts = {}
+    for kind, model, columns in (('subject', Subject, (Subject.name, Subject.description)),
+                                 ('topic', Topic, (Topic.name, Topic.description)),
+                                 ('session', StudySession, (db.literal(''), StudySession.notes))):
+        ids = [r.object_id for r in rows if r.kind == kind]
+        if ids:
+            texts[kind] = {r[0]: r[1:] for r in db.session.query(model.id, *columns).filter(model.id.in_(ids))}
+    results = []
+    for kind, object_id, subject_id, weight in rows:
+        title, body = texts.get(kind, {}).get(object_id, ('', ''))
+        results.append({'kind': kind, 'id': object_id, 'subject_id': subject_id, 'title': title or '',
+                        'snippet': _snippet(body, tokens), 'score': float(weight)})
+    return results
+
+
+def search(user_id, query, limit=20):
+    """Ranked matches for every word of `query` as a prefix, best first.
+
+    Topics and sessions of a subject that was deleted (hidden until the
+    delete job has run) are left out along with the subject.
+    """
+    tokens = words(query)[:MAX_TOKENS]
+    if not tokens:
+        return []
+    if uses_fts(db.session.get_bind()):
+        results = _search_fts(user_id, tokens, limit)
+    else:
+        results = _search_terms(user_id, tokens, limit)
+    # Sessions have no title of their own; show their subject's name
+    subject_ids = {r['subject_id'] for r in results if r['kind'] == 'session'}
+    if subject_ids:
+        names = dict(db.session.query(Subject.id, Subject.name).filter(Subject.id.in_(subject_ids)).all())
+        for r in results:
+            if r['kind'] == 'session':
+                r['title'] = names.get(r['subject_id'], '')
+    return results
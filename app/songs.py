@@ -0,0 +1,139 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.audio import clip_filename
+from app.models import SongBlob, User
+
+CHUNK_SIZE = 64 * 1024
+ALLOWED_EXTENSIONS = ('.mp3', '.wav', '.ogg', '.aac')
+
+
+def song_folder():
+    return os.path.join(current_app.root_path, 'static', 'reminder_songs')
+
+
+def store_song(stream, ext, folder):
+    """Stream an upload to disk in fixed-size chunks while hashing it.
+
+    The file is stored once under its SHA-256 and the matching SongBlob's
+    reference count is incremented. Returns the blob filename; the caller
+    commits.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+                out.write(chunk)
+        filename = digest.hexdigest() + ext
+        _acquire_blob(digest.hexdigest(), filename, size)
+        path = os.path.join(folder, filename)
+        if not os.path.exists(path):
+            os.replace(tmp_path, path)
+        return filename
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _increment(filename):
+    return SongBlob.query.filter_by(filename=filename).update(
+        {SongBlob.ref_count: SongBlob.ref_count + 1, SongBlob.released_at: None},
+        synchronize_session=False)
+
+
+def _acquire_blob(sha256, filename, size):
+    if _increment(filename):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(SongBlob(sha256=sha256, filename=filename, size_bytes=size, ref_count=1))
+    except IntegrityError:
+        # Someone stored the same content concurrently; share their row
+        _increment(filename)
+
+
+def release_song(filename):
+    """Drop one reference to a stored song. Unreferenced files are left to the sweeper."""
+    if not filename:
+        return
+    SongBlob.query.filter_by(filename=filename).update(
+        {SongBlob.ref_count: SongBlob.ref_count - 1, SongBlob.released_at: datetime.utcnow()},
+        synchronize_session=False)
+
+
+def sweep_songs(folder, grace_seconds):
+    """Delete unreferenced song blobs and any stray files in the song folder.
+
+    Blob rows are removed with a conditional DELETE (ref_count still 0), so a
+    concurrent upload that re-acquires the blob wins. Other files (stale
+    clips, legacy per-user uploads that were replaced, abandoned `.part`
+    files) go once they are older than the grace period and no user points
+    at them. Returns the number of files removed.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    removed = 0
+    candidates = db.session.query(SongBlob.id, SongBlob.filename)\
+        .filter(SongBlob.ref_count <= 0, SongBlob.released_at < cutoff).all()
+    for blob_id, filename in candidates:
+        deleted = SongBlob.query.filter(SongBlob.id == blob_id, SongBlob.ref_count <= 0)\
+            .delete(synchronize_session=False)
+        db.session.commit()
+        if deleted and os.path.exists(os.path.join(folder, filename)):
+            os.remove(os.path.join(folder, filename))
+            removed += 1
+
+    if not os.path.isdir(folder):
+        return removed
+    in_use = set()
+    for filename, seconds in db.session.query(User.reminder_song_filename, User.reminder_song_seconds)\
+            .filter(User.reminder_song_filename.isnot(None)).distinct():
+        in_use.add(filename)
+        in_use.add(clip_filename(filename, seconds or 10))
+    blobs = {f for (f,) in db.session.query(SongBlob.filename)}
+    oldest = time.time() - grace_seconds
+    for name in os.listdir(folder):
+        if name in in_use or name in blobs:
+            continue
+        path = os.path.join(folder, name)
+        if os.path.isfile(path) and os.path.getmtime(path) < oldest:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+_sweeper_lock = threading.Lock()
+_sweeper_thread = None
+
+
+def start_song_sweeper(app):
+    """Run sweep_songs periodically in a daemon thread; started lazily on the first upload."""
+    global _sweeper_thread
+    interval = app.config['SONG_SWEEP_INTERVAL_SECONDS']
+    if not interval:
+        return
+    with _sweeper_lock:
+        if _sweeper_thread is not None and _sweeper_thread.is_alive():
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                with app.app_context():
+                    try:
+                        sweep_songs(song_folder(), app.config['SONG_SWEEP_GRACE_SECONDS'])
+                    except Exception:
+                        db.session.rollback()
+                        app.logger.exception('Reminder song sweep failed')
+
+        _sweeper_thread = threading.Thread(target=run, name='song-sweeper', daemon=True)
+        _sweeper_thread.start()
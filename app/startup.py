@@ -0,0 +1,67 @@
+"""Cold-start budget for worker processes.
+
+`measure_startup` builds the app in a fresh interpreter under
+`python -X importtime` and reports how long `create_app` took from an empty
+module cache, the slowest top-level imports and any module that should only
+be loaded on demand but was imported anyway. `flask check-startup` fails
+when either budget is broken, so a regression shows up before autoscaled
+workers come online slower.
+"""
+import json
+import os
+import subprocess
+import sys
+
+# Only needed by the `flask db` commands
+LAZY_MODULES = ('flask_migrate', 'alembic')
+# Additionally never needed by an API-only worker
+API_LAZY_MODULES = LAZY_MODULES + ('app.auth', 'app.main', 'flask_wtf', 'wtforms', 'email_validator')
+
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+create_app(sys.argv[1], api_only=sys.argv[2] == '1')
+print(json.dumps({'ms': (time.perf_counter() - start) * 1000, 'modules': sorted(sys.modules)}))
+'''
+
+
+def parse_importtime(output):
+    """(module, cumulative ms) for the top two levels of `-X importtime` output."""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        if cumulative.strip().isdigit() and depth <= 1:
+            imports.append((name.strip(), int(cumulative) / 1000))
+    return imports
+
+
+def _probe(root, config_name, api_only):
+    env = dict(os.environ)
+    # Measure a worker, not a CLI process (which also loads Flask-Migrate)
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', _PROBE, config_name, '1' if api_only else '0'],
+                          cwd=root, env=env, capture_output=True, text=True, check=True)
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['imports'] = parse_importtime(proc.stderr)
+    return result
+
+
+def measure_startup(root, config_name='default', api_only=False, runs=3):
+    """Best of `runs` cold starts.
+
+    Returns a dict with `ms` (create_app including imports), `imports` (the
+    ten slowest imports of that run, top two levels only) and `eager` (lazy
+    modules that were loaded anyway).
+    """
+    best = min((_probe(root, config_name, api_only) for _ in range(max(runs, 1))), key=lambda r: r['ms'])
+    lazy = API_LAZY_MODULES if api_only else LAZY_MODULES
+    loaded = set(best['modules'])
+    return {
+        'ms': best['ms'],
+        'imports': sorted(best['imports'], key=lambda i: i[1], reverse=True)[:10],
+        'eager': [name for name in lazy if name in loaded],
+    }
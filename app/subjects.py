@@ -0,0 +1,139 @@
+from app import db
+from app.models import Topic, StudySession, ArchivedStudySession, ExamMode, DailyStudyRollup
+from app.jobs import enqueue
+from app.rollups import FINISH_STAMP, record_session
+from app.schedule import schedule_indexes
+
+
+def parse_24_from_12(h12_val, ampm_val):
+    try:
+        h12 = int(h12_val)
+    except (TypeError, ValueError):
+        return None
+    ampm = (ampm_val or '').strip().upper()
+    if ampm not in ('AM', 'PM'):
+        return None
+    if ampm == 'AM':
+        return h12 % 12
+    return (h12 % 12) + 12
+
+
+def parse_subject_times(data):
+    """Return (start_hour, start_minute, end_hour, end_minute) from a subject payload.
+
+    Explicit 12-hour inputs (`start_hour_12` + `start_ampm`, ...) win over the
+    24-hour fields; missing or malformed values fall back to 08:00-09:00.
+    """
+    sh24_from_12 = parse_24_from_12(data.get('start_hour_12'), data.get('start_ampm'))
+    eh24_from_12 = parse_24_from_12(data.get('end_hour_12'), data.get('end_ampm'))
+
+    try:
+        start_hour = int(data.get('start_hour')) if sh24_from_12 is None else int(sh24_from_12)
+    except (TypeError, ValueError):
+        start_hour = 8
+    try:
+        start_minute = int(data.get('start_minute', 0))
+    except (TypeError, ValueError):
+        start_minute = 0
+    try:
+        end_hour = int(data.get('end_hour')) if eh24_from_12 is None else int(eh24_from_12)
+    except (TypeError, ValueError):
+        end_hour = 9
+    try:
+        end_minute = int(data.get('end_minute', 0))
+    except (TypeError, ValueError):
+        end_minute = 0
+    return start_hour, start_minute, end_hour, end_minute
+
+
+def subject_times_error(data, times):
+    """Why a subject payload's times can't be used, or None.
+
+    `times` is what parse_subject_times made of `data`; a field that was
+    supplied but could not be parsed is an error rather than a fallback.
+    """
+    for field in ('start_hour', 'start_minute', 'end_hour', 'end_minute'):
+        value = data.get(field)
+        if value is None:
+            continue
+        try:
+            int(value)
+        except (TypeError, ValueError):
+            return f'{field} must be an integer'
+    for side in ('start', 'end'):
+        if data.get(f'{side}_hour_12') is not None and \
+                parse_24_from_12(data.get(f'{side}_hour_12'), data.get(f'{side}_ampm')) is None:
+            return f'{side}_hour_12 needs an integer and {side}_ampm AM or PM'
+    start_hour, start_minute, end_hour, end_minute = times
+    if not (0 <= start_hour <= 23 and 0 <= end_hour <= 23 and 0 <= start_minute <= 59 and 0 <= end_minute <= 59):
+        return 'times must be within 00:00-23:59'
+    return None
+
+
+def overlap_error(user, start_hour, start_minute, end_hour, end_minute, index=None):
+    """409 payload listing the user's subjects that overlap the window, or None.
+
+    Batches and imports pass `index`, a working copy that also holds the
+    subjects they have added so far.
+    """
+    if index is None:
+        index = schedule_indexes.get(user)
+    conflicts = index.overlapping(start_hour, start_minute, end_hour, end_minute)
+    if not conflicts:
+        return None
+    return {'success': False, 'error': 'overlap', 'conflicts': [index.describe(i) for i in conflicts]}
+
+
+def finish_subject(user_id, subject, now):
+    """Mark `subject` finished at `now`; the caller commits.
+
+    Closes the newest open study session for the subject, or logs a
+    zero-length finish stamp when there is none, and updates the day's
+    rollup. Returns (session, closed): the session touched and whether it
+    was an open one.
+    """
+    subject.finished_at = now
+    open_session = StudySession.query.filter(
+        StudySession.user_id == user_id,
+        StudySession.subject_id == subject.id,
+        StudySession.end_time.is_(None)
+    ).order_by(StudySession.start_time.desc()).first()
+    if open_session:
+        open_session.end_time = now
+        if open_session.start_time:
+            elapsed = int((now - open_session.start_time).total_seconds() // 60)
+            open_session.actual_duration_minutes = max(elapsed, 0)
+        open_session.notes = (open_session.notes or '') + ' finished'
+        open_session.completed = True
+        record_session(user_id, subject.id, now.date(),
+                       minutes=open_session.actual_duration_minutes or 0, sessions=1, completions=1)
+        return open_session, True
+    session = StudySession(
+        user_id=user_id,
+        subject_id=subject.id,
+        start_time=now,
+        end_time=now,
+        actual_duration_minutes=0,
+        notes=FINISH_STAMP,
+        completed=True
+    )
+    db.session.add(session)
+    record_session(user_id, subject.id, now.date(), completions=1)
+    return session, False
+
+
+def hide_subject(user_id, subject):
+    """Hide a subject the user deleted and enqueue the job that removes its rows; the caller commits."""
+    subject.is_active = False
+    enqueue('delete_subject', user_id=user_id, subject_id=subject.id)
+
+
+def delete_subject_rows(user_id, subject):
+    """Delete a subject and everything hanging off it; the caller commits."""
+    # Proactively delete dependents to avoid FK issues (e.g., ExamMode)
+    StudySession.query.filter_by(user_id=user_id, subject_id=subject.id).delete(synchronize_session=False)
+    ArchivedStudySession.query.filter_by(user_id=user_id, subject_id=subject.id).delete(synchronize_session=False)
+    ExamMode.query.filter_by(user_id=user_id, subject_id=subject.id).delete(synchronize_session=False)
+    DailyStudyRollup.query.filter_by(user_id=user_id, subject_id=subject.id).delete(synchronize_session=False)
+    Topic.query.filter_by(subject_id=subject.id).delete(synchronize_session=False)
+    db.session.delete(subject)
@@ -0,0 +1,167 @@
+"""Change tracking for delta sync (/api/sync).
+
+Every commit that creates, changes or deletes a subject or topic leaves one
+SyncChange row per object, stamped with the user's data_version after that
+commit. A client that remembers the version it last synced to (its token)
+then only needs the rows whose entry has a larger `seq`.
+
+ORM writes are picked up by session events: changes are collected after
+each flush and written just before the commit, after a final flush, once
+the user's data_version bump is in the transaction. Holding the bumped user
+row keeps a user's writers in sequence. Core bulk inserts (the importer)
+register their rows with `record_changes`.
+"""
+from sqlalchemy import delete, event, insert, inspect, select
+from sqlalchemy.orm import Session
+from app.models import User, Subject, Topic, SyncChange
+
+_STATE = 'sync_changes'
+
+
+def _state(session):
+    """Changes collected in the current transaction: {'pending': {(kind, id): ...}, 'bumped': {user ids}}."""
+    return session.info.setdefault(_STATE, {'pending': {}, 'bumped': set(), 'savepoints': {}})
+
+
+def record_changes(session, user_id, kind, ids, deleted=False):
+    """Register rows written behind the ORM's back; they are logged at commit."""
+    pending = _state(session)['pending']
+    for object_id in ids:
+        pending[(kind, object_id)] = (user_id, None, deleted)
+
+
+def _before_flush(session, flush_context, instances):
+    # The bump is a SQL expression, whose history is gone once it has been flushed
+    for obj in session.dirty:
+        if isinstance(obj, User) and inspect(obj).attrs.data_version.history.has_changes():
+            _state(session)['bumped'].add(obj.id)
+
+
+def _after_flush(session, flush_context):
+    state = _state(session)
+    for deleted, objects in ((False, session.new), (False, session.dirty), (True, session.deleted)):
+        for obj in objects:
+            if isinstance(obj, Subject):
+                state['pending'][('subject', obj.id)] = (obj.user_id, None, deleted)
+            elif isinstance(obj, Topic):
+                state['pending'][('topic', obj.id)] = (None, obj.subject_id, deleted)
+
+
+def _before_commit(session):
+    if session.in_nested_transaction():
+        return
+    # The commit would flush next anyway; doing it now collects its changes
+    session.flush()
+    state = session.info.pop(_STATE, None)
+    if not state or not state['pending']:
+        return
+    pending = state['pending']
+    # Topics only know their subject; topics of a subject deleted alongside them are covered by its tombstone
+    owners = {object_id: user_id for (kind, object_id), (user_id, _, _) in pending.items() if kind == 'subject'}
+    missing = {subject_id for (user_id, subject_id, _) in pending.values() if user_id is None and subject_id not in owners}
+    if missing:
+        owners.update(session.execute(select(Subject.id, Subject.user_id).where(Subject.id.in_(missing))).all())
+    by_user = {}
+    for (kind, object_id), (user_id, subject_id, deleted) in pending.items():
+        user_id = user_id if user_id is not None else owners.get(subject_id)
+        if user_id is not None:
+            by_user.setdefault(user_id, []).append((kind, object_id, deleted))
+
+    # The entries take the version of this commit, so make sure it has one
+    unbumped = [user_id for user_id in by_user if user_id not in state['bumped']]
+    for user_id in unbumped:
+        session.get(User, user_id).bump_data_version()
+    if unbumped:
+        session.flush()
+        session.info.pop(_STATE, None)
+
+    for user_id, changes in by_user.items():
+        seq = session.execute(select(User.data_version).where(User.id == user_id)).scalar()
+        for kind in ('subject', 'topic'):
+            ids = [object_id for k, object_id, _ in changes if k == kind]
+            if ids:
+                session.execute(delete(SyncChange).where(SyncChange.user_id == user_id, SyncChange.kind == kind,
+                                                         SyncChange.object_id.in_(ids))
+                                .execution_options(synchronize_session=False))
+        session.execute(insert(SyncChange), [
+            {'user_id': user_id, 'kind': kind, 'object_id': object_id, 'seq': seq, 'deleted': deleted}
+            for kind, object_id, deleted in changes
+        ])
+
+
+def _after_transaction_create(session, transaction):
+    if transaction.nested and _STATE in session.info:
+        state = session.info[_STATE]
+        state['savepoints'][id(transaction)] = (dict(state['pending']), set(state['bumped']))
+
+
+def _after_soft_rollback(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop(_STATE, None)
+        return
+    state = session.info.get(_STATE)
+    snapshot = state and state['savepoints'].pop(id(previous_transaction), None)
+    if snapshot is not None:
+        state['pending'], state['bumped'] = snapshot
+    elif state is not None:
+        # Nothing was collected before the savepoint began
+        state['pending'], state['bumped'] = {}, set()
+
+
+def register_sync_tracking():
+    listeners = (('before_flush', _before_flush), ('after_flush', _after_flush), ('before_commit', _before_commit),
+                 ('after_transaction_create', _after_transaction_create),
+                 ('after_soft_rollback', _after_soft_rollback))
+    for name, fn in listeners:
+        if not event.contains(Session, name, fn):
+            event.listen(Session, name, fn)
+
+
+def snapshot(user_id):
+    """All of the user's subjects and topics plus the token they are current as of."""
+    token = User.query.with_entities(User.data_version).filter_by(id=user_id).scalar()
+    subjects = Subject.query.filter_by(user_id=user_id).order_by(Subject.id).all()
+    topics = Topic.query.join(Subject, Topic.subject_id == Subject.id)\
+        .filter(Subject.user_id == user_id).order_by(Topic.id).all()
+    return subjects, topics, token
+
+
+def changes_since(user_id, since, limit):
+    """Changes after sequence number `since`, oldest first.
+
+    Returns (subjects, topics, deleted, token, has_more): the current rows of
+    changed subjects and topics, {'subjects': [...], 'topics': [...]} ids of
+    deleted ones, the token to pass next time and whether more changes are
+    waiting. All changes of one commit are always returned together.
+    """
+    # Read the token first: anything committed after this shows up next time
+    latest = token = User.query.with_entities(User.data_version).filter_by(id=user_id).scalar()
+    query = SyncChange.query.filter(SyncChange.user_id == user_id, SyncChange.seq > since, SyncChange.seq <= latest)
+    changes = query.order_by(SyncChange.seq).limit(limit + 1).all()
+    if len(changes) > limit:
+        last = changes[limit].seq
+        if changes[0].seq == last:
+            # One commit larger than the limit
+            changes = query.filter(SyncChange.seq == last).all()
+            token = last
+        else:
+            changes = [c for c in changes if c.seq < last]
+            token = last - 1
+    has_more = token < latest
+
+    ids = {'subject': set(), 'topic': set()}
+    deleted = {'subjects': [], 'topics': []}
+    for change in changes:
+        if change.deleted:
+            deleted[change.kind + 's'].append(change.object_id)
+        else:
+            ids[change.kind].add(change.object_id)
+    subjects = Subject.query.filter(Subject.id.in_(ids['subject']), Subject.user_id == user_id)\
+        .order_by(Subject.id).all() if ids['subject'] else []
+    topics = Topic.query.join(Subject, Topic.subject_id == Subject.id)\
+        .filter(Topic.id.in_(ids['topic']), Subject.user_id == user_id)\
+        .order_by(Topic.id).all() if ids['topic'] else []
+    # Entries left by work that was rolled back in a savepoint point at rows that are gone
+    deleted['subjects'].extend(sorted(ids['subject'] - {s.id for s in subjects}))
+    deleted['topics'].extend(sorted(ids['topic'] - {t.id for t in topics}))
+    return subjects, topics, deleted, token, has_more
@@ -0,0 +1,44 @@
+"""Tasks run by `flask run-jobs` workers; enqueue them with app.jobs.enqueue."""
+import os
+from flask import current_app
+from app import db
+from app.jobs import task
+from app.models import User, Subject
+
+
+@task('delete_subject')
+def delete_subject(user_id, subject_id):
+    """Remove a subject the user deleted (and hid) and everything hanging off it."""
+    from app.subjects import delete_subject_rows
+    subject = Subject.query.filter_by(id=subject_id, user_id=user_id).first()
+    if subject is None:
+        return
+    delete_subject_rows(user_id, subject)
+    db.session.get(User, user_id).bump_data_version()
+    db.session.commit()
+
+
+@task('make_clip', max_attempts=3)
+def make_clip(filename, seconds):
+    """Trim an uploaded reminder song; the original is served until the clip exists."""
+    from app.audio import clip_filename, make_clip as trim
+    from app.songs import song_folder
+    folder = song_folder()
+    if os.path.exists(os.path.join(folder, clip_filename(filename, seconds))):
+        return
+    if trim(folder, filename, seconds) is None:
+        return
+    # The served file changed, so its users' ETags and ?v= cache-busters must too
+    for user in User.query.filter_by(reminder_song_filename=filename):
+        if (user.reminder_song_seconds or 10) == seconds:
+            user.bump_data_version()
+    db.session.commit()
+
+
+@task('archive_sessions', max_attempts=3)
+def archive_sessions(days=None, max_batches=None):
+    """Move sessions past the retention horizon to the archive (see `flask archive-sessions`)."""
+    from app.retention import archive_sessions as archive
+    config = current_app.config
+    archive(config['SESSION_RETENTION_DAYS'] if days is None else days, config['SESSION_ARCHIVE_BATCH_SIZE'],
+            max_batches)
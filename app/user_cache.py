@@ -0,0 +1,159 @@
+"""Identity cache behind Flask-Login's user_loader.
+
+Every authenticated request used to look the user up by primary key. The
+cache keeps a detached, fully loaded copy of recently seen users (LRU,
+bounded by USER_CACHE_SIZE and USER_CACHE_TTL_SECONDS) and hands each
+request its own session-attached copy via `merge(load=False)`, which
+issues no SQL.
+
+Invalidation works across worker processes through a per-user version
+stamp: a tiny file under USER_CACHE_STAMP_DIR that is atomically replaced
+whenever a transaction that changed the user's row commits (settings,
+break toggle, song upload and every `bump_data_version`). A cached entry
+is only used while the stamp's inode and mtime still match the ones seen
+when it was loaded, which costs one stat() instead of a query.
+
+The directory holds one stamp per user whose row changed; `flask
+prune-user-stamps` removes those older than the TTL, which no cached entry
+can still depend on.
+"""
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.util import identity_key
+from app import db
+
+
+class UserCache:
+    def __init__(self):
+        self.size = 0
+        self.ttl = 0
+        self.stamp_dir = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # user_id -> (user, stamp, expires_at)
+
+    def configure(self, app):
+        self.size = app.config['USER_CACHE_SIZE']
+        self.ttl = app.config['USER_CACHE_TTL_SECONDS']
+        self.stamp_dir = app.config['USER_CACHE_STAMP_DIR'] or os.path.join(app.instance_path, 'user_stamps')
+        if self.enabled:
+            os.makedirs(self.stamp_dir, exist_ok=True)
+        self.clear()
+
+    @property
+    def enabled(self):
+        return self.size > 0 and self.ttl > 0
+
+    def _stamp_path(self, user_id):
+        return os.path.join(self.stamp_dir, str(user_id))
+
+    def stamp(self, user_id):
+        try:
+            st = os.stat(self._stamp_path(user_id))
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def touch(self, user_id):
+        """Publish a new version stamp for `user_id`, invalidating it in every process."""
+        with self._lock:
+            self._entries.pop(user_id, None)
+        if not self.stamp_dir:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.stamp_dir, prefix='.stamp')
+        os.close(fd)
+        # A fresh inode per write, so stamps differ even within one mtime tick
+        os.replace(tmp, self._stamp_path(user_id))
+
+    def prune_stamps(self, now=None):
+        """Delete stamps not replaced for longer than the TTL. Returns the number removed.
+
+        An entry cached before a stamp was written has expired by then, so a
+        missing stamp can no longer match it.
+        """
+        if not self.stamp_dir:
+            return 0
+        cutoff = (now or time.time()) - self.ttl
+        removed = 0
+        try:
+            entries = list(os.scandir(self.stamp_dir))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            if entry.name.startswith('.prune'):
+                continue
+            try:
+                if not entry.is_file() or entry.stat().st_mtime >= cutoff:
+                    continue
+                # Move it aside first: a stamp written since the stat() above is put back
+                aside = os.path.join(self.stamp_dir, '.prune' + entry.name)
+                os.replace(entry.path, aside)
+            except FileNotFoundError:
+                continue
+            try:
+                if os.stat(aside).st_mtime >= cutoff:
+                    os.link(aside, entry.path)
+                else:
+                    removed += 1
+            except FileExistsError:
+                # Stamped again meanwhile; the newer stamp stays
+                pass
+            finally:
+                os.remove(aside)
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def load(self, user_id):
+        from app.models import User
+        if not self.enabled:
+            return db.session.get(User, user_id)
+        stamp = self.stamp(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] == stamp and entry[2] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                return db.session.merge(entry[0], load=False)
+        if identity_key(User, user_id) in db.session.identity_map:
+            # Already loaded by this session, possibly with pending changes
+            return db.session.get(User, user_id)
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        db.session.expunge(user)
+        with self._lock:
+            self._entries[user_id] = (user, stamp, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return db.session.merge(user, load=False)
+
+
+user_cache = UserCache()
+
+
+def _user_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('changed_user_ids', set()).add(target.id)
+
+
+def _after_commit(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        user_cache.touch(user_id)
+
+
+def register_invalidation():
+    from app.models import User
+    for name in ('after_update', 'after_delete'):
+        if not event.contains(User, name, _user_changed):
+            event.listen(User, name, _user_changed)
+    if not event.contains(Session, 'after_commit', _after_commit):
+        # Ids left behind by a rollback are stamped at the next commit, which is harmless
+        event.listen(Session, 'after_commit', _after_commit)
@@ -0,0 +1,4 @@
+"""Synthetic data generation and load-test benchmarks for Study Assistant.
+
+Run ``python -m benchmarks --help`` for options.
+"""
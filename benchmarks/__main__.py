@@ -0,0 +1,106 @@
+"""Generate a synthetic dataset and replay a traffic mix against the app.
+
+Examples::
+
+    python -m benchmarks --users 1000 --requests 5000 --output bench.json
+    python -m benchmarks --db /tmp/big.db --users 100000 --subjects 50 --generate-only
+    python -m benchmarks --db /tmp/big.db --reuse --requests 20000 --concurrency 8
+    python -m benchmarks --base-url http://localhost:5000 --users 1000 --subjects 20 --requests 2000
+    python -m benchmarks --database-url postgresql://localhost/bench --reset --users 1000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='SQLite file for the dataset (default: a temporary file)')
+    parser.add_argument('--database-url', help='Run against this SQLAlchemy URL (e.g. PostgreSQL) instead of --db')
+    parser.add_argument('--config', default='default', choices=('default', 'development', 'production'),
+                        help='App configuration (production applies the DB_POOL_* settings)')
+    parser.add_argument('--reset', action='store_true', help='Drop all tables of --database-url before generating')
+    parser.add_argument('--reuse', action='store_true', help='Reuse an existing dataset instead of generating')
+    parser.add_argument('--generate-only', action='store_true', help='Generate the dataset and exit')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--subjects', type=int, default=20, help='Subjects per user')
+    parser.add_argument('--topics', type=int, default=5, help='Topics per subject')
+    parser.add_argument('--sessions', type=int, default=10, help='Study sessions per subject')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--mix', help='Traffic mix as JSON, e.g. \'{"dashboard": 50, "api_subjects": 50}\'')
+    parser.add_argument('--base-url', help='Replay against a running server instead of the test client')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the JSON report here (default: stdout)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    log = lambda msg: print(msg, file=sys.stderr)
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'dataset': {'users': args.users, 'subjects_per_user': args.subjects,
+                        'topics_per_subject': args.topics, 'sessions_per_subject': args.sessions},
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'target': args.base_url or 'test_client',
+        },
+    }
+    mix = json.loads(args.mix) if args.mix else None
+
+    if args.base_url:
+        from benchmarks.loadtest import HttpTarget, Workload
+        target = HttpTarget(args.base_url)
+    else:
+        if args.database_url:
+            if not (args.reset or args.reuse):
+                print('--database-url needs --reset (drop and regenerate) or --reuse', file=sys.stderr)
+                return 2
+            db_url = args.database_url
+        else:
+            db_url = 'sqlite:///' + os.path.abspath(args.db or os.path.join(tempfile.mkdtemp(), 'bench.db'))
+        # Config reads DATABASE_URL at import time
+        os.environ['DATABASE_URL'] = db_url
+        from app import create_app, db
+        from app.rollups import rebuild_rollups
+        from benchmarks.datagen import generate
+        from benchmarks.loadtest import TestClientTarget, Workload
+
+        app = create_app(args.config)
+        app.config['WTF_CSRF_ENABLED'] = False
+        with app.app_context():
+            report['meta']['backend'] = db.engine.dialect.name
+            if args.reset and not args.reuse:
+                db.drop_all()
+            if not args.reuse:
+                started = time.perf_counter()
+                counts = generate(db.engine, args.users, args.subjects, args.topics, args.sessions,
+                                  seed=args.seed, log=log)
+                rebuild_rollups()
+                report['meta']['generate_seconds'] = round(time.perf_counter() - started, 3)
+                report['meta']['rows'] = counts
+                log(f'generated {counts} into {db_url}')
+            if args.generate_only:
+                return 0
+            target = TestClientTarget(app, db.engine)
+
+    workload = Workload(target, args.users, args.subjects, mix=mix, seed=args.seed)
+    report.update(workload.run(args.requests, args.concurrency))
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert, text
+from werkzeug.security import generate_password_hash
+from app import db
+from app.models import User, Subject, Topic, StudySession
+
+PASSWORD = 'bench-password'
+
+
+def _flush(conn, model, rows):
+    if rows:
+        conn.execute(insert(model), rows)
+        rows.clear()
+
+
+def generate(engine, users=1000, subjects_per_user=20, topics_per_subject=5, sessions_per_subject=10,
+             seed=0, chunk_size=10000, log=None):
+    """Create the schema on `engine` and bulk-insert a synthetic dataset.
+
+    Rows are inserted with executemany in chunks of `chunk_size`, so memory
+    stays flat however large the dataset. Ids are assigned contiguously: user
+    ``u`` owns subjects ``(u - 1) * subjects_per_user + 1 .. u * subjects_per_user``.
+    Every user's password is PASSWORD (hashed once and shared).
+    Returns the number of rows written per table.
+    """
+    db.metadata.create_all(engine)
+    rng = random.Random(seed)
+    password_hash = generate_password_hash(PASSWORD)
+    now = datetime.utcnow()
+    counts = {'user': 0, 'subject': 0, 'topic': 0, 'study_session': 0}
+    user_rows, subject_rows, topic_rows, session_rows = [], [], [], []
+    subject_id = 0
+    with engine.begin() as conn:
+        for u in range(1, users + 1):
+            user_rows.append({'id': u, 'username': f'user{u}', 'email': f'user{u}@example.com',
+                              'first_name': 'Bench', 'last_name': str(u), 'password_hash': password_hash,
+                              'is_active': True})
+            for _ in range(subjects_per_user):
+                subject_id += 1
+                start = rng.randrange(6 * 60, 22 * 60, 5)
+                end = min(start + rng.choice((30, 45, 60, 90)), 23 * 60 + 55)
+                subject_rows.append({'id': subject_id, 'name': f'Subject {subject_id}', 'user_id': u,
+                                     'is_active': True, 'start_hour': start // 60, 'start_minute': start % 60,
+                                     'end_hour': end // 60, 'end_minute': end % 60})
+                for t in range(topics_per_subject):
+                    topic_rows.append({'name': f'Topic {t + 1}', 'subject_id': subject_id, 'is_active': True,
+                                       'estimated_time_minutes': rng.choice((15, 30, 45, 60)),
+                                       'difficulty_level': rng.randint(1, 5)})
+                for _ in range(sessions_per_subject):
+                    started = now - timedelta(minutes=rng.randint(60, 60 * 24 * 365))
+                    minutes = rng.randint(10, 90)
+                    session_rows.append({'user_id': u, 'subject_id': subject_id, 'start_time': started,
+                                         'end_time': started + timedelta(minutes=minutes),
+                                         'actual_duration_minutes': minutes, 'notes': 'bench finished',
+                                         'completed': True})
+            if u == users or max(len(subject_rows), len(topic_rows), len(session_rows)) >= chunk_size:
+                # Parents go first so foreign keys always resolve
+                for model, rows in ((User, user_rows), (Subject, subject_rows),
+                                    (Topic, topic_rows), (StudySession, session_rows)):
+                    counts[model.__tablename__] += len(rows)
+                    _flush(conn, model, rows)
+            if log and u % 1000 == 0:
+                log(f'generated {u}/{users} users')
+        if engine.dialect.name == 'postgresql':
+            # Explicit ids do not advance the serial sequences
+            for model in (User, Subject):
+                table = model.__table__
+                conn.execute(text(f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', 'id'), "
+                                  f"(SELECT coalesce(max(id), 1) FROM \"{table.name}\"))"))
+    return counts
@@ -0,0 +1,93 @@
+"""Time the exam planner on a synthetic syllabus, without a database.
+
+Examples::
+
+    python -m benchmarks.exam_plan --subjects 20 --topics 50 --days 120
+    python -m benchmarks.exam_plan --subjects 50 --topics 200 --overlap --output plan.json
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.exam_plan', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--subjects', type=int, default=20, help='Subjects with an exam')
+    parser.add_argument('--topics', type=int, default=50, help='Topics per subject')
+    parser.add_argument('--days', type=int, default=120, help='Exams fall within this many days')
+    parser.add_argument('--overlap', action='store_true',
+                        help='Give every subject the same window, so all of them are planned as one group')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed runs per measurement')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the JSON report here (default: stdout)')
+    return parser.parse_args(argv)
+
+
+def syllabus(args, today):
+    """(exams, subjects, topics) in the shape ExamPlanner takes."""
+    from app.schedule import window_minutes
+    rng = random.Random(args.seed)
+    exams, subjects, topics = {}, {}, {}
+    for subject_id in range(1, args.subjects + 1):
+        start = 8 if args.overlap else subject_id % 24
+        exams[subject_id] = (subject_id, today + timedelta(days=rng.randint(1, args.days)))
+        subjects[subject_id] = (f'subject {subject_id}', window_minutes(start, 0, start, 45))
+        rows = [(rng.randint(1, 5), topic_id, rng.choice((15, 30, 45, 60, 90)))
+                for topic_id in range(subject_id * 10000, subject_id * 10000 + args.topics)]
+        # Study order, as load_planner queries it: hardest first, then id
+        topics[subject_id] = [[topic_id, f'topic {topic_id}', minutes]
+                              for _, topic_id, minutes in sorted(rows, key=lambda r: (-r[0], r[1]))]
+    return exams, subjects, topics
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {'p50_ms': round(statistics.median(samples), 3), 'max_ms': round(max(samples), 3)}
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from app.exam_plan import ExamPlanner
+    today = date.today()
+    exams, subjects, topics = syllabus(args, today)
+
+    def full():
+        copy = {s: [list(t) for t in ts] for s, ts in topics.items()}
+        return ExamPlanner(today, exams, subjects, copy, args.days).plan()
+
+    planner = ExamPlanner(today, exams, subjects, {s: [list(t) for t in ts] for s, ts in topics.items()}, args.days)
+    planner.plan()
+    rng = random.Random(args.seed + 1)
+
+    def incremental():
+        planner.studied(rng.randint(1, args.subjects), None, 30, today=True)
+        return planner.plan()
+
+    plan = full()
+    report = {
+        'meta': {'subjects': args.subjects, 'topics_per_subject': args.topics, 'days': args.days,
+                 'overlap': args.overlap, 'groups': len(planner._plans)},
+        'plan': {'days': len(plan['days']), 'allocations': sum(len(d['items']) for d in plan['days']),
+                 'shortfall_minutes': sum(e['shortfall_minutes'] for e in plan['exams'])},
+        'full_plan': timed(full, args.repeat),
+        'incremental_replan': timed(incremental, args.repeat),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
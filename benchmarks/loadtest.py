@@ -0,0 +1,222 @@
+import http.cookiejar
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps
+from sqlalchemy import event
+from benchmarks.datagen import PASSWORD
+
+# Relative weights of each operation in the replayed traffic
+DEFAULT_MIX = {
+    'dashboard': 35,
+    'api_subjects': 30,
+    'add_subject': 10,
+    'complete_subject': 12,
+    'delete_subject': 5,
+    'login': 8,
+}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class Recorder:
+    """Thread-safe collector of (operation, latency, status, sql statements) samples."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.queries = defaultdict(list)
+
+    def add(self, op, seconds, status, queries=None):
+        with self._lock:
+            self.latencies[op].append(seconds)
+            self.statuses[op][status] += 1
+            if queries is not None:
+                self.queries[op].append(queries)
+
+    def summary(self, wall_seconds):
+        endpoints = {}
+        everything = []
+        for op, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            everything.extend(values)
+            queries = self.queries.get(op)
+            endpoints[op] = {
+                'count': len(values),
+                'errors': sum(n for status, n in self.statuses[op].items() if status >= 500 or status == 0),
+                'status_codes': {str(k): v for k, v in sorted(self.statuses[op].items())},
+                'mean_ms': round(sum(values) / len(values) * 1000, 3),
+                'p50_ms': round(percentile(values, 50) * 1000, 3),
+                'p95_ms': round(percentile(values, 95) * 1000, 3),
+                'p99_ms': round(percentile(values, 99) * 1000, 3),
+                'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+            }
+        everything.sort()
+        total = len(everything)
+        return {
+            'overall': {
+                'requests': total,
+                'wall_seconds': round(wall_seconds, 3),
+                'throughput_rps': round(total / wall_seconds, 2) if wall_seconds else None,
+                'p50_ms': round(percentile(everything, 50) * 1000, 3) if total else None,
+                'p95_ms': round(percentile(everything, 95) * 1000, 3) if total else None,
+                'p99_ms': round(percentile(everything, 99) * 1000, 3) if total else None,
+            },
+            'endpoints': endpoints,
+        }
+
+
+class TestClientTarget:
+    """Replays traffic in-process through Flask's test client, counting SQL statements per request."""
+
+    def __init__(self, app, engine):
+        self.app = app
+        self._local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        if getattr(self._local, 'counting', False):
+            self._local.queries += 1
+
+    def fresh_client(self):
+        return self.app.test_client()
+
+    def client(self, user_id):
+        client = self.app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        return client
+
+    def request(self, client, method, path, **kwargs):
+        self._local.counting = True
+        self._local.queries = 0
+        try:
+            response = client.open(path, method=method, **kwargs)
+            response.close()
+            return response.status_code, self._local.queries
+        finally:
+            self._local.counting = False
+
+    def login(self, client, username):
+        return self.request(client, 'POST', '/auth/login',
+                            data={'username': username, 'password': PASSWORD})
+
+
+class HttpTarget:
+    """Replays traffic against a running server; SQL statement counts are not available."""
+
+    _csrf = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def fresh_client(self):
+        return urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def client(self, user_id):
+        opener = self.fresh_client()
+        self.login(opener, f'user{user_id}')
+        return opener
+
+    def request(self, opener, method, path, json=None, data=None):
+        headers = {}
+        body = None
+        if json is not None:
+            body = dumps(json).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode('utf-8')
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with opener.open(req) as response:
+                response.read()
+                return response.status, None
+        except urllib.error.HTTPError as e:
+            return e.code, None
+        except urllib.error.URLError:
+            return 0, None
+
+    def login(self, opener, username):
+        # Includes fetching the form for its CSRF token
+        with opener.open(self.base_url + '/auth/login') as response:
+            match = self._csrf.search(response.read().decode('utf-8', 'replace'))
+        data = {'username': username, 'password': PASSWORD}
+        if match:
+            data['csrf_token'] = match.group(1)
+        return self.request(opener, 'POST', '/auth/login', data=data)
+
+
+class Workload:
+    """Picks operations from the traffic mix and turns them into requests for a target."""
+
+    def __init__(self, target, users, subjects_per_user, mix=None, seed=0):
+        self.target = target
+        self.users = users
+        self.subjects_per_user = subjects_per_user
+        self.mix = mix or DEFAULT_MIX
+        self._ops = list(self.mix)
+        self._weights = [self.mix[op] for op in self._ops]
+        self.seed = seed
+
+    def _subject_of(self, rng, user_id):
+        return (user_id - 1) * self.subjects_per_user + rng.randint(1, self.subjects_per_user)
+
+    def run_op(self, op, rng, client, user_id):
+        t = self.target
+        if op == 'dashboard':
+            return t.request(client, 'GET', '/dashboard')
+        if op == 'api_subjects':
+            return t.request(client, 'GET', '/api/subjects')
+        if op == 'add_subject':
+            start = rng.randrange(6, 22)
+            return t.request(client, 'POST', '/add_subject', json={
+                'name': f'Bench {rng.randint(1, 10 ** 6)}', 'start_hour': start, 'start_minute': 0,
+                'end_hour': start + 1, 'end_minute': 0, 'allow_overlap': True})
+        if op == 'complete_subject':
+            return t.request(client, 'POST', f'/subject/{self._subject_of(rng, user_id)}/complete')
+        if op == 'delete_subject':
+            return t.request(client, 'POST', f'/delete_subject/{self._subject_of(rng, user_id)}')
+        if op == 'login':
+            return t.login(t.fresh_client(), f'user{user_id}')
+        raise ValueError(f'unknown operation {op!r}')
+
+    def _worker(self, worker_id, requests, recorder):
+        rng = random.Random(self.seed * 1000 + worker_id)
+        clients = {}
+        for _ in range(requests):
+            user_id = rng.randint(1, self.users)
+            op = rng.choices(self._ops, self._weights)[0]
+            client = clients.get(user_id)
+            if client is None:
+                client = clients[user_id] = self.target.client(user_id)
+            started = time.perf_counter()
+            try:
+                status, queries = self.run_op(op, rng, client, user_id)
+            except Exception:
+                status, queries = 0, None
+            recorder.add(op, time.perf_counter() - started, status, queries)
+
+    def run(self, requests, concurrency=1):
+        """Replay `requests` operations across `concurrency` workers and return the summary."""
+        recorder = Recorder()
+        per_worker = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for f in [pool.submit(self._worker, i, n, recorder) for i, n in enumerate(per_worker)]:
+                f.result()
+        return recorder.summary(time.perf_counter() - started)
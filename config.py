@@ -4,19 +4,45 @@ from dotenv import load_dotenv
 basedir = os.path.abspath(os.path.dirname(__file__))
 load_dotenv(os.path.join(basedir, '.env'))
 
+
+def database_url():
+    url = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'study_assistant.db')
+    # Heroku-style URLs; SQLAlchemy only accepts the postgresql:// scheme
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(url, pool_size=5, max_overflow=10, pool_timeout=30, pool_recycle=280, statement_timeout_ms=0):
+    """SQLAlchemy engine options for `url`; the pool settings only apply to server databases."""
+    if url.startswith('sqlite'):
+        return {
+            'pool_pre_ping': True,
+            'pool_recycle': 280,
+            'connect_args': {
+                'timeout': 30,
+                'check_same_thread': False,
+            }
+        }
+    options = {
+        'pool_pre_ping': True,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'pool_recycle': pool_recycle,
+        # Reuse the most recently returned connection so idle ones can time out server-side
+        'pool_use_lifo': True,
+    }
+    if statement_timeout_ms and url.startswith('postgresql'):
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout_ms}'}
+    return options
+
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
-        'sqlite:///' + os.path.join(basedir, 'study_assistant.db')
+    SQLALCHEMY_DATABASE_URI = database_url()
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ENGINE_OPTIONS = {
-        'pool_pre_ping': True,
-        'pool_recycle': 280,
-        'connect_args': {
-            'timeout': 30,
-            'check_same_thread': False,
-        }
-    }
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
     
     # Email configuration (for future password reset functionality)
     MAIL_SERVER = os.environ.get('MAIL_SERVER')
@@ -26,14 +52,79 @@ class Config:
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     
+    # Uploads (reminder songs); larger requests are rejected with 413
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH') or 20 * 1024 * 1024)
+    SONG_SWEEP_INTERVAL_SECONDS = 3600
+    SONG_SWEEP_GRACE_SECONDS = 600
+    
+    # Password hashing runs in a process pool (0 workers hashes inline). When
+    # PASSWORD_HASH_QUEUE hashes are already in flight, sign-ins wait up to
+    # PASSWORD_HASH_WAIT_SECONDS and are then answered 503 with Retry-After.
+    # Stored hashes made with another method are upgraded on the next login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'
+    PASSWORD_HASH_WORKERS = int(os.environ['PASSWORD_HASH_WORKERS']) if os.environ.get('PASSWORD_HASH_WORKERS') else None
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE') or 0)  # 0: twice the workers
+    PASSWORD_HASH_WAIT_SECONDS = 2
+    PASSWORD_HASH_RETRY_AFTER = 5
+    
+    # Cache of loaded users for Flask-Login; invalidated across processes by
+    # per-user stamp files (default: <instance>/user_stamps). 0 disables it.
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE') or 1024)
+    USER_CACHE_TTL_SECONDS = int(os.environ.get('USER_CACHE_TTL_SECONDS') or 300)
+    USER_CACHE_STAMP_DIR = os.environ.get('USER_CACHE_STAMP_DIR')
+    
+    # Rendered dashboard fragments, keyed by user and data version. Set
+    # FRAGMENT_CACHE_DIR (e.g. under /dev/shm) to share them between workers.
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE') or 512)
+    FRAGMENT_CACHE_DIR = os.environ.get('FRAGMENT_CACHE_DIR')
+    
+    # Server-Sent Events: seconds between keep-alive comments on idle streams
+    EVENTS_KEEPALIVE_SECONDS = 15
+    
+    # Opt-in request instrumentation: Server-Timing headers and /metrics
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() in ['true', 'on', '1']
+    PROFILING_WINDOW = 1000  # requests per endpoint kept for the rolling quantiles
+    PROFILE_MEMORY = os.environ.get('PROFILE_MEMORY', 'false').lower() in ['true', 'on', '1']
+    PROFILE_DUMP_DIR = os.environ.get('PROFILE_DUMP_DIR')  # cProfile dumps of slow requests go here
+    PROFILE_THRESHOLD_MS = int(os.environ.get('PROFILE_THRESHOLD_MS') or 500)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # bearer token required by /metrics
+    # Without a token, let loopback scrape /metrics; unsafe behind a local reverse proxy
+    METRICS_ALLOW_LOOPBACK = os.environ.get('METRICS_ALLOW_LOOPBACK', 'false').lower() in ['true', 'on', '1']
+    
     # Pagination
     POSTS_PER_PAGE = 20
+    SUBJECTS_PER_PAGE = int(os.environ.get('SUBJECTS_PER_PAGE') or 50)
+    SUBJECTS_MAX_PER_PAGE = 200
+    EXPORT_BATCH_SIZE = 1000  # rows fetched per round trip by /api/export
+    IMPORT_BATCH_SIZE = 1000  # subjects inserted per transaction by /api/import
+    BATCH_MAX_OPS = 200  # operations accepted per /api/batch request
+    SYNC_MAX_CHANGES = 1000  # changed rows per /api/sync response
+    EXAM_PLAN_MAX_DAYS = 180  # days ahead planned by /api/exam_plan
+    SEARCH_MAX_RESULTS = 50  # results per /api/search response
+    SESSION_RETENTION_DAYS = int(os.environ.get('SESSION_RETENTION_DAYS') or 365)  # see `flask archive-sessions`
+    SESSION_ARCHIVE_BATCH_SIZE = 1000  # sessions moved per transaction
+    # Background jobs, see `flask run-jobs`
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS') or 2)
+    JOB_RETRY_BASE_SECONDS = 10  # first retry delay, doubling per failed attempt
+    JOB_RETRY_MAX_SECONDS = 3600
+    JOB_LEASE_SECONDS = 600  # a job running longer than this is assumed lost and requeued
+    JOB_KEEP_SECONDS = 7 * 24 * 3600  # finished jobs are kept this long for `flask job-stats`
+    STARTUP_BUDGET_MS = int(os.environ.get('STARTUP_BUDGET_MS') or 1500)  # cold create_app(), see `flask check-startup`
 
 class DevelopmentConfig(Config):
     DEBUG = True
 
 class ProductionConfig(Config):
     DEBUG = False
+    # Connection pool per worker process for PostgreSQL (DATABASE_URL=postgresql://...)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 10)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 20)
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT') or 10)  # seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 1800)  # reconnect connections older than this
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS') or 15000)
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(
+        Config.SQLALCHEMY_DATABASE_URI, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+        DB_STATEMENT_TIMEOUT_MS)
 
 config = {
     'development': DevelopmentConfig,
@@ -9,7 +9,8 @@ from app.models import User, Subject, Topic, StudySession, ExamMode
 
 def init_db():
     """Initialize the database with tables"""
-    app = create_app()
+    # Only the tables are needed, not the pages or forms
+    app = create_app(api_only=True)
     
     with app.app_context():
         # Create all tables
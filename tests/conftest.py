@@ -0,0 +1,70 @@
+import os
+import tempfile
+import pytest
+from sqlalchemy import create_engine
+
+# Configure before the app (and config.py) is imported. TEST_DATABASE_URL runs the suite against
+# another database, e.g. a throwaway PostgreSQL one in CI; every test drops all of its tables.
+_tmp = tempfile.mkdtemp(prefix='study-assistant-tests-')
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL') or 'sqlite:///' + os.path.join(_tmp, 'test.db')
+os.environ['PASSWORD_HASH_WORKERS'] = '0'
+os.environ['USER_CACHE_STAMP_DIR'] = os.path.join(_tmp, 'user_stamps')
+
+from app import create_app, db  # noqa: E402
+from app.models import User  # noqa: E402
+from config import database_url  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def database():
+    """The URL the tests run against; skips them when its server cannot be reached."""
+    url = database_url()
+    if not url.startswith('sqlite'):
+        try:
+            engine = create_engine(url)
+            with engine.connect():
+                pass
+            engine.dispose()
+        except Exception as e:
+            pytest.skip(f'database at TEST_DATABASE_URL unavailable: {e}')
+    return url
+
+
+@pytest.fixture
+def app(database):
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+        # Not part of the metadata, so drop_all leaves it behind
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql('DROP TABLE IF EXISTS search_index')
+
+
+@pytest.fixture
+def make_user(app):
+    count = [0]
+
+    def make():
+        count[0] += 1
+        user = User(username=f'user{count[0]}', email=f'user{count[0]}@example.com',
+                    first_name='Test', last_name='User')
+        user.set_password('password123')
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def login(app):
+    def login(user):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
+        return client
+    return login
@@ -0,0 +1,29 @@
+import os
+import wave
+from app.audio import make_clip, clip_filename
+
+
+def write_wav(path, seconds):
+    with wave.open(str(path), 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(b'\0\0' * 8000 * seconds)
+
+
+def test_make_clip_writes_the_trimmed_clip(tmp_path):
+    write_wav(tmp_path / 'song.wav', 30)
+    assert make_clip(str(tmp_path), 'song.wav', 5) == clip_filename('song.wav', 5)
+    with wave.open(str(tmp_path / clip_filename('song.wav', 5)), 'rb') as clip:
+        assert clip.getnframes() == 5 * 8000
+    assert sorted(os.listdir(tmp_path)) == sorted(['song.wav', clip_filename('song.wav', 5)])
+
+
+def test_failed_trim_leaves_no_partial_clip(tmp_path, monkeypatch):
+    write_wav(tmp_path / 'song.wav', 30)
+
+    def fail(self, data):
+        raise OSError('disk full')
+    monkeypatch.setattr(wave.Wave_write, 'writeframes', fail)
+    assert make_clip(str(tmp_path), 'song.wav', 5) is None
+    assert os.listdir(tmp_path) == ['song.wav']
@@ -0,0 +1,65 @@
+from app import db
+from app.models import Subject
+
+
+def test_batch_rejects_overlapping_subjects(app, make_user, login):
+    user = make_user()
+    db.session.add(Subject(name='Math', user_id=user.id, start_hour=9, end_hour=10))
+    db.session.commit()
+    client = login(user)
+
+    response = client.post('/api/batch', json={'atomic': False, 'ops': [
+        {'op': 'create_subject', 'name': 'Physics', 'start_hour': 9, 'start_minute': 30, 'end_hour': 11},
+        {'op': 'create_subject', 'name': 'Chemistry', 'start_hour': 10, 'end_hour': 11},
+        {'op': 'create_subject', 'name': 'Biology', 'start_hour': 10, 'start_minute': 30, 'end_hour': 12},
+        {'op': 'create_subject', 'name': 'Art', 'start_hour': 10, 'start_minute': 30, 'end_hour': 12,
+         'allow_overlap': True},
+    ]})
+    results = response.get_json()['results']
+    assert [r['success'] for r in results] == [False, True, False, True]
+    assert [c['name'] for c in results[0]['conflicts']] == ['Math']
+    # Overlaps with Chemistry, created earlier in the same batch
+    assert [c['name'] for c in results[2]['conflicts']] == ['Chemistry']
+    assert sorted(s.name for s in Subject.query.filter_by(user_id=user.id)) == ['Art', 'Chemistry', 'Math']
+
+
+def test_refs_resolve_to_rows_created_earlier_in_the_batch(app, make_user, login):
+    user = make_user()
+    client = login(user)
+    response = client.post('/api/batch', json={'ops': [
+        {'op': 'create_subject', 'name': 'Math', 'start_hour': 9, 'end_hour': 10, 'ref': 'm'},
+        {'op': 'create_topic', 'subject_id': '@m', 'name': 'Algebra', 'ref': 't'},
+        {'op': 'rename_topic', 'id': '@t', 'name': 'Geometry'},
+        {'op': 'rename_subject', 'id': '@m', 'name': 'Maths'},
+    ]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['success'] and body['committed']
+    subject = Subject.query.filter_by(user_id=user.id).one()
+    assert body['results'][0]['id'] == subject.id
+    assert (subject.name, [t.name for t in subject.topics]) == ('Maths', ['Geometry'])
+
+
+def test_atomic_batch_rolls_back_while_savepoints_keep_the_rest(app, make_user, login):
+    user = make_user()
+    client = login(user)
+    ops = [
+        {'op': 'create_subject', 'name': 'Math', 'start_hour': 9, 'end_hour': 10, 'ref': 'm'},
+        {'op': 'create_topic', 'subject_id': '@nope', 'name': 'Algebra'},
+        {'op': 'create_topic', 'subject_id': '@m', 'name': 'Geometry'},
+    ]
+    response = client.post('/api/batch', json={'ops': ops})
+    assert response.status_code == 422
+    body = response.get_json()
+    assert not body['committed']
+    assert [(r['success'], r.get('error')) for r in body['results']] == [
+        (True, None), (False, 'unknown ref @nope'), (False, 'skipped')]
+    assert Subject.query.filter_by(user_id=user.id).count() == 0
+
+    response = client.post('/api/batch', json={'ops': ops, 'atomic': False})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['committed'] and not body['success']
+    assert [r['success'] for r in body['results']] == [True, False, True]
+    subject = Subject.query.filter_by(user_id=user.id).one()
+    assert [t.name for t in subject.topics] == ['Geometry']
@@ -0,0 +1,62 @@
+from datetime import date
+from app import db
+from app.models import DailyStudyRollup, StudySession, Subject, User
+from app.rollups import rebuild_rollups
+
+
+def rollups(user_id):
+    return sorted((r.subject_id, r.day, r.minutes, r.sessions, r.completions)
+                  for r in DailyStudyRollup.query.filter_by(user_id=user_id))
+
+
+def test_import_sessions_updates_rollups(app, make_user, login):
+    user = make_user()
+    user_id, version = user.id, user.data_version
+    client = login(user)
+    response = client.post('/api/import', json=[
+        {'name': 'Math', 'start_hour': 9, 'end_hour': 10, 'topics': [{'name': 'Algebra'}],
+         'sessions': [{'start_time': '2024-05-01T09:00:00Z', 'end_time': '2024-05-01T09:45:00Z', 'rating': 4},
+                      {'start_time': '2024-05-01T18:00:00', 'end_time': '2024-05-01T18:30:00',
+                       'notes': 'finished', 'completed': True}]},
+        {'name': 'Physics', 'sessions': [{'start_time': '2024-05-02T09:00:00Z'}]},
+    ])
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['imported'] == {'subjects': 1, 'topics': 1, 'sessions': 2}
+    assert body['errors'] == [{'row': 2, 'session': 1, 'error': 'end_time must be an ISO 8601 timestamp'}]
+    math_id = body['subject_ids'][0]
+
+    response = client.post('/api/import', json={'sessions': [
+        {'subject_id': math_id, 'start_time': '2024-05-02T09:00:00Z', 'end_time': '2024-05-02T10:00:00Z'},
+        {'subject_id': math_id + 100, 'start_time': '2024-05-02T09:00:00Z', 'end_time': '2024-05-02T10:00:00Z'},
+    ]})
+    assert response.get_json()['imported']['sessions'] == 1
+    assert response.get_json()['errors'] == [{'row': 2, 'error': 'subject not found'}]
+
+    db.session.expire_all()
+    assert StudySession.query.filter_by(user_id=user_id).count() == 3
+    assert db.session.get(User, user_id).data_version > version
+    imported = rollups(user_id)
+    assert imported == [(math_id, date(2024, 5, 1), 75, 2, 1), (math_id, date(2024, 5, 2), 60, 1, 0)]
+    rebuild_rollups(user_id)
+    assert rollups(user_id) == imported
+    assert Subject.query.filter_by(user_id=user_id).count() == 1
+
+
+def test_import_rejects_overlapping_subjects(app, make_user, login):
+    user = make_user()
+    db.session.add(Subject(name='Math', user_id=user.id, start_hour=9, end_hour=10))
+    db.session.commit()
+    client = login(user)
+    rows = [{'name': 'Physics', 'start_hour': 9, 'start_minute': 30, 'end_hour': 11},
+            {'name': 'Chemistry', 'start_hour': 10, 'end_hour': 11},
+            {'name': 'Biology', 'start_hour': 10, 'start_minute': 30, 'end_hour': 12},
+            {'name': 'Art', 'start_hour': 10, 'start_minute': 30, 'end_hour': 12, 'allow_overlap': True}]
+
+    body = client.post('/api/import', json=rows).get_json()
+    assert body['imported']['subjects'] == 2
+    assert [(e['row'], [c['name'] for c in e['conflicts']], e.get('conflicting_rows')) for e in body['errors']] == [
+        (1, ['Math'], None), (3, [], [2])]
+
+    body = client.post('/api/import?allow_overlap=1', json=rows[:1]).get_json()
+    assert body['imported']['subjects'] == 1 and body['errors'] == []
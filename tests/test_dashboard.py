@@ -0,0 +1,38 @@
+from sqlalchemy import event
+from app import db
+from app.models import Subject, Topic
+
+
+def add_subjects(user, count):
+    for n in range(count):
+        subject = Subject(name=f'Subject {n}', user_id=user.id, start_hour=8 + n % 12, end_hour=9 + n % 12)
+        subject.topics = [Topic(name=f'Topic {n}.{t}') for t in range(3)]
+        db.session.add(subject)
+    db.session.commit()
+
+
+def statements_for_home(app, client):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        # A fresh app context, so Flask-Login's user cached on g isn't reused
+        with app.app_context():
+            response = client.get('/', follow_redirects=True)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    assert response.status_code == 200
+    return statements
+
+
+def test_dashboard_query_count_does_not_grow_with_subjects(app, make_user, login):
+    few, many = make_user(), make_user()
+    add_subjects(few, 3)
+    add_subjects(many, 40)
+    few_client, many_client = login(few), login(many)
+
+    few_statements = statements_for_home(app, few_client)
+    many_statements = statements_for_home(app, many_client)
+    assert len(few_statements) == len(many_statements), (few_statements, many_statements)
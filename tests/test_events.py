@@ -0,0 +1,40 @@
+import json
+from app.events import EventBroker, broker, format_sse
+
+
+def test_publish_reaches_only_the_users_streams_and_never_blocks():
+    events = EventBroker(max_queue_size=1)
+    first, second, other = events.subscribe(1), events.subscribe(1), events.subscribe(2)
+    events.publish(1, 'subject', {'id': 7})
+    events.publish(1, 'subject', {'id': 8})  # queues are full: dropped
+    assert first.get_nowait() == second.get_nowait() == 'event: subject\ndata: {"id":7}\n\n'
+    assert first.empty() and other.empty()
+
+    assert events.unsubscribe(1, first) is False
+    assert events.unsubscribe(1, second) is True
+    assert not events.has_subscribers(1)
+    events.publish(1, 'subject')
+
+
+def test_stream_carries_subject_mutations(app, make_user, login):
+    user = make_user()
+    user_id = user.id
+    with app.app_context():
+        response = login(user).get('/events?tz_offset=0', buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    chunks = (chunk.decode() for chunk in response.response)
+    assert next(chunks) == 'retry: 5000\n\n'
+    assert broker.has_subscribers(user_id)
+
+    with app.app_context():
+        created = login(user).post('/api/subjects', json={'name': 'Math', 'start_hour': 9, 'end_hour': 10})
+    assert next(chunks) == format_sse('subject', {'action': 'created', 'id': created.get_json()['id'],
+                                                  'name': 'Math'})
+    response.close()
+    assert not broker.has_subscribers(user_id)
+
+
+def test_format_sse_defaults_to_an_empty_object():
+    event, data = format_sse('break').splitlines()[:2]
+    assert event == 'event: break'
+    assert json.loads(data[len('data: '):]) == {}
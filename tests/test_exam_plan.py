@@ -0,0 +1,25 @@
+from datetime import date, datetime, timedelta
+from app.exam_plan import ExamPlanner, ExamPlanRegistry
+
+
+def planner(version):
+    today = date(2024, 5, 1)
+    return ExamPlanner(today, {1: (10, today + timedelta(days=5))}, {1: ('Math', [(8 * 60, 9 * 60)])},
+                       {1: [[100, 'Algebra', 120]]}, 30, version=version)
+
+
+def test_session_completed_folds_the_next_version():
+    registry = ExamPlanRegistry()
+    registry._planners[7] = planner(3)
+    registry.session_completed(7, 4, 1, 100, 30, datetime(2024, 5, 1, 9))
+    cached = registry._planners[7]
+    assert cached.version == 4
+    assert cached.plan()['exams'][0]['remaining_minutes'] == 90
+
+
+def test_session_completed_drops_planner_at_another_version():
+    registry = ExamPlanRegistry()
+    # Rebuilt after the commit: it already counts the session
+    registry._planners[7] = planner(4)
+    registry.session_completed(7, 4, 1, 100, 30, datetime(2024, 5, 1, 9))
+    assert 7 not in registry._planners
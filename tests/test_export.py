@@ -0,0 +1,67 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+from app import db
+from app.models import Subject, Topic
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_incremental_export_includes_rows_edited_since_the_watermark(app, make_user, login):
+    user = make_user()
+    created = datetime(2024, 5, 1, 9)
+    math = Subject(name='Math', user_id=user.id, created_at=created, updated_at=created,
+                   topics=[Topic(name='Algebra', created_at=created, updated_at=created)])
+    physics = Subject(name='Physics', user_id=user.id, created_at=created, updated_at=created)
+    db.session.add_all([math, physics])
+    db.session.commit()
+    client = login(user)
+
+    response = client.get('/api/export/subjects')
+    assert response.status_code == 200
+    assert [row['name'] for row in ndjson(response)] == ['Math', 'Physics']
+    watermark = response.headers['X-Export-Watermark']
+    assert watermark == created.isoformat() + 'Z'
+    # Only the rows at the watermark itself repeat
+    assert len(ndjson(client.get('/api/export/subjects', query_string={'since': watermark}))) == 2
+
+    physics.name = 'Physics II'
+    math.topics[0].name = 'Algebra II'
+    db.session.commit()
+
+    response = client.get('/api/export/subjects', query_string={'since': '2024-05-02T00:00:00Z'})
+    assert [row['name'] for row in ndjson(response)] == ['Physics II']
+    assert response.headers['X-Export-Watermark'] > watermark
+    response = client.get('/api/export/topics', query_string={'since': '2024-05-02T00:00:00Z'})
+    assert [row['name'] for row in ndjson(response)] == ['Algebra II']
+
+
+def test_export_streams_csv_gzipped_when_accepted(app, make_user, login):
+    user = make_user()
+    other = make_user()
+    app.config['EXPORT_BATCH_SIZE'] = 2
+    db.session.add_all([Subject(name=f'Subject {i}', user_id=user.id) for i in range(5)])
+    db.session.add(Subject(name='Not mine', user_id=other.id))
+    db.session.commit()
+    client = login(user)
+
+    response = client.get('/api/export/subjects', query_string={'format': 'csv'},
+                          headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.get_data()).decode())))
+    assert [row['name'] for row in rows] == [f'Subject {i}' for i in range(5)]
+
+    response = client.get('/api/export/subjects', query_string={'format': 'csv'})
+    assert 'Content-Encoding' not in response.headers
+    assert len(list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))) == 5
+
+    assert client.get('/api/export/subjects', query_string={'format': 'xml'}).status_code == 400
+    assert client.get('/api/export/subjects', query_string={'since': 'yesterday'}).status_code == 400
+    assert client.get('/api/export/users').status_code == 404
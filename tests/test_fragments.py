@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+from app import db
+from app.fragments import FragmentCache
+from app.models import Subject
+
+TEMPLATE = 'main/_subject_list.html'
+
+
+def cache(size=8, directory=None):
+    fragments = FragmentCache()
+    fragments.size, fragments.directory = size, directory
+    return fragments
+
+
+def test_hits_until_the_data_version_moves(app):
+    fragments, builds = cache(), []
+    user = SimpleNamespace(id=1, data_version=3)
+
+    def build():
+        builds.append(user.data_version)
+        return {'html': f'v{user.data_version}'}
+    assert fragments.get(user, TEMPLATE, build) == {'html': 'v3'}
+    assert fragments.get(user, TEMPLATE, build) == {'html': 'v3'}
+    assert builds == [3]
+    user.data_version = 4
+    assert fragments.get(user, TEMPLATE, build) == {'html': 'v4'}
+    assert fragments.get(SimpleNamespace(id=2, data_version=4), TEMPLATE, build) == {'html': 'v4'}
+    assert builds == [3, 4, 4]
+
+
+def test_workers_share_fragments_through_the_directory(app, tmp_path):
+    user = SimpleNamespace(id=1, data_version=3)
+    cache(directory=str(tmp_path)).get(user, TEMPLATE, lambda: {'html': 'built once'})
+
+    def fail():
+        raise AssertionError('rebuilt')
+    assert cache(directory=str(tmp_path)).get(user, TEMPLATE, fail) == {'html': 'built once'}
+    user.data_version = 4
+    assert cache(directory=str(tmp_path)).get(user, TEMPLATE, lambda: {'html': 'new'}) == {'html': 'new'}
+
+
+def test_dashboard_shows_a_renamed_subject(app, make_user, login):
+    user = make_user()
+    subject = Subject(name='Mathematics', user_id=user.id, start_hour=9, end_hour=10)
+    db.session.add(subject)
+    db.session.commit()
+    client = login(user)
+    with app.app_context():
+        assert 'Mathematics' in client.get('/dashboard').get_data(as_text=True)
+    with app.app_context():
+        assert client.post(f'/subject/{subject.id}/edit', json={'name': 'Physics'}).status_code == 200
+    with app.app_context():
+        page = client.get('/dashboard').get_data(as_text=True)
+    assert 'Physics' in page and 'Mathematics' not in page
@@ -0,0 +1,38 @@
+def get(app, client, url, etag=None):
+    headers = {'If-None-Match': etag} if etag else {}
+    with app.app_context():
+        return client.get(url, headers=headers)
+
+
+def test_matching_etag_answers_304_until_the_data_changes(app, make_user, login):
+    client = login(make_user())
+    first = get(app, client, '/api/subjects')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+
+    cached = get(app, client, '/api/subjects', etag)
+    assert cached.status_code == 304
+    assert cached.data == b''
+    assert cached.headers['ETag'] == etag
+    # The tag varies with the query string
+    assert get(app, client, '/api/subjects?limit=1', etag).status_code == 200
+
+    with app.app_context():
+        assert client.post('/api/subjects', json={'name': 'Math', 'start_hour': 9, 'end_hour': 10}).status_code == 201
+    changed = get(app, client, '/api/subjects', etag)
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert [s['name'] for s in changed.get_json()] == ['Math']
+
+
+def test_etag_is_per_user(app, make_user, login):
+    etag = get(app, login(make_user()), '/api/subjects').headers['ETag']
+    assert get(app, login(make_user()), '/api/subjects', etag).status_code == 200
+
+
+def test_dashboard_revalidates_with_its_etag(app, make_user, login):
+    client = login(make_user())
+    first = get(app, client, '/dashboard')
+    assert first.status_code == 200
+    assert get(app, client, '/dashboard', first.headers['ETag']).status_code == 304
@@ -0,0 +1,28 @@
+import pytest
+from werkzeug.exceptions import Forbidden
+from app.profiling import metrics_view
+
+
+def scrape(app, remote_addr='127.0.0.1', headers=None):
+    with app.test_request_context('/metrics', environ_base={'REMOTE_ADDR': remote_addr}, headers=headers):
+        return metrics_view()
+
+
+def test_metrics_closed_without_token(app):
+    app.config.update(METRICS_TOKEN=None, METRICS_ALLOW_LOOPBACK=False)
+    with pytest.raises(Forbidden):
+        scrape(app)
+
+
+def test_metrics_loopback_opt_in(app):
+    app.config.update(METRICS_TOKEN=None, METRICS_ALLOW_LOOPBACK=True)
+    assert scrape(app).status_code == 200
+    with pytest.raises(Forbidden):
+        scrape(app, remote_addr='203.0.113.9')
+
+
+def test_metrics_token(app):
+    app.config.update(METRICS_TOKEN='s3cret', METRICS_ALLOW_LOOPBACK=True)
+    with pytest.raises(Forbidden):
+        scrape(app)
+    assert scrape(app, remote_addr='203.0.113.9', headers={'Authorization': 'Bearer s3cret'}).status_code == 200
@@ -0,0 +1,41 @@
+import pytest
+from werkzeug.security import generate_password_hash
+from app import passwords
+
+
+@pytest.mark.parametrize('method', ['scrypt', 'scrypt:32768:8:1', 'pbkdf2', 'pbkdf2:sha256', 'pbkdf2:sha256:1000'])
+def test_hash_made_with_configured_method_needs_no_rehash(app, method):
+    app.config['PASSWORD_HASH_METHOD'] = method
+    assert not passwords.needs_rehash(generate_password_hash('secret', method))
+
+
+def test_hash_with_other_cost_needs_rehash(app):
+    app.config['PASSWORD_HASH_METHOD'] = 'scrypt'
+    assert passwords.needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:1000'))
+    assert passwords.needs_rehash(generate_password_hash('secret', 'scrypt:16384:8:1'))
+
+
+def test_broken_pool_is_replaced(app, monkeypatch):
+    from concurrent.futures.process import BrokenProcessPool
+
+    class Broken:
+        def submit(self, *args):
+            raise BrokenProcessPool('worker died')
+
+        def shutdown(self, **kwargs):
+            pass
+
+    class Working:
+        def submit(self, fn, *args):
+            class Done:
+                def result(self):
+                    return fn(*args)
+            return Done()
+
+    app.config['PASSWORD_HASH_WORKERS'] = 1
+    broken = Broken()
+    monkeypatch.setattr(passwords, '_pool', broken)
+    monkeypatch.setattr(passwords, '_slots', None)
+    monkeypatch.setattr(passwords, 'ProcessPoolExecutor', lambda **kwargs: Working())
+    assert passwords._run(len, 'abc') == 3
+    assert passwords._pool is not broken
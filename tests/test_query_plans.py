@@ -0,0 +1,8 @@
+from app.query_plans import HOT_QUERIES, check_query_plans
+
+
+def test_hot_queries_use_indexes(tmp_path):
+    plans, failures = check_query_plans(str(tmp_path / 'plans.db'), users=50)
+    assert set(plans) == set(HOT_QUERIES)
+    assert failures == {}
+    assert not [step for plan in plans.values() for step in plan if step.startswith('SCAN ')]
@@ -0,0 +1,53 @@
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+from app.reminders import ReminderScheduler, local_date, next_end_timestamp, user_timezone, END
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+def test_next_end_timestamp_uses_the_users_offset():
+    # 08:30 UTC is 10:30 at UTC+2: 11:00 there is still today, 10:00 only tomorrow
+    now = datetime(2024, 5, 1, 8, 30, tzinfo=timezone.utc).astimezone(user_timezone(120))
+    assert next_end_timestamp(11, 0, now=now) == utc(2024, 5, 1, 9)
+    assert next_end_timestamp(10, 0, now=now) == utc(2024, 5, 2, 8)
+    assert local_date(utc(2024, 5, 1, 23), utc_offset=120) == date(2024, 5, 2)
+
+
+def test_load_user_schedules_end_times_in_the_users_time():
+    scheduler = ReminderScheduler()
+    subject = SimpleNamespace(id=1, user_id=7, name='Math', is_active=True, end_hour=10, end_minute=0,
+                              extra_reminder_at=None, finished_at=None)
+    scheduler._ensure_thread = lambda: None
+    scheduler.load_user(7, [subject], utc_offset=-300)
+    due_ts = scheduler._heap[0][0]
+    due = datetime.fromtimestamp(due_ts, timezone.utc)
+    assert (due.hour, due.minute) == (15, 0)
+
+    # A tab reporting another offset reschedules; the stale entry is dropped lazily
+    scheduler.load_user(7, [subject], utc_offset=60)
+    live = [e for e in scheduler._heap if scheduler._live.get(e[2:]) == e[1]]
+    assert [(datetime.fromtimestamp(e[0], timezone.utc).hour, e[4]) for e in live] == [(9, END)]
+
+
+def test_failed_complete_does_not_suppress_the_reminder(app, make_user, login, monkeypatch):
+    from app import db
+    from app.models import Subject
+    from app.reminders import reminder_scheduler
+    user = make_user()
+    subject = Subject(name='Math', user_id=user.id)
+    db.session.add(subject)
+    db.session.commit()
+    key = (user.id, subject.id, END)
+
+    def fail(*args):
+        raise RuntimeError('database is locked')
+    monkeypatch.setattr('app.main.routes.finish_subject', fail)
+    assert login(user).post(f'/subject/{subject.id}/complete').status_code == 500
+    assert key not in reminder_scheduler._delivered
+
+    monkeypatch.undo()
+    assert login(user).post(f'/subject/{subject.id}/complete').status_code == 200
+    assert key in reminder_scheduler._delivered
+    reminder_scheduler._delivered.pop(key)
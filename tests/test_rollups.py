@@ -0,0 +1,43 @@
+from datetime import datetime
+from app import db
+from app.models import Subject, StudySession, DailyStudyRollup
+from app.retention import archive_sessions
+from app.rollups import rebuild_rollups
+
+
+def rollups(user_id):
+    return sorted((r.subject_id, r.day, r.minutes, r.sessions, r.completions)
+                  for r in DailyStudyRollup.query.filter_by(user_id=user_id))
+
+
+def test_rebuild_counts_only_sessions_marked_completed(app, make_user, login):
+    user = make_user()
+    user_id = user.id
+    math = Subject(name='Math', user_id=user_id)
+    physics = Subject(name='Physics', user_id=user_id)
+    db.session.add_all([math, physics])
+    db.session.flush()
+    # A note that merely reads like a completion, and one left open until the subject is finished
+    db.session.add(StudySession(user_id=user_id, subject_id=physics.id, start_time=datetime(2024, 5, 1, 9),
+                                notes='subject_finished'))
+    db.session.commit()
+    math_id, physics_id = math.id, physics.id
+    client = login(user)
+    response = client.post('/api/import', json={'sessions': [
+        {'subject_id': math_id, 'start_time': '2024-05-01T09:00:00Z', 'end_time': '2024-05-01T09:30:00Z',
+         'notes': 'not finished'}]})
+    assert response.get_json()['imported']['sessions'] == 1
+    assert client.post(f'/subject/{math_id}/complete').status_code == 200
+    assert client.post(f'/subject/{physics_id}/complete').status_code == 200
+
+    live = rollups(user_id)
+    assert sum(row[4] for row in live) == 2
+    assert [row[3] for row in live if row[0] == math_id] == [1, 0]
+    assert StudySession.query.filter_by(user_id=user_id, completed=True).count() == 2
+
+    rebuild_rollups(user_id)
+    assert rollups(user_id) == live
+    # The mark survives archiving
+    assert archive_sessions(0, now=datetime(2100, 1, 1)) == 3
+    rebuild_rollups(user_id)
+    assert rollups(user_id) == live
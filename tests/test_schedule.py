@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+from app.schedule import ScheduleIndex, ScheduleRegistry
+
+
+def subject(id, start, end, name=None):
+    return SimpleNamespace(id=id, name=name or f's{id}', start_hour=start[0], start_minute=start[1],
+                           end_hour=end[0], end_minute=end[1], is_active=True)
+
+
+def test_next_after_skips_window_running_past_midnight():
+    index = ScheduleIndex([subject(1, (23, 0), (1, 0)), subject(2, (8, 0), (9, 0))])
+    # 23:30: the 23:00-01:00 window is already running, 08:00 is next (tomorrow)
+    assert index.next_after(23 * 60 + 30) == (2, 8 * 60, 1)
+    # 00:30: still inside the late window, whose after-midnight piece is not a start
+    assert index.next_after(30) == (2, 8 * 60, 0)
+    # 10:00: the late window starts at 23:00 today
+    assert index.next_after(10 * 60) == (1, 23 * 60, 0)
+    assert index.active_at(30) == [1]
+
+
+def test_next_after_forgets_removed_subject():
+    index = ScheduleIndex([subject(1, (23, 0), (1, 0)), subject(2, (8, 0), (9, 0))])
+    index.remove(2)
+    assert index.next_after(23 * 60 + 30) == (1, 23 * 60, 1)
+
+
+def test_apply_only_folds_the_next_version():
+    registry = ScheduleRegistry()
+    registry._indexes[7] = ScheduleIndex([subject(1, (8, 0), (9, 0))], version=3)
+    registry.apply(7, 4, upserts=[subject(2, (10, 0), (11, 0))])
+    assert registry._indexes[7].version == 4
+    assert len(registry._indexes[7]) == 2
+    # A version that does not follow the cached one drops the entry
+    registry.apply(7, 6, removals=[1])
+    assert 7 not in registry._indexes
+
+
+def test_apply_leaves_the_index_readers_hold_untouched():
+    registry = ScheduleRegistry()
+    held = registry._indexes[7] = ScheduleIndex([subject(1, (8, 0), (9, 0))], version=3)
+    assert held.active_at(8 * 60 + 30) == [1]
+    registry.apply(7, 4, upserts=[subject(2, (8, 0), (10, 0))], removals=[1])
+    assert held.version == 3 and held.active_at(8 * 60 + 30) == [1] and held.describe(1)['name'] == 's1'
+    assert registry._indexes[7].active_at(8 * 60 + 30) == [2]
+
+
+def test_schedule_now_reads_the_users_clock(app, make_user, login):
+    from datetime import datetime, timedelta, timezone
+    from app import db
+    from app.models import Subject
+    user = make_user()
+    # A two-hour window from this hour at UTC+5:30, whatever the server's zone
+    here = datetime.now(timezone(timedelta(minutes=330)))
+    db.session.add(Subject(name='Math', user_id=user.id, start_hour=here.hour, start_minute=0,
+                           end_hour=(here.hour + 2) % 24, end_minute=0))
+    db.session.commit()
+    client = login(user)
+    on = client.get('/api/schedule/now?tz_offset=-330').get_json()
+    assert [s['name'] for s in on['subjects']] == ['Math']
+    # UTC-10 is 15.5 hours behind
+    assert client.get('/api/schedule/now?tz_offset=600').get_json()['subjects'] == []
@@ -0,0 +1,52 @@
+import pytest
+from datetime import datetime
+from app import db
+from app.models import Subject, Topic, StudySession
+
+
+@pytest.fixture(params=['fts', 'terms'])
+def search_backend(request, app, monkeypatch):
+    if request.param == 'fts' and db.engine.dialect.name != 'sqlite':
+        pytest.skip('FTS5 is SQLite only')
+    if request.param == 'terms':
+        # The inverted index other databases use, kept by the after_flush listener
+        monkeypatch.setattr('app.search.uses_fts', lambda bind: False)
+    return request.param
+
+
+def add_subject(user, name, topic, notes):
+    subject = Subject(name=name, user_id=user.id, topics=[Topic(name=topic)])
+    db.session.add(subject)
+    db.session.flush()
+    db.session.add(StudySession(user_id=user.id, subject_id=subject.id, start_time=datetime(2024, 5, 1, 9),
+                                end_time=datetime(2024, 5, 1, 10), notes=notes))
+    db.session.commit()
+    return subject
+
+
+def hits(client, query):
+    return sorted((r['kind'], r['title']) for r in client.get(f'/api/search?q={query}').get_json()['results'])
+
+
+def test_hidden_subject_drops_its_topics_and_sessions(search_backend, make_user, login):
+    user = make_user()
+    subject = add_subject(user, 'Chemistry', 'Organic chemistry', 'chemistry lab report')
+    client = login(user)
+    assert hits(client, 'chem') == [('session', 'Chemistry'), ('subject', 'Chemistry'),
+                                    ('topic', 'Organic chemistry')]
+    assert client.post(f'/delete_subject/{subject.id}').status_code == 200
+    assert hits(client, 'chem') == []
+
+
+def test_results_are_scoped_to_the_user(search_backend, app, make_user, login):
+    alice, bob = make_user(), make_user()
+    add_subject(alice, 'Chemistry', 'Organic chemistry', 'chemistry lab report')
+    add_subject(bob, 'Chemical engineering', 'Reactors', 'chemical plant visit')
+    with app.app_context():
+        assert hits(login(alice), 'chem') == [('session', 'Chemistry'), ('subject', 'Chemistry'),
+                                              ('topic', 'Organic chemistry')]
+    with app.app_context():
+        assert hits(login(bob), 'chem') == [('session', 'Chemical engineering'),
+                                            ('subject', 'Chemical engineering')]
+    with app.app_context():
+        assert hits(login(bob), 'organic') == []
@@ -0,0 +1,46 @@
+import io
+import os
+import time
+from datetime import datetime, timedelta
+from app import db
+from app.models import SongBlob
+from app.songs import release_song, store_song, sweep_songs
+
+
+def test_identical_uploads_share_one_counted_blob(app, tmp_path):
+    first = store_song(io.BytesIO(b'la' * 100000), '.mp3', str(tmp_path))
+    second = store_song(io.BytesIO(b'la' * 100000), '.mp3', str(tmp_path))
+    other = store_song(io.BytesIO(b'do' * 10), '.mp3', str(tmp_path))
+    db.session.commit()
+
+    assert first == second != other
+    assert sorted(os.listdir(tmp_path)) == sorted([first, other])
+    blob = SongBlob.query.filter_by(filename=first).one()
+    assert (blob.ref_count, blob.size_bytes) == (2, 200000)
+
+
+def test_sweep_removes_only_blobs_nobody_references(app, make_user, tmp_path):
+    folder = str(tmp_path)
+    kept = store_song(io.BytesIO(b'kept'), '.mp3', folder)
+    shared = store_song(io.BytesIO(b'shared'), '.mp3', folder)
+    store_song(io.BytesIO(b'shared'), '.mp3', folder)
+    dropped = store_song(io.BytesIO(b'dropped'), '.mp3', folder)
+    user = make_user()
+    user.reminder_song_filename = kept
+    release_song(shared)
+    release_song(dropped)
+    db.session.commit()
+    (tmp_path / 'stray.part').write_bytes(b'')
+    old = time.time() - 3600
+    os.utime(tmp_path / 'stray.part', (old, old))
+
+    # Released too recently for the grace period
+    assert sweep_songs(folder, 600) == 1
+    assert sorted(os.listdir(folder)) == sorted([kept, shared, dropped])
+
+    SongBlob.query.update({SongBlob.released_at: datetime.utcnow() - timedelta(hours=1)})
+    db.session.commit()
+    assert sweep_songs(folder, 600) == 1
+    assert sorted(os.listdir(folder)) == sorted([kept, shared])
+    assert SongBlob.query.filter_by(filename=shared).one().ref_count == 1
+    assert SongBlob.query.filter_by(filename=dropped).first() is None
@@ -0,0 +1,13 @@
+import os
+import pytest
+from config import Config
+from app.startup import measure_startup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize('api_only', [False, True])
+def test_cold_start_within_budget_and_lazy(database, api_only):
+    result = measure_startup(ROOT, api_only=api_only, runs=2)
+    assert result['eager'] == []
+    assert result['ms'] <= Config.STARTUP_BUDGET_MS, result['imports']
@@ -0,0 +1,64 @@
+from sqlalchemy import event
+from app import db
+from app.models import Subject, Topic
+
+
+def add_subjects(user, count):
+    subjects = [Subject(name=f'Subject {i}', user_id=user.id, is_active=True,
+                        topics=[Topic(name=f'Topic {i}', is_active=True), Topic(name='Dropped', is_active=False)])
+                for i in range(count)]
+    db.session.add_all(subjects)
+    db.session.commit()
+    return [s.id for s in subjects]
+
+
+def test_pages_follow_the_next_link_until_exhausted(app, make_user, login):
+    user = make_user()
+    ids = add_subjects(user, 5)
+    db.session.add(Subject(name='Hidden', user_id=user.id, is_active=False))
+    add_subjects(make_user(), 2)
+    client = login(user)
+
+    seen, url = [], '/api/subjects?limit=2&include=topics'
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page) <= 2
+        seen.extend(page)
+        url = response.headers.get('Link', '').partition('>')[0].lstrip('<')
+        if url:
+            assert response.headers['X-Next-Cursor'] == str(page[-1]['id'])
+            assert 'limit=2' in url and 'include=topics' in url
+        else:
+            assert 'X-Next-Cursor' not in response.headers
+    assert [s['id'] for s in seen] == ids
+    assert [[t['name'] for t in s['topics']] for s in seen] == [[f'Topic {i}'] for i in range(5)]
+
+
+def test_fields_select_columns_and_topics_load_in_one_query(app, make_user, login):
+    user = make_user()
+    add_subjects(user, 6)
+    client = login(user)
+
+    page = client.get('/api/subjects?fields=name').get_json()
+    assert [set(s) for s in page] == [{'id', 'name'}] * 6
+    assert all('topics' in s for s in client.get('/api/subjects?fields=name,topics').get_json())
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    counts = []
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        # The first request also loads the user
+        for limit in (6, 1, 6):
+            del statements[:]
+            with app.app_context():
+                assert len(client.get(f'/api/subjects?limit={limit}').get_json()) == limit
+            counts.append(len(statements))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    # One query for the page, one for its topics
+    assert counts[1:] == [2, 2]
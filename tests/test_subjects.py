@@ -0,0 +1,70 @@
+from datetime import date, datetime
+from app import db
+from app.jobs import run_one
+from app.models import (Subject, Topic, StudySession, ArchivedStudySession, ExamMode, DailyStudyRollup,
+                        SyncChange)
+
+
+def test_subject_waiting_to_be_deleted_is_not_found(app, make_user, login):
+    user = make_user()
+    subject = Subject(name='Math', user_id=user.id, topics=[Topic(name='Algebra')])
+    db.session.add(subject)
+    db.session.commit()
+    subject_id, topic_id = subject.id, subject.topics[0].id
+    client = login(user)
+
+    assert client.post(f'/delete_subject/{subject_id}').status_code == 200
+    assert client.get(f'/subject/{subject_id}').status_code == 404
+    assert client.post(f'/subject/{subject_id}/add_topic', data={'name': 'Geometry'}).status_code == 404
+    assert client.post(f'/subject/{subject_id}/edit', data={'name': 'Maths'}).status_code == 404
+    assert client.post(f'/subject/{subject_id}/complete').status_code == 404
+    assert client.post(f'/topic/{topic_id}/edit', data={'name': 'Algebra II'}).status_code == 404
+    assert client.post(f'/delete_topic/{topic_id}').status_code == 404
+    assert client.post(f'/delete_subject/{subject_id}').status_code == 404
+    assert client.post(f'/api/subjects/{subject_id}/topics', json={'name': 'Geometry'}).status_code == 404
+    assert client.delete(f'/api/topics/{topic_id}').status_code == 404
+    assert client.delete(f'/api/subjects/{subject_id}').status_code == 404
+    assert client.post('/api/exams', json={'subject_id': subject_id, 'exam_date': '2030-01-01'}).status_code == 404
+    response = client.post('/api/batch', json={'ops': [{'op': 'rename_subject', 'id': subject_id, 'name': 'Maths'}]})
+    assert response.status_code == 422
+
+
+def test_api_delete_hides_the_subject_and_a_job_removes_its_rows(app, make_user, login):
+    user = make_user()
+    subject = Subject(name='Math', user_id=user.id, topics=[Topic(name='Algebra')])
+    db.session.add(subject)
+    db.session.flush()
+    ended = datetime(2024, 5, 1, 10)
+    db.session.add_all([
+        StudySession(user_id=user.id, subject_id=subject.id, start_time=datetime(2024, 5, 1, 9), end_time=ended,
+                     actual_duration_minutes=60),
+        ArchivedStudySession(id=1000, user_id=user.id, subject_id=subject.id, start_time=datetime(2023, 5, 1, 9),
+                             end_time=datetime(2023, 5, 1, 10)),
+        ExamMode(user_id=user.id, subject_id=subject.id, exam_date=datetime(2030, 1, 1)),
+        DailyStudyRollup(user_id=user.id, subject_id=subject.id, day=date(2024, 5, 1), minutes=60, sessions=1),
+    ])
+    db.session.commit()
+    user_id, subject_id = user.id, subject.id
+
+    client = login(user)
+    assert client.delete(f'/api/subjects/{subject_id}').status_code == 200
+    # Hidden at once, removed by the job
+    assert client.get(f'/subject/{subject_id}').status_code == 404
+    assert Subject.query.filter_by(id=subject_id).count() == 1
+    assert run_one('test') == 'done'
+    db.session.expire_all()
+    for model in (Subject, Topic, StudySession, ArchivedStudySession, ExamMode, DailyStudyRollup):
+        column = model.id if model is Subject else model.subject_id
+        assert model.query.filter(column == subject_id).count() == 0, model.__name__
+    assert SyncChange.query.filter_by(user_id=user_id, kind='subject', object_id=subject_id, deleted=True).count() == 1
+
+
+def test_api_create_subject_rejects_bad_times(app, make_user, login):
+    client = login(make_user())
+    assert client.post('/api/subjects', json={'name': 'Math', 'start_hour': 'nine'}).status_code == 400
+    assert client.post('/api/subjects', json={'name': 'Math', 'end_hour': 24}).status_code == 400
+    assert client.post('/api/subjects', json={'name': 'Math', 'start_hour_12': 9}).status_code == 400
+    response = client.post('/api/subjects', json={'name': 'Math', 'start_hour_12': 9, 'start_ampm': 'PM',
+                                                  'end_hour': 22})
+    assert response.status_code == 201
+    assert (response.get_json()['start_hour'], response.get_json()['end_hour']) == (21, 22)
@@ -0,0 +1,60 @@
+from app.jobs import run_one
+
+
+def sync(app, client, token=None, **params):
+    if token is not None:
+        params['since'] = token
+    with app.app_context():
+        response = client.get('/api/sync', query_string=params)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_delta_carries_changed_rows_and_tombstones(app, make_user, login):
+    client = login(make_user())
+    with app.app_context():
+        math, physics = (client.post('/api/subjects', json={'name': name, 'start_hour': hour, 'end_hour': hour + 1})
+                         .get_json()['id'] for name, hour in (('Math', 9), ('Physics', 10)))
+        topic = client.post(f'/api/subjects/{math}/topics', json={'name': 'Algebra'}).get_json()['id']
+    snapshot = sync(app, client)
+    assert snapshot['full']
+    assert sorted(s['name'] for s in snapshot['subjects']) == ['Math', 'Physics']
+    assert [t['id'] for t in snapshot['topics']] == [topic]
+    token = snapshot['token']
+    assert sync(app, client, token)['subjects'] == []
+
+    with app.app_context():
+        client.post('/api/batch', json={'ops': [{'op': 'rename_subject', 'id': math, 'name': 'Maths'}]})
+        assert client.delete(f'/api/topics/{topic}').status_code == 200
+        assert client.delete(f'/api/subjects/{physics}').status_code == 200
+    assert run_one('test') == 'done'
+    delta = sync(app, client, token)
+    assert not delta['full'] and not delta['has_more']
+    assert [s['name'] for s in delta['subjects']] == ['Maths']
+    assert delta['topics'] == []
+    assert delta['deleted'] == {'subjects': [physics], 'topics': [topic]}
+    assert sync(app, client, delta['token'])['deleted'] == {'subjects': [], 'topics': []}
+    # A token this server never issued falls back to a snapshot
+    assert sync(app, client, int(delta['token']) + 100)['full']
+
+
+def test_deltas_page_by_commit_until_has_more_clears(app, make_user, login):
+    client = login(make_user())
+    token = sync(app, client)['token']
+    with app.app_context():
+        for i in range(5):
+            client.post('/api/subjects', json={'name': f'Subject {i}', 'start_hour': i, 'end_hour': i + 1})
+        # One commit with more changes than a page holds
+        response = client.post('/api/import', json=[{'name': 'Imported', 'start_hour': 12, 'end_hour': 13,
+                                                      'topics': [{'name': 'A'}, {'name': 'B'}]}])
+    assert response.status_code == 201
+
+    pages = []
+    while True:
+        page = sync(app, client, token, limit=2)
+        pages.append(([s['name'] for s in page['subjects']], len(page['topics'])))
+        token = page['token']
+        if not page['has_more']:
+            break
+    assert pages == [(['Subject 0', 'Subject 1'], 0), (['Subject 2', 'Subject 3'], 0), (['Subject 4'], 0),
+                     (['Imported'], 2)]
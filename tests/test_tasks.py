@@ -0,0 +1,27 @@
+import wave
+from app import db
+from app.models import User
+from app.tasks import make_clip
+
+
+def test_make_clip_bumps_the_song_users_data_version(app, make_user, tmp_path, monkeypatch):
+    monkeypatch.setattr('app.songs.song_folder', lambda: str(tmp_path))
+    with wave.open(str(tmp_path / 'song.wav'), 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(b'\0\0' * 8000 * 30)
+    user, other = make_user(), make_user()
+    user.reminder_song_filename, user.reminder_song_seconds = 'song.wav', 5
+    db.session.commit()
+    versions = {u.id: u.data_version for u in (user, other)}
+
+    make_clip('song.wav', 5)
+    db.session.expire_all()
+    assert db.session.get(User, user.id).data_version == versions[user.id] + 1
+    assert db.session.get(User, other.id).data_version == versions[other.id]
+
+    # Already trimmed: nothing served changes
+    make_clip('song.wav', 5)
+    db.session.expire_all()
+    assert db.session.get(User, user.id).data_version == versions[user.id] + 1
@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+import time
+from sqlalchemy import event
+from app import db
+from app.user_cache import user_cache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Another worker process renames the user and commits
+RENAME = """
+import sys
+from app import create_app, db
+from app.models import User
+app = create_app()
+with app.app_context():
+    db.session.get(User, int(sys.argv[1])).first_name = 'Renamed'
+    db.session.commit()
+"""
+
+
+def test_commit_in_another_process_invalidates_the_cached_user(app, make_user):
+    user_id = make_user().id
+    db.session.remove()
+    assert user_cache.load(user_id).first_name == 'Test'
+    db.session.remove()
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        assert user_cache.load(user_id).first_name == 'Test'
+        assert statements == []
+        db.session.remove()
+
+        subprocess.run([sys.executable, '-c', RENAME, str(user_id)], cwd=ROOT, env=os.environ, check=True)
+
+        assert user_cache.load(user_id).first_name == 'Renamed'
+        assert len(statements) == 1
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def test_prune_removes_only_stamps_older_than_the_ttl(app, make_user):
+    old, fresh = make_user(), make_user()
+    user_cache.touch(old.id)
+    user_cache.touch(fresh.id)
+    past = time.time() - user_cache.ttl - 60
+    os.utime(user_cache._stamp_path(old.id), (past, past))
+
+    assert user_cache.prune_stamps() == 1
+    assert user_cache.stamp(old.id) is None
+    assert user_cache.stamp(fresh.id) is not None
+    assert not [name for name in os.listdir(user_cache.stamp_dir) if name.startswith('.')]